@@ -19,9 +19,14 @@ def get_filter(filter: str = "color2gray", implementation: str = "python"):
     Returns:
         filter_function (function):
             The filter function, which should take an image
-            (a 3D numpy array of uint8)
+            (a 3D numpy array of uint8, rgb or rgba)
             and return the filtered image
-            (numpy array of same shape and type as input)
+            (numpy array of same shape and type as input,
+            with the alpha channel kept).
+            The python, memoryview, numpy, numba and parallel filters also take uint16 images.
+            Every filter takes the keyword arguments `out`, an array
+            to write the filtered image into, and `inplace`, to write it
+            into the image itself.
     """
 
     # get the module (instapy.python_filters)
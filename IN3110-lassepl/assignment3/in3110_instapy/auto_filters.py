@@ -0,0 +1,249 @@
+"""automatic choice of the fastest implementation
+
+The first use on a machine runs a short micro-benchmark of every implementation
+(and numba thread count) at a few image sizes, and caches the result on disk.
+The filters then run the fastest calibrated implementation for the size of each image,
+e.g. numpy or the lookup tables for thumbnails, where the numba call overhead
+dominates, and the multi-core filters for large images.
+
+The calibration is cached in ``$INSTAPY_CACHE_DIR`` (default ``~/.cache/in3110_instapy``),
+and redone when the machine or the installed packages change. Run
+``python -m in3110_instapy.auto_filters`` to recalibrate.
+"""
+from __future__ import annotations
+
+import importlib.machinery
+import importlib.util
+import json
+import math
+import os
+import platform
+import time
+from importlib import metadata
+from pathlib import Path
+
+import numpy as np
+
+import in3110_instapy
+
+from . import io
+
+# (width, height) of the calibration images, the choice for other sizes is taken from the closest one
+CALIBRATION_SIZES = [(32, 32), (160, 120), (640, 480), (1280, 1024)]
+
+# Timed calls per implementation and size, the fastest is kept
+CALIBRATION_CALLS = 3
+
+FILTERS = ["color2gray", "color2sepia"]
+
+# Implementations that only filter uint8 images
+UINT8_ONLY = {"lut", "cython"}
+
+# the loaded calibration, {filter: [{"pixels": int, "best": candidate, "times": {candidate: s}}]}
+_calibration = None
+
+
+def cache_file() -> Path:
+    """The calibration file of this machine"""
+    cache_dir = os.environ.get("INSTAPY_CACHE_DIR") or Path.home() / ".cache" / "in3110_instapy"
+    return Path(cache_dir) / "auto-calibration.json"
+
+
+def _machine() -> dict:
+    """Describe the machine and packages, a changed description invalidates the calibration
+
+    Checked on the first 'auto' filter of every process, so it only does cheap lookups:
+    the package versions are read from the installed metadata, without importing numba,
+    and the processor name (a subprocess on Linux) is left out.
+    """
+    return {
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+        # the cores numba starts its threads on, see numba.config.NUMBA_NUM_THREADS
+        "cpus": len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count(),
+        "threads": os.environ.get("NUMBA_NUM_THREADS"),
+        "python": platform.python_version(),
+        "numpy": metadata.version("numpy"),
+        "numba": metadata.version("numba"),
+        "cython": _cython_compiled(),
+    }
+
+
+def _cython_compiled() -> bool:
+    """Whether the cython module is compiled, found without importing it"""
+    spec = importlib.util.find_spec("in3110_instapy.cython_filters")
+    return spec is not None and spec.origin.endswith(tuple(importlib.machinery.EXTENSION_SUFFIXES))
+
+
+def _cython_available() -> bool:
+    try:
+        in3110_instapy.get_filter("color2gray", "cython")
+    except ImportError:  # the cython module is only available when compiled
+        return False
+    return True
+
+
+def candidates() -> list:
+    """The implementations to calibrate, with 'parallel:N' for N numba threads and 'cython:parallel' for OpenMP"""
+    import numba
+
+    max_threads = numba.config.NUMBA_NUM_THREADS
+    thread_counts = sorted({n for n in [1, 2, 4, 8, 16, 32] if n < max_threads} | {max_threads})
+
+    names = ["numpy", "numba", "lut"] + [f"parallel:{n}" for n in thread_counts]
+    if _cython_available():
+        names += ["cython", "cython:parallel"]
+    return names
+
+
+def _resolve(candidate: str) -> tuple:
+    """Return the filter implementation and its options for a candidate name"""
+    implementation, _, option = candidate.partition(":")
+    if implementation == "parallel":
+        return implementation, {"n_threads": int(option)}
+    if implementation == "cython":
+        return implementation, {"parallel": option == "parallel"}
+    return implementation, {}
+
+
+def calibrate(save: bool = True) -> dict:
+    """Time every candidate at every calibration size, and pick the fastest
+
+    Args:
+        save (bool): write the calibration to the cache file
+    Returns:
+        dict: the calibration, with the machine description
+    """
+    results = {}
+    for filter_name in FILTERS:
+        results[filter_name] = []
+        for width, height in CALIBRATION_SIZES:
+            image = io.random_image(width, height)
+            times = {}
+            for candidate in candidates():
+                implementation, options = _resolve(candidate)
+                filter_function = in3110_instapy.get_filter(filter_name, implementation)
+                filter_function(image, **options)  # compile, or load from the numba cache
+
+                best_time = float("inf")
+                for _ in range(CALIBRATION_CALLS):
+                    start_time = time.perf_counter()
+                    filter_function(image, **options)
+                    best_time = min(best_time, time.perf_counter() - start_time)
+                times[candidate] = best_time
+
+            results[filter_name].append({
+                "pixels": width * height,
+                "best": min(times, key=times.get),
+                "times": times,
+            })
+
+    calibration = {"machine": _machine(), "results": results}
+    if save:
+        path = cache_file()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # write and rename, so other processes never read a half-written file
+        tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+        tmp_path.write_text(json.dumps(calibration, indent=2))
+        os.replace(tmp_path, path)
+    return calibration
+
+
+def load_calibration() -> dict:
+    """Return the calibration of this machine, from the cache file or by calibrating once"""
+    global _calibration
+    if _calibration is not None:
+        return _calibration
+
+    path = cache_file()
+    calibration = None
+    if path.exists():
+        try:
+            calibration = json.loads(path.read_text())
+        except ValueError:  # a broken file is recalibrated
+            calibration = None
+    if calibration is None or calibration.get("machine") != _machine():
+        calibration = calibrate()
+
+    _calibration = calibration
+    return _calibration
+
+
+def choose(filter_name: str, shape: tuple, dtype: np.dtype = np.uint8) -> tuple:
+    """Choose the fastest implementation for an image shape and type
+
+    Args:
+        filter_name (str): the filter name
+        shape (tuple): the image shape (H, W, C)
+        dtype (np.dtype): the image dtype, the lookup tables and cython are only for uint8 images
+    Returns:
+        tuple: the implementation name, and the options to call its filter with
+    """
+    pixels = max(1, shape[0] * shape[1])
+    results = load_calibration()["results"][filter_name]
+    # the closest calibrated size, on a log scale
+    closest = min(results, key=lambda result: abs(math.log(result["pixels"]) - math.log(pixels)))
+    if dtype == np.uint8:
+        return _resolve(closest["best"])
+
+    times = {
+        candidate: time for candidate, time in closest["times"].items()
+        if _resolve(candidate)[0] not in UINT8_ONLY
+    }
+    return _resolve(min(times, key=times.get))
+
+
+def auto_color2gray(
+        image: np.array, single_channel: bool = False, out: np.array = None, inplace: bool = False
+) -> np.array:
+    """Convert rgb pixel array to grayscale, with the fastest implementation for its size
+
+    Args:
+        image (np.array): uint8 or uint16 rgb or rgba image, the alpha channel is kept
+        single_channel (bool): return a single (H, W) gray channel, instead of equal rgb-channels (optional)
+        out (np.array): array of the output shape and image dtype to write the result into (optional)
+        inplace (bool): write the result into the image itself (optional)
+    Returns:
+        np.array: gray_image
+    """
+    implementation, options = choose("color2gray", image.shape, image.dtype)
+    filter_function = in3110_instapy.get_filter("color2gray", implementation)
+    return filter_function(image, single_channel=single_channel, out=out, inplace=inplace, **options)
+
+
+def auto_color2sepia(
+        image: np.array, k: float = 1, out: np.array = None, inplace: bool = False, rescale: str | float = "max"
+) -> np.array:
+    """Convert rgb pixel array to sepia, with the fastest implementation for its size
+
+    Args:
+        image (np.array): uint8 or uint16 rgb or rgba image, the alpha channel is kept
+        k (float): amount of sepia, in [0-1] (optional)
+        out (np.array): array of the image shape and dtype to write the result into (optional)
+        inplace (bool): write the result into the image itself (optional)
+        rescale (str | float): how sepia values above the output range are scaled down,
+            'max', 'channels', 'range' or the largest sepia value, see numpy_filters.sepia_max (optional)
+    Returns:
+        np.array: sepia_image
+    """
+    implementation, options = choose("color2sepia", image.shape, image.dtype)
+    filter_function = in3110_instapy.get_filter("color2sepia", implementation)
+    return filter_function(image, k, out=out, inplace=inplace, rescale=rescale, **options)
+
+
+def precompile() -> None:
+    """Load (or run) the calibration, and load the compiled numba filters, see numba_filters.precompile"""
+    from . import numba_filters, parallel_filters
+
+    load_calibration()
+    numba_filters.precompile()
+    parallel_filters.precompile()
+
+
+if __name__ == "__main__":
+    # run as `python -m in3110_instapy.auto_filters` to recalibrate
+    calibration = calibrate()
+    for filter_name, results in calibration["results"].items():
+        for result in results:
+            print(f"{filter_name} {result['pixels']:>9} pixels: {result['best']}")
+    print(f"Saved to {cache_file()}")
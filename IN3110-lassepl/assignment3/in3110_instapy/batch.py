@@ -0,0 +1,215 @@
+"""Batch processing of many image files with a pool of worker processes
+
+The process pool and the image modules are imported when a batch is run,
+so that the command-line can check for batch mode without loading them.
+"""
+from __future__ import annotations
+
+import glob
+import importlib
+import os
+import time
+from functools import partial
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+import in3110_instapy
+
+if TYPE_CHECKING:
+    from .cache import ResultCache
+
+# File suffixes picked up when given a directory
+IMAGE_SUFFIXES = {".jpg", ".jpeg", ".png", ".bmp", ".gif", ".tif", ".tiff", ".webp", ".npy"}
+
+
+def is_batch(source: str) -> bool:
+    """Returns True if the source is a directory or a glob pattern, not a single file
+
+    An existing file is a single file, even with glob characters in its name (e.g. 'photo[1].jpg').
+    """
+    if Path(source).is_file():
+        return False
+    return Path(source).is_dir() or glob.has_magic(str(source))
+
+
+def find_images(source: str) -> list:
+    """Return the sorted image files in a directory, or matching a glob pattern
+
+    Args:
+        source (str): a directory or a glob pattern (e.g. 'photos/*.jpg')
+    Returns:
+        list: the image file paths
+    """
+    if Path(source).is_dir():
+        files = [path for path in Path(source).iterdir() if path.suffix.lower() in IMAGE_SUFFIXES]
+    else:
+        files = [Path(path) for path in glob.glob(str(source))]
+    return sorted(path for path in files if path.is_file())
+
+
+def _glob_root(source: str) -> Path:
+    """The directory of a source: the directory itself, or the path of a glob pattern before its first wildcard"""
+    path = Path(source)
+    if path.is_dir():
+        return path
+    parts = []
+    for part in path.parts:
+        if glob.has_magic(part):
+            break
+        parts.append(part)
+    return Path(*parts) if parts else Path(".")
+
+
+def output_files(source: str, files: list, out_dir: str) -> list:
+    """Return the output file of every image, and create their directories
+
+    The output files have the paths of the images relative to the source directory.
+    A glob pattern over several directories (e.g. 'photos/*/*.jpg') keeps the
+    subdirectories under out_dir, so images with the same filename do not overwrite each other.
+
+    Args:
+        source (str): the directory or glob pattern the files were found with
+        files (list): the image files, from find_images
+        out_dir (str): the output directory
+    Returns:
+        list: the output file paths
+    """
+    root = _glob_root(source)
+    out_dir = Path(out_dir)
+    out_files = []
+    for file in files:
+        try:
+            relative = Path(file).relative_to(root)
+        except ValueError:
+            relative = None
+        if relative is None or ".." in relative.parts:  # e.g. a pattern with '..' after a wildcard
+            raise ValueError(f"'{file}' is not under the directory '{root}' of the source '{source}'")
+        out_files.append(out_dir / relative)
+
+    for directory in {out_file.parent for out_file in out_files}:
+        directory.mkdir(parents=True, exist_ok=True)
+    return out_files
+
+
+# the result cache of a worker process, see _init_worker
+_worker_cache = None
+
+
+def _init_worker(filter: str, implementation: str, cache_options: dict = None) -> None:
+    """Load the filter once per worker process, and compile it before the first image
+
+    Args:
+        filter (str): the filter name
+        implementation (str): the filter implementation
+        cache_options (dict): the directory and max_bytes of the result cache, if any (optional)
+    """
+    global _worker_cache
+    from . import io
+
+    if cache_options is not None:
+        from .cache import ResultCache
+
+        _worker_cache = ResultCache(**cache_options)
+
+    module = importlib.import_module(f"in3110_instapy.{implementation}_filters")
+    if hasattr(module, "precompile"):  # numba filters, loaded from the on-disk cache
+        module.precompile()
+    else:
+        in3110_instapy.get_filter(filter, implementation)(io.random_image(8, 8))
+
+
+def _process_one(file: Path, out_file: Path, **options) -> bool:
+    """Read, filter and write a single image in a worker process, options are passed on to run_filter
+
+    Returns:
+        bool: True if the image was copied from the result cache
+    """
+    from .cli import run_filter
+
+    hits = _worker_cache.hits if _worker_cache is not None else 0
+    run_filter(file=str(file), out_file=str(out_file), cache=_worker_cache, **options)
+    return _worker_cache is not None and _worker_cache.hits > hits
+
+
+def run_batch(
+        source: str,
+        out_dir: str,
+        implementation: str = "numba",
+        filter: str = "color2gray",
+        scale: float = 1,
+        strength: float = 1,
+        single_channel: bool = False,
+        processes: int = None,
+        cache: ResultCache = None,
+) -> float:
+    """Filter all images in a directory or glob pattern, and save them to out_dir
+
+    Every worker process reads, filters and writes its own images, so disk
+    and decoding in one process overlaps with filtering in the others.
+    The interpreter start-up, imports and numba compilation are paid once
+    per worker instead of once per image.
+
+    Args:
+        source (str): directory or glob pattern of images to filter
+        out_dir (str): directory to save the filtered images, with the same paths relative to the source directory
+        implementation (str): the filter implementation
+        filter (str): the filter name
+        scale (float): scale factor to resize the images
+        strength (float): the sepia strength
+        single_channel (bool): make single channel gray images
+        processes (int): number of worker processes, defaults to the number of cores
+        cache (ResultCache): skip the images filtered before with the same parameters,
+            its hits and misses are counted up with those of the workers (optional)
+    Returns:
+        float: images per second
+    """
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+
+    files = find_images(source)
+    if not files:
+        raise FileNotFoundError(f"No images found in '{source}'")
+
+    out_files = output_files(source, files, out_dir)
+
+    if processes is None:
+        processes = os.cpu_count()
+    processes = min(processes, len(files))
+
+    if implementation == "auto":
+        # calibrate (or load the calibration) once here, instead of in every worker
+        from .auto_filters import load_calibration
+
+        load_calibration()
+
+    # every worker opens the same cache directory, with its own hit and miss counts
+    cache_options = None if cache is None else {"directory": cache.directory, "max_bytes": cache.max_bytes}
+
+    start_time = time.perf_counter()
+    with ProcessPoolExecutor(
+            max_workers=processes,
+            # fresh interpreters: forking after the numba/OpenMP thread pools have started can deadlock the workers
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(filter, implementation, cache_options),
+    ) as executor:
+        process_one = partial(
+                _process_one,
+                implementation=implementation,
+                filter=filter,
+                scale=scale,
+                strength=strength,
+                single_channel=single_channel,
+        )
+        # consume the results to raise any exception from the workers
+        hits = sum(executor.map(process_one, files, out_files, chunksize=max(1, len(files) // (4 * processes))))
+    total_time = time.perf_counter() - start_time
+
+    images_per_second = len(files) / total_time
+    print(f"Filtered {len(files)} images in {total_time:.2f}s with {processes} processes "
+          f"({images_per_second:.1f} images/s)")
+    if cache is not None:
+        cache.hits += hits
+        cache.misses += len(files) - hits
+        print(f"Result cache: {hits} hits, {len(files) - hits} misses")
+    return images_per_second
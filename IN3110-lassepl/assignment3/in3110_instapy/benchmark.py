@@ -0,0 +1,277 @@
+"""Benchmark suite for all filters and implementations
+
+Times every filter and implementation over a matrix of image sizes, and
+writes the median and p95 times, the throughput and the peak memory to JSON.
+Two JSON files can be compared to flag regressions.
+
+Run as:
+
+    python -m in3110_instapy.benchmark run -o benchmark.json
+    python -m in3110_instapy.benchmark compare old.json new.json
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import platform
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+from . import get_filter, io
+
+# (width, height) of the benchmarked images, from thumbnail to 100 megapixels
+SIZES = {
+    "thumbnail": (160, 120),
+    "vga": (640, 480),
+    "hd": (1920, 1080),
+    "12mp": (4000, 3000),
+    "100mp": (12000, 8400),
+}
+
+FILTERS = ["color2gray", "color2sepia", "blur"]
+
+IMPLEMENTATIONS = ["python", "memoryview", "numpy", "numba", "parallel", "cython", "lut"]
+
+# the pure python filters take seconds per megapixel (memoryview a tenth of that), so larger sizes are skipped
+MAX_PIXELS = {"python": 640 * 480, "memoryview": 1920 * 1080}
+
+
+def time_filter(filter_function, image: np.array, warmup: int = 1, repeats: int = 5) -> dict:
+    """Time a filter on an image
+
+    Every call is timed on its own, for the median and p95.
+    The peak memory is measured in one extra call, as tracing slows the calls down.
+
+    Args:
+        filter_function (callable): the filter function to time
+        image (np.array): the image to filter
+        warmup (int): untimed calls first, for jit compiling and caches
+        repeats (int): the number of timed calls
+    Returns:
+        dict: the times (s), the median and p95 time (s), the throughput (megapixels/s)
+            and the peak memory (MB)
+    """
+    for _ in range(warmup):
+        filter_function(image)
+
+    times = []
+    for _ in range(repeats):
+        start_time = time.perf_counter()
+        filter_function(image)
+        times.append(time.perf_counter() - start_time)
+
+    # peak of the memory allocated during the call, on top of the image itself
+    tracemalloc.start()
+    filter_function(image)
+    _, peak_memory = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    median = float(np.median(times))
+    megapixels = image.shape[0] * image.shape[1] / 1e6
+    return {
+        "times": times,
+        "median": median,
+        "p95": float(np.percentile(times, 95)),
+        "megapixels_per_s": megapixels / median if median > 0 else float("inf"),
+        "peak_memory_mb": peak_memory / 1e6,
+    }
+
+
+def benchmark_image(
+        image: np.array,
+        size: str = "",
+        filters: list = None,
+        implementations: list = None,
+        warmup: int = 1,
+        repeats: int = 5,
+        max_pixels: dict = None,
+) -> list:
+    """Benchmark all filters and implementations on one image
+
+    Args:
+        image (np.array): the image to filter
+        size (str): the name of the image size, stored in the results
+        filters (list): the filter names, defaults to FILTERS
+        implementations (list): the implementations, defaults to IMPLEMENTATIONS
+        warmup (int): untimed calls before timing
+        repeats (int): the number of timed calls
+        max_pixels (dict): the largest image size for each implementation, defaults to MAX_PIXELS
+    Returns:
+        list: one result dict per filter and implementation, with a 'skipped' reason
+            instead of the timings for implementations that were not run
+    """
+    if max_pixels is None:
+        max_pixels = MAX_PIXELS
+
+    height, width = image.shape[:2]
+    results = []
+    for filter_name in filters or FILTERS:
+        for implementation in implementations or IMPLEMENTATIONS:
+            result = {
+                "filter": filter_name,
+                "implementation": implementation,
+                "size": size,
+                "width": width,
+                "height": height,
+                "megapixels": width * height / 1e6,
+            }
+            results.append(result)
+
+            if width * height > max_pixels.get(implementation, float("inf")):
+                result["skipped"] = "too slow for this size"
+                continue
+            try:
+                filter_function = get_filter(filter_name, implementation)
+            except ImportError:  # the cython module is only available when compiled
+                result["skipped"] = "not available (not compiled)"
+                continue
+            except AttributeError:  # e.g. blur is not in every implementation
+                result["skipped"] = "not implemented"
+                continue
+
+            result.update(time_filter(filter_function, image, warmup=warmup, repeats=repeats))
+    return results
+
+
+def run_benchmarks(
+        sizes: list = None,
+        filters: list = None,
+        implementations: list = None,
+        warmup: int = 1,
+        repeats: int = 5,
+) -> dict:
+    """Benchmark all filters and implementations over a matrix of image sizes
+
+    Args:
+        sizes (list): the size names from SIZES, defaults to all
+        filters (list): the filter names, defaults to FILTERS
+        implementations (list): the implementations, defaults to IMPLEMENTATIONS
+        warmup (int): untimed calls before timing
+        repeats (int): the number of timed calls
+    Returns:
+        dict: the machine, the settings and the list of results, ready for JSON
+    """
+    import numba
+
+    results = []
+    for size in sizes or SIZES:
+        width, height = SIZES[size]
+        image = io.random_image(width, height)
+        results.extend(benchmark_image(image, size, filters, implementations, warmup, repeats))
+
+    return {
+        "machine": {
+            "platform": platform.platform(),
+            "processor": platform.processor(),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "numba": numba.__version__,
+            "threads": numba.config.NUMBA_NUM_THREADS,
+        },
+        "settings": {"warmup": warmup, "repeats": repeats},
+        "results": results,
+    }
+
+
+def compare(baseline: dict, current: dict, threshold: float = 0.1) -> list:
+    """Find the regressions between two benchmark runs
+
+    Args:
+        baseline (dict): the results of the earlier run
+        current (dict): the results of the new run
+        threshold (float): the relative slowdown of the median time to flag, 0.1 is 10% slower
+    Returns:
+        list: a dict for each regression, with the filter, implementation, size,
+            both median times and the relative change
+    """
+
+    def key(result):
+        return result["filter"], result["implementation"], result["size"]
+
+    baseline_medians = {key(r): r["median"] for r in baseline["results"] if "median" in r}
+
+    regressions = []
+    for result in current["results"]:
+        if "median" not in result or key(result) not in baseline_medians:
+            continue
+        baseline_median = baseline_medians[key(result)]
+        change = result["median"] / baseline_median - 1
+        if change > threshold:
+            filter_name, implementation, size = key(result)
+            regressions.append({
+                "filter": filter_name,
+                "implementation": implementation,
+                "size": size,
+                "baseline": baseline_median,
+                "current": result["median"],
+                "change": change,
+            })
+    return regressions
+
+
+def format_results(results: list) -> str:
+    """Format benchmark results as a table"""
+    lines = [f"{'filter':12} {'implementation':15} {'size':10} {'median':>10} {'p95':>10} {'MP/s':>9} {'peak MB':>9}"]
+    for r in results:
+        row = f"{r['filter']:12} {r['implementation']:15} {r['size']:10}"
+        if "skipped" in r:
+            lines.append(f"{row} {r['skipped']}")
+        else:
+            lines.append(
+                f"{row} {r['median']:10.4f} {r['p95']:10.4f} {r['megapixels_per_s']:9.1f} {r['peak_memory_mb']:9.1f}"
+            )
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    """Parse the command-line and run or compare benchmarks"""
+    parser = argparse.ArgumentParser(description="Benchmark the image filters.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run", help="Run the benchmarks and write the results to JSON")
+    run_parser.add_argument("-o", "--out", default="benchmark.json", help="The JSON output file")
+    run_parser.add_argument("--sizes", nargs="+", choices=list(SIZES), help="Image sizes, defaults to all")
+    run_parser.add_argument("--filters", nargs="+", choices=FILTERS, help="Filters, defaults to all")
+    run_parser.add_argument(
+        "--implementations", nargs="+", choices=IMPLEMENTATIONS, help="Implementations, defaults to all"
+    )
+    run_parser.add_argument("--warmup", type=int, default=1, help="Untimed calls before timing")
+    run_parser.add_argument("--repeats", type=int, default=5, help="Timed calls per benchmark")
+
+    compare_parser = subparsers.add_parser("compare", help="Compare two JSON results and flag regressions")
+    compare_parser.add_argument("baseline", help="The JSON results of the earlier run")
+    compare_parser.add_argument("current", help="The JSON results of the new run")
+    compare_parser.add_argument(
+        "-t", "--threshold", type=float, default=0.1, help="Relative slowdown to flag, defaults to 0.1 (10%%)"
+    )
+
+    args = parser.parse_args(argv)
+
+    if args.command == "run":
+        report = run_benchmarks(args.sizes, args.filters, args.implementations, args.warmup, args.repeats)
+        with open(args.out, "w") as outfile:
+            json.dump(report, outfile, indent=2)
+        print(format_results(report["results"]))
+        return
+
+    with open(args.baseline) as infile:
+        baseline = json.load(infile)
+    with open(args.current) as infile:
+        current = json.load(infile)
+
+    regressions = compare(baseline, current, args.threshold)
+    for r in regressions:
+        print(
+            f"REGRESSION: {r['implementation']} {r['filter']} {r['size']}: "
+            f"{r['baseline']:.4f}s -> {r['current']:.4f}s ({r['change']:+.0%})"
+        )
+    if regressions:
+        sys.exit(1)
+    print("No regressions")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,219 @@
+"""On-disk cache of filtered images, keyed by the content of the input file
+
+The key is the hash of the input file together with the filter parameters, so
+renamed or copied files hit the same entry, and a changed file misses. An
+entry is the filtered image saved in the output format, so a hit is a file
+copy, without decoding, filtering or encoding the image.
+
+The cache is kept in ``$INSTAPY_CACHE_DIR/results`` (default
+``~/.cache/in3110_instapy/results``). When it grows above its size limit,
+the least recently used entries are removed. Entries are written and renamed,
+and used entries are marked by their modification time, so worker processes
+can share a cache without a lock or an index file. An entry may be removed by
+another process at any time, which is a miss.
+
+The directory is only scanned when the running total of the entries may be
+above the size limit. The total counts the entries added by this process since
+the last scan, so the cache can grow above the limit by what other processes
+added in the meantime, until the next scan.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import shutil
+from pathlib import Path
+from typing import Callable
+
+import numpy as np
+
+from . import io
+
+# Bump when the filtered images change, so old entries are no longer hit
+CACHE_VERSION = 1
+
+# Default size limit of the cache, in bytes
+DEFAULT_MAX_BYTES = 1 << 30
+
+# Bytes read at a time when hashing an input file
+HASH_CHUNK_BYTES = 1 << 20
+
+
+def cache_dir() -> Path:
+    """The default cache directory"""
+    cache_dir = os.environ.get("INSTAPY_CACHE_DIR") or Path.home() / ".cache" / "in3110_instapy"
+    return Path(cache_dir) / "results"
+
+
+def file_digest(filename: str) -> str:
+    """Return the sha256 hex digest of the content of a file, read in chunks"""
+    digest = hashlib.sha256()
+    with open(filename, "rb") as file:
+        while chunk := file.read(HASH_CHUNK_BYTES):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """A size-limited, least recently used cache of filtered image files
+
+    Example:
+        >>> cache = ResultCache(max_bytes=100 << 20)
+        >>> key = cache.key("test.jpg", filter="color2sepia", implementation="numba", strength=0.7)
+        >>> cache.get(key, ".jpg") or cache.put(key, ".jpg", filtered)
+    """
+
+    def __init__(self, directory: str = None, max_bytes: int = DEFAULT_MAX_BYTES):
+        """
+        Args:
+            directory (str): the cache directory, defaults to cache_dir()
+            max_bytes (int): the total size of the entries to keep
+        """
+        if max_bytes < 0:
+            raise ValueError(f"max_bytes must be non-negative, got {max_bytes=}")
+        self.directory = Path(directory) if directory is not None else cache_dir()
+        self.max_bytes = max_bytes
+        # lookups by this cache object
+        self.hits = 0
+        self.misses = 0
+        # the bytes of the entries at the last scan, and those added since, None before the first scan
+        self._total_bytes = None
+
+    def key(self, file: str, **parameters) -> str:
+        """Return the key of a filtered image, from the content of the input file and the filter parameters
+
+        Args:
+            file (str): the input image file
+            parameters: the filter parameters, e.g. filter, implementation, scale and strength
+        Returns:
+            str: the hex digest key
+        """
+        description = json.dumps({"version": CACHE_VERSION, **parameters}, sort_keys=True)
+        return hashlib.sha256(f"{file_digest(file)}{description}".encode()).hexdigest()
+
+    def path(self, key: str, suffix: str) -> Path:
+        """The entry file of a key, in the format of the suffix"""
+        return self.directory / f"{key}{suffix.lower()}"
+
+    def _lookup(self, key: str, suffix: str, use: Callable):
+        """Mark an entry as recently used, and return use(entry file), or None on a miss"""
+        path = self.path(key, suffix)
+        try:
+            os.utime(path)  # the modification time orders the entries for eviction
+            result = use(path)
+        except FileNotFoundError:  # never added, or evicted by another process in the meantime
+            self.misses += 1
+            return None
+        self.hits += 1
+        return result
+
+    def get(self, key: str, suffix: str) -> Path | None:
+        """Look up an entry, and mark it as recently used
+
+        The entry can still be evicted by another process before it is used,
+        see fetch and load to use it in the same step.
+
+        Args:
+            key (str): the key from ResultCache.key
+            suffix (str): the file suffix of the output format
+        Returns:
+            Path: the entry file, or None on a miss
+        """
+        return self._lookup(key, suffix, lambda path: path)
+
+    def fetch(self, key: str, suffix: str, out_file: str) -> Path | None:
+        """Copy an entry to an output file, and mark it as recently used
+
+        Returns:
+            Path: the output file, or None on a miss
+        """
+        return self._lookup(key, suffix, lambda path: Path(shutil.copyfile(path, out_file)))
+
+    def load(self, key: str, suffix: str) -> np.array | None:
+        """Read the image of an entry, and mark it as recently used
+
+        Returns:
+            np.array: the filtered image, or None on a miss
+        """
+        return self._lookup(key, suffix, io.read_image)
+
+    def put(self, key: str, suffix: str, image: np.array, file: str = None) -> Path:
+        """Add an entry, and evict the least recently used entries above the size limit
+
+        Args:
+            key (str): the key from ResultCache.key
+            suffix (str): the file suffix of the output format
+            image (np.array): the filtered image, saved in the format of the suffix
+            file (str): the filtered image already saved in that format, copied instead of encoding again (optional)
+        Returns:
+            Path: the entry file
+        """
+        path = self.path(key, suffix)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # write and rename, so other processes never read a half-written entry
+        tmp_path = path.with_name(f"{key}.{os.getpid()}.tmp{path.suffix}")
+        if file is not None:
+            shutil.copyfile(file, tmp_path)
+        else:
+            io.write_image(image, tmp_path)
+        size = tmp_path.stat().st_size
+        os.replace(tmp_path, path)
+
+        # a replaced entry is counted twice, until the next scan
+        if self._total_bytes is not None:
+            self._total_bytes += size
+        if self._total_bytes is None or self._total_bytes > self.max_bytes:
+            self.evict()
+        return path
+
+    def _entries(self) -> list:
+        """The entry files and their stat results, least recently used first"""
+        entries = []
+        for path in self.directory.glob("*"):
+            if ".tmp" in path.name:  # being written
+                continue
+            try:
+                entries.append((path, path.stat()))
+            except FileNotFoundError:  # evicted by another process
+                continue
+        return sorted(entries, key=lambda entry: entry[1].st_mtime_ns)
+
+    def evict(self) -> int:
+        """Remove the least recently used entries, until the cache fits in max_bytes
+
+        Returns:
+            int: the number of removed entries
+        """
+        entries = self._entries()
+        total = sum(stat.st_size for _, stat in entries)
+        removed = 0
+        for path, stat in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                path.unlink()
+            except FileNotFoundError:  # evicted by another process
+                pass
+            total -= stat.st_size
+            removed += 1
+        self._total_bytes = total
+        return removed
+
+    def clear(self) -> None:
+        """Remove every entry"""
+        for path, _ in self._entries():
+            path.unlink(missing_ok=True)
+        self._total_bytes = 0
+
+    def stats(self) -> dict:
+        """Return the hits and misses of this cache object, and the entries and bytes on disk"""
+        entries = self._entries()
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": len(entries),
+            "bytes": sum(stat.st_size for _, stat in entries),
+        }
@@ -1,13 +1,20 @@
-"""Command-line (script) interface to instapy"""
+"""Command-line (script) interface to instapy
+
+numpy, PIL and the filter modules are only imported once the arguments are
+parsed and valid, so `--help` and argument errors return without loading them.
+"""
 from __future__ import annotations
 
 import argparse
 import sys
 import time
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+from . import batch
 
-import in3110_instapy
-import numpy as np
-from PIL import Image
+if TYPE_CHECKING:
+    from .cache import ResultCache
 
 
 def check_positive_number(num: int | float | str):
@@ -26,36 +33,118 @@ def run_filter(
         filter: str = "color2gray",
         scale: int = 1,
         strength: int = 1,
-        n_runs: int = 1
+        n_runs: int = 1,
+        single_channel: bool = False,
+        cache: ResultCache = None
 ) -> None:
-    """Run the selected filter"""
+    """Run the selected filter
+
+    With a cache, an image filtered before with the same parameters is copied
+    from the cache, without decoding or filtering it.
+    """
+    from PIL import Image
+
+    from .pipeline import Pipeline
 
     if n_runs < 1:  # number of runs must be greater than zero
         raise ValueError(f"Number of runs must be greater than zero, got: '{n_runs=}'.")
 
+    if cache is not None:
+        # the strength does not change gray images
+        key = cache.key(file, filter=filter, implementation=implementation, scale=scale,
+                        strength=strength if filter == "color2sepia" else None, single_channel=single_channel)
+        # displayed images are cached without encoding
+        suffix = Path(out_file).suffix if out_file else ".npy"
+        # a hit is used in the same step as the lookup, since other processes may evict it
+        if out_file:
+            if cache.fetch(key, suffix, out_file) is not None:
+                return
+        else:
+            cached = cache.load(key, suffix)
+            if cached is not None:
+                Image.fromarray(cached).show()
+                return
+
+    pipeline = Pipeline(filter, implementation, scale, strength, single_channel)
+
     for i in range(n_runs):
-        # load the image from a file
-        image = Image.open(file)
+        # load and resize the image, and apply the filter
+        filtered = pipeline.apply(pipeline.read(file))
 
-        # Resize image, if needed
-        if scale != 1:
-            w, h = image.size
-            new_size = int(scale * w), int(scale * h)
-            image = image.resize(new_size)
+    if out_file:
+        pipeline.write(filtered, out_file)
 
-        image = np.asarray(image)
+    if cache is not None:
+        cache.put(key, suffix, filtered, out_file)
 
-        # Apply the filter
-        if filter == "color2sepia" and implementation == "numpy":
-            filtered = in3110_instapy.get_filter(filter, implementation)(image, strength)
-        else:
-            filtered = in3110_instapy.get_filter(filter, implementation)(image)
+    if not out_file:  # not asked to save, display it instead
+        Image.fromarray(filtered).show()
+
+
+def time_stages(
+        file: str,
+        out_file: str = None,
+        implementation: str = "python",
+        filter: str = "color2gray",
+        scale: int = 1,
+        strength: int = 1,
+        n_runs: int = 3,
+        warmup: bool = False,
+        single_channel: bool = False
+) -> dict:
+    """Time the decode, resize, filter and encode stages of the selected filter
+
+    The file is decoded once, and the resize, filter and encode stages are
+    repeated n_runs times on the decoded image. The image is encoded in memory,
+    in the format of out_file (or PNG), and saved once at the end.
+
+    Args:
+        file (str): the image file to filter
+        out_file (str): the file to save the result to, if given (optional)
+        implementation (str): the filter implementation
+        filter (str): the filter name
+        scale (float): scale factor to resize the image
+        strength (float): the sepia strength
+        n_runs (int): the number of timed runs
+        warmup (bool): call the filter once before timing, to leave out numba jit compiling
+        single_channel (bool): make single channel ('L' mode) gray images
+    Returns:
+        dict: the decode time, and the mean resize, filter and encode times (in seconds)
+    """
+    from PIL import Image
+
+    from .pipeline import Pipeline
+
+    if n_runs < 1:  # number of runs must be greater than zero
+        raise ValueError(f"Number of runs must be greater than zero, got: '{n_runs=}'.")
+
+    pipeline = Pipeline(filter, implementation, scale, strength, single_channel)
+    format = Image.registered_extensions().get(Path(out_file).suffix.lower(), "PNG") if out_file else "PNG"
+
+    start_time = time.perf_counter()
+    decoded, new_size = pipeline.decode(file)
+    times = {"decode": time.perf_counter() - start_time, "resize": 0, "filter": 0, "encode": 0}
+
+    if warmup:
+        pipeline.apply(pipeline.resize(decoded, new_size))
+
+    for i in range(n_runs):
+        start_time = time.perf_counter()
+        image = pipeline.resize(decoded, new_size)
+        resized_time = time.perf_counter()
+        filtered = pipeline.apply(image)
+        filtered_time = time.perf_counter()
+        pipeline.encode(filtered, format)
+        encoded_time = time.perf_counter()
+
+        times["resize"] += (resized_time - start_time) / n_runs
+        times["filter"] += (filtered_time - resized_time) / n_runs
+        times["encode"] += (encoded_time - filtered_time) / n_runs
 
     if out_file:
-        Image.fromarray(filtered).save(out_file)
+        pipeline.write(filtered, out_file)
 
-    else:  # not asked to save, display it instead
-        Image.fromarray(filtered).show()
+    return times
 
 
 def main(argv=None):
@@ -70,12 +159,13 @@ def main(argv=None):
     # Positional argument: filename
     parser.add_argument(
             "file",
-            help="The filename to apply filter to")
+            help="The filename to apply filter to, or a directory or glob pattern of files for batch mode")
 
     # Optional output filename arguments:
     parser.add_argument(
             "-o", "--out",
-            help="The output filename, if missing only displays filtered image without saving")
+            help="The output filename, if missing only displays filtered image without saving. "
+                 "The output directory in batch mode")
 
     # Require either -g or -se filter options:
     filter_group = parser.add_mutually_exclusive_group(required=True)
@@ -96,21 +186,60 @@ def main(argv=None):
             type=check_positive_number)
     parser.add_argument(
             "-i", "--implementation",
-            help="Select filter implementation, defaults to 'numba'",
-            choices=["python", "numpy", "numba"],
-            default="numba")
+            help="Select filter implementation, defaults to 'auto', the fastest for the image size on this machine",
+            choices=["auto", "python", "memoryview", "numpy", "numba", "parallel", "cython", "lut"],
+            default="auto")
     parser.add_argument(
             "-st", "--strength",
-            help="Filter strength, only valid for numpy.color2sepia implementation",
+            help="Sepia filter strength in [0, 1]",
             default=1,
             type=check_positive_number
     )
-    n_runs = 3
+    parser.add_argument(
+            "-l", "--single-channel",
+            help="Make single channel ('L' mode) gray images, only valid with --gray",
+            action="store_true"
+    )
+    parser.add_argument(
+            "-p", "--processes",
+            help="Number of worker processes in batch mode, defaults to the number of cores",
+            type=int)
+    parser.add_argument(
+            "-f", "--in-flight",
+            help="Filter a batch in this process instead, reading and writing up to this many images ahead "
+                 "on threads, for slow storage",
+            type=int)
     parser.add_argument(
             "-r", "--runtime",
-            help=f"Track average runtime over {n_runs} runs of chosen task",
+            help="Print the decode time, and the average resize, filter and encode times, instead of displaying",
             action="store_true"
     )
+    parser.add_argument(
+            "-n", "--runs",
+            help="Number of timed runs with -r/--runtime, defaults to 3",
+            default=3,
+            type=int
+    )
+    parser.add_argument(
+            "-w", "--warmup",
+            help="Call the filter once before timing with -r/--runtime, to leave out numba jit compiling",
+            action="store_true"
+    )
+    parser.add_argument(
+            "-t", "--tile-rows",
+            help="Filter the image in bands of this many rows into a memory-mapped .npy, .raw or .tif output, "
+                 "for images larger than memory",
+            type=int)
+    parser.add_argument(
+            "-c", "--cache",
+            help="Copy images filtered before with the same options from the result cache in $INSTAPY_CACHE_DIR, "
+                 "and add the others to it",
+            action="store_true")
+    parser.add_argument(
+            "--cache-size",
+            help="Size limit of the result cache in MB, the least recently used images are removed, defaults to 1024",
+            default=1024,
+            type=check_positive_number)
 
     # parse arguments and call run_filter()
     args = parser.parse_args(argv)
@@ -120,20 +249,92 @@ def main(argv=None):
     else:
         filter_ = "color2sepia"
 
-    if args.runtime:  # --runtime flag: do 3 runs and print average runtime to stdout
-        start_time = time.time()
-        run_filter(
+    if args.single_channel and not args.gray:
+        parser.error("-l/--single-channel is only valid with -g/--gray")
+    if args.in_flight is not None and not batch.is_batch(args.file):
+        parser.error("-f/--in-flight is only valid in batch mode")
+
+    cache = None
+    if args.cache:
+        if args.tile_rows is not None or args.runtime:
+            parser.error("-c/--cache is not supported with -t/--tile-rows or -r/--runtime")
+        from .cache import ResultCache
+
+        cache = ResultCache(max_bytes=int(args.cache_size * (1 << 20)))
+
+    if args.tile_rows is not None:  # bands of rows, without decoding the whole image
+        if not args.out:
+            parser.error("-t/--tile-rows requires an output file (-o/--out)")
+        if args.tile_rows < 1:
+            parser.error(f"-t/--tile-rows must be greater than zero, got {args.tile_rows}")
+        if batch.is_batch(args.file) or args.runtime or args.scale != 1:
+            parser.error("-t/--tile-rows is not supported with batch mode, -r/--runtime or -sc/--scale")
+        from .tiles import run_tiled
+
+        run_tiled(
+                source=args.file,
+                out=args.out,
+                implementation=args.implementation,
+                filter=filter_,
+                strength=args.strength,
+                single_channel=args.single_channel,
+                tile_rows=args.tile_rows
+        )
+
+    elif batch.is_batch(args.file):  # directory or glob pattern: filter all files with a worker pool
+        if not args.out:
+            parser.error("batch mode requires an output directory (-o/--out)")
+        if args.runtime:
+            parser.error("-r/--runtime is not supported in batch mode, the images/s are always reported")
+        if args.in_flight is not None:
+            if args.in_flight < 1:
+                parser.error(f"-f/--in-flight must be greater than zero, got {args.in_flight}")
+            if args.processes is not None or cache is not None:
+                parser.error("-f/--in-flight is not supported with -p/--processes or -c/--cache")
+            from .prefetch import run_prefetch
+
+            run_prefetch(
+                    source=args.file,
+                    out_dir=args.out,
+                    filter=filter_,
+                    scale=args.scale,
+                    implementation=args.implementation,
+                    strength=args.strength,
+                    single_channel=args.single_channel,
+                    in_flight=args.in_flight
+            )
+        else:
+            batch.run_batch(
+                    source=args.file,
+                    out_dir=args.out,
+                    filter=filter_,
+                    scale=args.scale,
+                    implementation=args.implementation,
+                    strength=args.strength,
+                    single_channel=args.single_channel,
+                    processes=args.processes,
+                    cache=cache
+            )
+
+    elif args.runtime:  # --runtime flag: time each stage and print the times to stdout
+        if args.runs < 1:
+            parser.error(f"-n/--runs must be greater than zero, got {args.runs}")
+        times = time_stages(
                 file=args.file,
                 out_file=args.out,
                 filter=filter_,
                 scale=args.scale,
                 implementation=args.implementation,
                 strength=args.strength,
-                n_runs=n_runs
+                single_channel=args.single_channel,
+                n_runs=args.runs,
+                warmup=args.warmup
         )
-        end_time = time.time()
-        mean_time = (end_time - start_time) / n_runs
-        print(f"Average time over {n_runs} runs: {mean_time:.3f}s")
+        warmup = "excluded" if args.warmup else "included"
+        print(f"Timing over {args.runs} runs (jit warm-up {warmup}):")
+        print(f"  decode: {times['decode']:.4f}s (once)")
+        for stage in ["resize", "filter", "encode"]:
+            print(f"  {stage}: {times[stage]:.4f}s")
 
     else:
         run_filter(
@@ -143,5 +344,9 @@ def main(argv=None):
                 scale=args.scale,
                 implementation=args.implementation,
                 strength=args.strength,
-                n_runs=1
+                single_channel=args.single_channel,
+                n_runs=1,
+                cache=cache
         )
+        if cache is not None:
+            print(f"Result cache: {'hit' if cache.hits else 'miss'}")
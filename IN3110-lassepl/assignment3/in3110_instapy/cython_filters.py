@@ -1,37 +1,203 @@
 """Cython implementation of filter functions"""
 from __future__ import annotations
 
-# import cython as C
+import cython as C
 import numpy as np
-# from cython.cimports.libc.stdint import uint8_t
+from cython.cimports.libc.stdint import uint8_t
+from cython.parallel import prange
 
-# if not C.compiled:
-#     raise ImportError(
-#         "Cython module not compiled! Check setup.py and make sure this package has been installed, not just imported in-place."
-#     )
-#
-# # we may need a 'const uint8_t' type to make sure we accept 'read-only' arrays
-# const_uint8_t = C.typedef("const uint8_t")
-# float64_t = C.typedef(C.double)
+from .numpy_filters import output_array, sepia_max
 
+if not C.compiled:
+    raise ImportError(
+        "Cython module not compiled! Check setup.py and make sure this package has been installed, "
+        "not just imported in-place."
+    )
 
-def cython_color2gray(image):
+# we may need a 'const uint8_t' type to make sure we accept 'read-only' arrays
+const_uint8_t = C.typedef("const uint8_t")
+float64_t = C.typedef(C.double)
+
+
+@C.cfunc
+@C.nogil
+@C.exceptval(check=False)
+@C.boundscheck(False)
+@C.wraparound(False)
+def _color2gray_row(image: const_uint8_t[:, :, :], gray_image: uint8_t[:, :, :], h: C.Py_ssize_t) -> C.void:
+    """Write the grayscale of image row h into gray_image, and copy an alpha channel"""
+    w: C.Py_ssize_t
+    c: C.Py_ssize_t
+    gray: float64_t
+
+    for w in range(image.shape[1]):  # width-values
+        # Weighted sum with weights (r,g,b) = (0.21, 0.72, 0.07)
+        gray = 0.21 * image[h, w, 0] + 0.72 * image[h, w, 1] + 0.07 * image[h, w, 2]
+        for c in range(gray_image.shape[2]):
+            if c < 3:
+                gray_image[h, w, c] = C.cast(uint8_t, gray)
+            else:  # the alpha channel is kept
+                gray_image[h, w, c] = image[h, w, c]
+
+
+@C.cfunc
+@C.nogil
+@C.exceptval(check=False)
+@C.boundscheck(False)
+@C.wraparound(False)
+def _sepia_row_max(image: const_uint8_t[:, :, :], sepia_matrix: float64_t[:, :], h: C.Py_ssize_t) -> float64_t:
+    """Return the largest sepia value of image row h"""
+    w: C.Py_ssize_t
+    c: C.Py_ssize_t
+    value: float64_t
+    current_max: float64_t = 0
+
+    for w in range(image.shape[1]):  # width-values
+        for c in range(3):  # rbg-channels
+            value = (image[h, w, 0] * sepia_matrix[c, 0]
+                     + image[h, w, 1] * sepia_matrix[c, 1]
+                     + image[h, w, 2] * sepia_matrix[c, 2])
+            if value > current_max:
+                current_max = value
+    return current_max
+
+
+@C.cfunc
+@C.nogil
+@C.exceptval(check=False)
+@C.boundscheck(False)
+@C.wraparound(False)
+def _color2sepia_row(
+        image: const_uint8_t[:, :, :],
+        sepia_image: uint8_t[:, :, :],
+        sepia_matrix: float64_t[:, :],
+        scale: float64_t,
+        k: float64_t,
+        h: C.Py_ssize_t,
+) -> C.void:
+    """Write the scaled sepia of image row h, blended with strength k, into sepia_image, and copy an alpha channel"""
+    w: C.Py_ssize_t
+    c: C.Py_ssize_t
+    value: float64_t
+    rgb: float64_t[3]
+
+    for w in range(image.shape[1]):  # width-values
+        # read the whole pixel before writing, so sepia_image can be the image itself
+        for c in range(3):
+            rgb[c] = image[h, w, c]
+        for c in range(3):  # rbg-channels
+            value = (rgb[0] * sepia_matrix[c, 0]
+                     + rgb[1] * sepia_matrix[c, 1]
+                     + rgb[2] * sepia_matrix[c, 2]) * scale
+            sepia_image[h, w, c] = C.cast(uint8_t, k * value + (1 - k) * rgb[c])
+        for c in range(3, sepia_image.shape[2]):  # the alpha channel is kept
+            sepia_image[h, w, c] = image[h, w, c]
+
+
+def cython_color2gray(
+        image,
+        parallel: C.bint = False,
+        single_channel: C.bint = False,
+        out=None,
+        inplace: C.bint = False,
+):
     """Convert rgb pixel array to grayscale
 
+    The loops run without the GIL, and with `parallel` the rows are
+    spread over all cores with OpenMP.
+
     Args:
-        image (np.array)
+        image (np.array): uint8 rgb or rgba image, the alpha channel is kept
+        parallel (bool): use all cores (optional)
+        single_channel (bool): return a single (H, W) gray channel, instead of equal rgb-channels (optional)
+        out (np.array): uint8 array to write the result into (optional)
+        inplace (bool): write the result into the image itself (optional)
     Returns:
         np.array: gray_image
     """
-    ...
+    image_view: const_uint8_t[:, :, :] = image
+    shape = image.shape[:2] if single_channel else image.shape
+    gray_image = output_array(image, shape, out, inplace)
+    gray_view: uint8_t[:, :, :] = gray_image[:, :, None] if single_channel else gray_image
+    h: C.Py_ssize_t
+
+    if parallel:
+        for h in prange(image_view.shape[0], nogil=True):  # height-values
+            _color2gray_row(image_view, gray_view, h)
+    else:
+        with C.nogil:
+            for h in range(image_view.shape[0]):  # height-values
+                _color2gray_row(image_view, gray_view, h)
 
+    return gray_image
 
-def cython_color2sepia(image):
+
+def cython_color2sepia(
+        image, k: float64_t = 1, parallel: C.bint = False, out=None, inplace: C.bint = False, rescale="max"
+):
     """Convert rgb pixel array to sepia
 
+    The maximum sepia value is found in a first pass (with rescale='max'), and the scaled and blended
+    values are written directly as uint8 in a second pass. The loops run without
+    the GIL, and with `parallel` the rows are spread over all cores with OpenMP.
+
     Args:
-        image (np.array)
+        image (np.array): uint8 rgb or rgba image, the alpha channel is kept
+        k (float): amount of sepia, in [0-1] (optional)
+        parallel (bool): use all cores (optional)
+        out (np.array): uint8 array of the image shape to write the result into (optional)
+        inplace (bool): write the result into the image itself (optional)
+        rescale (str | float): how sepia values above the output range are scaled down,
+            'max', 'channels', 'range' or the largest sepia value, see numpy_filters.sepia_max (optional)
     Returns:
-        np.array: gray_image
+        np.array: sepia_image
     """
-    ...
+    if not 0 <= k <= 1:
+        raise ValueError(f"k must be in [0-1], got {k=}")
+
+    image_view: const_uint8_t[:, :, :] = image
+
+    sepia_matrix = np.asarray([
+        [0.393, 0.769, 0.189],
+        [0.349, 0.686, 0.168],
+        [0.272, 0.534, 0.131],
+    ])
+    matrix_view: float64_t[:, :] = sepia_matrix
+
+    sepia_image = output_array(image, image.shape, out, inplace)
+    sepia_view: uint8_t[:, :, :] = sepia_image
+
+    h: C.Py_ssize_t
+    scale: float64_t
+    current_max: float64_t
+
+    max_value = sepia_max(image, sepia_matrix, rescale)
+    if max_value is None:
+        # maximum of each row, reduced after the (parallel) loop
+        row_max = np.zeros(image_view.shape[0])
+        row_max_view: float64_t[:] = row_max
+
+        # First pass: find the maximum sepia value
+        if parallel:
+            for h in prange(image_view.shape[0], nogil=True):  # height-values
+                row_max_view[h] = _sepia_row_max(image_view, matrix_view, h)
+        else:
+            with C.nogil:
+                for h in range(image_view.shape[0]):  # height-values
+                    row_max_view[h] = _sepia_row_max(image_view, matrix_view, h)
+        max_value = row_max.max() if image_view.shape[0] > 0 else 0
+
+    # Check for uint8 overflow (>255), then scale all values down with the max value
+    current_max = max_value
+    scale = 255 / current_max if current_max > 255 else 1
+
+    # Second pass: write the scaled sepia values
+    if parallel:
+        for h in prange(image_view.shape[0], nogil=True):  # height-values
+            _color2sepia_row(image_view, sepia_view, matrix_view, scale, k, h)
+    else:
+        with C.nogil:
+            for h in range(image_view.shape[0]):  # height-values
+                _color2sepia_row(image_view, sepia_view, matrix_view, scale, k, h)
+
+    return sepia_image
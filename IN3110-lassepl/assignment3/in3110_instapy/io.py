@@ -2,23 +2,156 @@
 
 for reading, writing, and displaying image files
 as numpy arrays
+
+Besides the image formats of PIL, images can be stored uncompressed as
+`.npy` files or raw uint8 or uint16 files (`.raw`, which have no header, so the
+shape and type must be given). These are memory-mapped instead of decoded, so
+frames pass between processes without JPEG/PNG encoding, and images larger than
+RAM are only paged in as the filters read them. They also keep 16-bit images,
+which PIL can only hold as single channel images.
+
+Filtered images can also be created as uncompressed TIFF files, which are
+memory-mapped for writing like the `.npy` files, and can be opened by any
+image viewer.
 """
 from __future__ import annotations
 
+import struct
+from pathlib import Path
+
 import numpy as np
 from PIL import Image
 
+# Uncompressed formats, which are memory-mapped instead of decoded
+MEMMAP_SUFFIXES = (".npy", ".raw")
+
+# Uncompressed TIFF files, which are memory-mapped when created
+TIFF_SUFFIXES = (".tif", ".tiff")
+
+# Bytes per strip of the created TIFF files, so they can be read strip by strip
+TIFF_STRIP_BYTES = 1 << 16
+
 
-def read_image(filename: str) -> np.array:
-    """Read an image file to an rgb array"""
+def read_image(filename: str, shape: tuple = None, dtype: np.dtype = np.uint8) -> np.array:
+    """Read an image file to an rgb array
+
+    `.npy` and `.raw` files are memory-mapped read-only.
+
+    Args:
+        filename (str): the image file
+        shape (tuple): the (H, W, C) shape of a `.raw` file
+        dtype (np.dtype): the type of a `.raw` file, uint8 or uint16
+    Returns:
+        np.array: the image, a np.memmap for `.npy` and `.raw` files
+    """
+    suffix = Path(filename).suffix.lower()
+    if suffix == ".npy":
+        return np.load(filename, mmap_mode="r")
+    if suffix == ".raw":
+        if shape is None:
+            raise ValueError(f"the shape of raw image {filename} must be given")
+        return np.memmap(filename, dtype=dtype, mode="r", shape=tuple(shape))
     return np.asarray(Image.open(filename))
 
 
 def write_image(array: np.array, filename: str) -> None:
-    """Write a numpy pixel array to a file"""
+    """Write a numpy pixel array to a file
+
+    `.npy` and `.raw` files are written uncompressed, without encoding,
+    `.raw` files as uint16 for uint16 arrays and uint8 otherwise.
+    """
+    suffix = Path(filename).suffix.lower()
+    if suffix == ".npy":
+        return np.save(filename, array)
+    if suffix == ".raw":
+        dtype = np.uint16 if array.dtype == np.uint16 else np.uint8
+        return np.ascontiguousarray(array, dtype=dtype).tofile(filename)
     return Image.fromarray(array).save(filename)
 
 
+def create_image(filename: str, shape: tuple, dtype: np.dtype = np.uint8) -> np.memmap:
+    """Create a writable memory-mapped image file, to filter into
+
+    Args:
+        filename (str): the `.npy`, `.raw` or uint8 `.tif` file to create
+        shape (tuple): the (H, W, C) or (H, W) shape of the image
+        dtype (np.dtype): uint8, or uint16 for the filtered 16-bit images
+    Returns:
+        np.memmap: the image, written to the file when flushed or deleted
+    """
+    suffix = Path(filename).suffix.lower()
+    if suffix == ".npy":
+        return np.lib.format.open_memmap(filename, mode="w+", dtype=dtype, shape=tuple(shape))
+    if suffix == ".raw":
+        return np.memmap(filename, dtype=dtype, mode="w+", shape=tuple(shape))
+    if suffix in TIFF_SUFFIXES:
+        return _create_tiff(filename, tuple(shape), np.dtype(dtype))
+    raise ValueError(
+        f"memory-mapped images must be {', '.join(MEMMAP_SUFFIXES + TIFF_SUFFIXES)} files, got {filename}"
+    )
+
+
+def _create_tiff(filename: str, shape: tuple, dtype: np.dtype) -> np.memmap:
+    """Create an uncompressed little-endian TIFF file, and memory-map its pixels
+
+    The pixels are stored as one block after the header, in strips of
+    about TIFF_STRIP_BYTES, so that readers can decode them strip by strip.
+    """
+    height, width = shape[:2]
+    channels = shape[2] if len(shape) == 3 else 1
+    if dtype != np.uint8 or channels not in (1, 3, 4):
+        raise ValueError(f"TIFF images must be uint8 gray, rgb or rgba, got {dtype} with {channels} channels")
+
+    row_bytes = width * channels
+    rows_per_strip = max(1, TIFF_STRIP_BYTES // max(row_bytes, 1))
+    n_strips = max(1, -(-height // rows_per_strip))
+
+    # the header, then the directory of 11 tags at most, the arrays it points to, and the pixels
+    n_tags = 11 if channels == 4 else 10
+    arrays_offset = 8 + 2 + 12 * n_tags + 4
+    bits_offset = arrays_offset
+    strip_offsets_offset = bits_offset + 2 * channels
+    strip_counts_offset = strip_offsets_offset + 4 * n_strips
+    data_offset = strip_counts_offset + 4 * n_strips
+    if data_offset + height * row_bytes >= 1 << 32:
+        raise ValueError(f"images of {height * row_bytes} bytes are too large for TIFF, use a .npy file")
+
+    strip_offsets = [data_offset + strip * rows_per_strip * row_bytes for strip in range(n_strips)]
+    strip_counts = [min(rows_per_strip, height - strip * rows_per_strip) * row_bytes for strip in range(n_strips)]
+
+    def tag(code: int, type: str, values: list, offset: int = 0) -> bytes:
+        """A directory entry, with the values in place if they fit in 4 bytes, else at offset"""
+        type_code, size = {"H": (3, 2), "I": (4, 4)}[type]
+        if len(values) * size <= 4:
+            return struct.pack(f"<HHI{len(values)}{type}", code, type_code, len(values), *values).ljust(12, b"\0")
+        return struct.pack("<HHII", code, type_code, len(values), offset)
+
+    tags = [
+        tag(256, "I", [width]),
+        tag(257, "I", [height]),
+        tag(258, "H", [8] * channels, bits_offset),  # bits per sample
+        tag(259, "H", [1]),  # no compression
+        tag(262, "H", [1 if channels == 1 else 2]),  # gray (black is zero) or rgb
+        tag(273, "I", strip_offsets, strip_offsets_offset),
+        tag(277, "H", [channels]),  # samples per pixel
+        tag(278, "I", [rows_per_strip]),
+        tag(279, "I", strip_counts, strip_counts_offset),
+        tag(284, "H", [1]),  # the channels of a pixel are stored together
+    ]
+    if channels == 4:
+        tags.append(tag(338, "H", [2]))  # the extra channel is (unassociated) alpha
+
+    with open(filename, "wb") as file:
+        file.write(b"II*\0" + struct.pack("<I", 8))
+        file.write(struct.pack("<H", len(tags)) + b"".join(tags) + struct.pack("<I", 0))
+        file.write(struct.pack(f"<{channels}H", *[8] * channels))
+        file.write(struct.pack(f"<{n_strips}I", *strip_offsets))
+        file.write(struct.pack(f"<{n_strips}I", *strip_counts))
+        file.truncate(data_offset + height * row_bytes)
+
+    return np.memmap(filename, dtype=np.uint8, mode="r+", offset=data_offset, shape=shape)
+
+
 def random_image(width: int = 320, height: int = 180) -> np.array:
     """Create a random image array of a given size"""
     return np.random.randint(0, 255, size=(height, width, 3), dtype=np.uint8)
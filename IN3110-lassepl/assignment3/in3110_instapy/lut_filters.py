@@ -0,0 +1,132 @@
+"""lookup-table implementation of image filters
+
+Every output channel is a weighted sum of the uint8 input channels,
+so the products are precomputed for all 256 input values. Filtering a
+pixel is then only table lookups and adds. The tables only cover uint8
+images, 16-bit images are filtered by the other implementations.
+"""
+from __future__ import annotations
+
+import numpy as np
+
+from .numpy_filters import copy_alpha, output_array, sepia_max
+
+# Pixels per strip of rows in the second sepia pass
+CHUNK_PIXELS = 1 << 16
+
+# All possible uint8 channel values
+_VALUES = np.arange(256, dtype=np.float64)
+
+# Per-channel partial products of the gray weights (r,g,b) = (0.21, 0.72, 0.07)
+GRAY_TABLES = np.outer([0.21, 0.72, 0.07], _VALUES)
+
+SEPIA_MATRIX = np.asarray([
+    [0.393, 0.769, 0.189],
+    [0.349, 0.686, 0.168],
+    [0.272, 0.534, 0.131],
+])
+
+# Per-channel partial products of the sepia matrix, SEPIA_TABLES[c, j] is row c, input channel j
+SEPIA_TABLES = SEPIA_MATRIX[:, :, None] * _VALUES
+
+
+def _check_uint8(image: np.array) -> None:
+    if image.dtype != np.uint8:
+        raise ValueError(f"the lookup tables are only for uint8 images, got {image.dtype}")
+
+
+def _weighted_sum(image: np.array, tables: np.array, out: np.array) -> np.array:
+    """Look up and add the partial products of the 3 input channels into out"""
+    np.take(tables[0], image[:, :, 0], out=out)
+    out += np.take(tables[1], image[:, :, 1])
+    out += np.take(tables[2], image[:, :, 2])
+    return out
+
+
+def lut_color2gray(
+        image: np.array, single_channel: bool = False, out: np.array = None, inplace: bool = False
+) -> np.array:
+    """Convert rgb pixel array to grayscale
+
+    Args:
+        image (np.array): uint8 rgb or rgba image, the alpha channel is kept
+        single_channel (bool): return a single (H, W) gray channel, instead of three equal rgb-channels (optional)
+        out (np.array): uint8 array to write the result into (optional)
+        inplace (bool): write the result into the image itself (optional)
+    Returns:
+        np.array: gray_image
+    """
+    _check_uint8(image)
+    shape = image.shape[:2] if single_channel else image.shape
+    gray_image = output_array(image, shape, out, inplace)
+
+    gray_sum = _weighted_sum(image, GRAY_TABLES, np.empty(image.shape[:2]))
+
+    if single_channel:
+        np.copyto(gray_image, gray_sum, casting="unsafe")  # truncating, like astype
+        return gray_image
+
+    # Duplicate the weighted sum to three uniform rgb-channel values
+    np.copyto(gray_image[:, :, :3], gray_sum[:, :, None], casting="unsafe")
+    copy_alpha(image, gray_image)
+    return gray_image
+
+
+def lut_color2sepia(
+        image: np.array, k: float = 1, out: np.array = None, inplace: bool = False, rescale: str | float = "max"
+) -> np.array:
+    """Convert rgb pixel array to sepia
+
+    Args:
+        image (np.array): uint8 rgb or rgba image, the alpha channel is kept
+        k (float): amount of sepia (optional)
+        out (np.array): uint8 array of the image shape to write the result into (optional)
+        inplace (bool): write the result into the image itself (optional)
+        rescale (str | float): how sepia values above 255 are scaled down,
+            'max', 'channels', 'range' or the largest sepia value, see numpy_filters.sepia_max (optional)
+
+    The amount of sepia is given as a fraction, k=0 yields no sepia while
+    k=1 yields full sepia.
+
+    The first pass (with rescale='max') only sums the red channel: every weight of the red row of the
+    sepia matrix is larger than the weights of the other rows, so the maximum sepia
+    value is always in the red channel. The rescale by the maximum and the strength
+    blend are then folded into the tables, so the second pass is still only lookups and adds.
+    The second pass goes strip by strip, and all channels of a strip are looked up
+    before the strip is written, so the output can be the image itself.
+
+    Returns:
+        np.array: sepia_image
+    """
+    if not 0 <= k <= 1:
+        raise ValueError(f"k must be in [0-1], got {k=}")
+    _check_uint8(image)
+
+    sepia_image = output_array(image, image.shape, out, inplace)
+
+    max_value = sepia_max(image, SEPIA_MATRIX, rescale)
+    if max_value is None:
+        # First pass: the maximum sepia value, from the red channel only
+        red_sum = _weighted_sum(image, SEPIA_TABLES[0], np.empty(image.shape[:2]))
+        max_value = red_sum.max() if image.size else 0
+    scale = 255 / max_value if max_value > 255 else 1  # overflow with uint8, scale all down from max value
+
+    # Fold the rescale and the strength k into the tables:
+    # k * scale * (M @ rgb) + (1 - k) * rgb
+    tables = k * scale * SEPIA_TABLES
+    for c in range(3):
+        tables[c, c] += (1 - k) * _VALUES
+
+    # Second pass: look up each output channel of a strip, and write the strip as uint8
+    height, width = image.shape[:2]
+    rows = max(1, CHUNK_PIXELS // max(width, 1))
+    channel_sums = np.empty((3, rows, width))  # float buffers, reused for every strip
+    for start in range(0, height, rows):
+        strip = image[start:start + rows]
+        strip_sums = channel_sums[:, :strip.shape[0]]
+        for c in range(3):
+            _weighted_sum(strip, tables[c], strip_sums[c])
+        np.copyto(sepia_image[start:start + rows, :, :3], np.moveaxis(strip_sums, 0, -1), casting="unsafe")
+    copy_alpha(image, sepia_image)
+
+    return sepia_image
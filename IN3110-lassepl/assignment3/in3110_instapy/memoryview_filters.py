@@ -0,0 +1,224 @@
+"""pure Python implementation of image filters on flat buffers
+
+The python filters index the numpy image pixel by pixel, which makes a numpy
+scalar for every value read and written. These filters instead walk flat
+`memoryview`s of the pixel buffer, one strided slice per channel, and look the
+weighted values up in tables of python floats, so the arithmetic is the same
+as in the python filters, but without numpy in the loops.
+
+The `*_buffer` functions take any flat uint8 or uint16 buffer, e.g. `bytes`,
+`bytearray`, `array('B')`, `array('H')` or a numpy array, and only need the
+standard library, as a fallback where numba can not be installed. The
+`memoryview_*` filters wrap them for numpy images, like the other implementations,
+and import numpy when they are called.
+"""
+from __future__ import annotations
+
+from array import array
+from functools import lru_cache
+
+# The largest value of the memoryview formats, uint8 and uint16
+LIMITS = {"B": 255, "H": 65535}
+
+GRAY_WEIGHTS = [0.21, 0.72, 0.07]
+
+# The sepia rescale modes, as numpy_filters.SEPIA_RESCALES, which imports numpy
+SEPIA_RESCALES = ("max", "channels", "range")
+
+SEPIA_MATRIX = [
+    [0.393, 0.769, 0.189],
+    [0.349, 0.686, 0.168],
+    [0.272, 0.534, 0.131],
+]
+
+
+def _flat(buffer) -> memoryview:
+    """Return a flat memoryview of the uint8 ('B') or uint16 ('H') values of a buffer"""
+    view = memoryview(buffer)
+    if view.format not in LIMITS:
+        raise ValueError(f"expected a buffer of uint8 or uint16 values, got format {view.format!r}")
+    if view.nbytes == 0:  # an empty view with zeros in its shape can not be cast
+        return memoryview(array(view.format))
+    if view.ndim != 1:
+        view = view.cast("B").cast(view.format)
+    return view
+
+
+def _check_buffers(view: memoryview, out_view: memoryview, channels: int, out_channels: int) -> None:
+    """Raise a ValueError if the buffers do not hold the same pixels of the same type"""
+    if channels < 3 or len(view) % channels:
+        raise ValueError(f"expected at least 3 channels, got {len(view)} values of {channels} channels")
+    if out_view.format != view.format or len(out_view) != len(view) // channels * out_channels:
+        raise ValueError(
+            f"out must hold {len(view) // channels * out_channels} values of format {view.format!r}, "
+            f"got {len(out_view)} of format {out_view.format!r}"
+        )
+
+
+def _new_buffer(format: str, length: int) -> array:
+    """Return a zeroed array of the format"""
+    return array(format, bytes(length * array(format).itemsize))
+
+
+@lru_cache(maxsize=None)
+def _weight_table(weight: float, limit: int) -> list:
+    """The weighted values `value * weight` for every value up to the limit"""
+    return [value * weight for value in range(limit + 1)]
+
+
+def color2gray_buffer(pixels, channels: int = 3, single_channel: bool = False, out=None):
+    """Convert a flat buffer of rgb pixels to grayscale
+
+    Args:
+        pixels: flat uint8 or uint16 buffer of interleaved pixels
+        channels (int): values per pixel, 3 for rgb or 4 for rgba, the alpha channel is kept
+        single_channel (bool): write one gray value per pixel, instead of equal rgb-channels (optional)
+        out: writable buffer of the same type to write the result into, may be the pixels (optional)
+    Returns:
+        the gray pixels, out or a new array of the type of the pixels
+    """
+    view = _flat(pixels)
+    out_channels = 1 if single_channel else channels
+    if out is None:
+        out = _new_buffer(view.format, len(view) // max(channels, 1) * out_channels)
+    out_view = _flat(out)
+    _check_buffers(view, out_view, channels, out_channels)
+
+    limit = LIMITS[view.format]
+    red, green, blue = (_weight_table(weight, limit) for weight in GRAY_WEIGHTS)
+
+    # Weighted sum with weights (r,g,b) = (0.21, 0.72, 0.07), truncated like the numpy cast
+    gray = array(view.format, [
+        int(red[r] + green[g] + blue[b])
+        for r, g, b in zip(view[0::channels], view[1::channels], view[2::channels])
+    ])
+
+    if single_channel:
+        out_view[:] = gray
+        return out
+
+    # the gray values are computed before writing, so out may be the pixels
+    for c in range(3):
+        out_view[c::channels] = gray
+    # the alpha channel is kept
+    for c in range(3, channels):
+        out_view[c::channels] = view[c::channels]
+    return out
+
+
+def color2sepia_buffer(pixels, k: float = 1, channels: int = 3, out=None, rescale: str | float = "max"):
+    """Convert a flat buffer of rgb pixels to sepia
+
+    Args:
+        pixels: flat uint8 or uint16 buffer of interleaved pixels
+        k (float): amount of sepia, in [0-1] (optional)
+        channels (int): values per pixel, 3 for rgb or 4 for rgba, the alpha channel is kept
+        out: writable buffer of the same type and length to write the result into, may be the pixels (optional)
+        rescale (str | float): how sepia values above the output range are scaled down,
+            'max', 'channels', 'range' or the largest sepia value, see numpy_filters.sepia_max (optional)
+    Returns:
+        the sepia pixels, out or a new array of the type of the pixels
+    """
+    if not 0 <= k <= 1:
+        raise ValueError(f"k must be in [0-1], got {k=}")
+    if isinstance(rescale, str) and rescale not in SEPIA_RESCALES:
+        raise ValueError(f"rescale must be one of {SEPIA_RESCALES}, got {rescale=}")
+
+    view = _flat(pixels)
+    if out is None:
+        out = _new_buffer(view.format, len(view))
+    out_view = _flat(out)
+    _check_buffers(view, out_view, channels, channels)
+
+    limit = LIMITS[view.format]
+    tables = [[_weight_table(weight, limit) for weight in row] for row in SEPIA_MATRIX]
+    rgb = [view[c::channels] for c in range(3)]
+
+    # The maximum sepia value, the red row has the largest weights so it is a red value
+    red, green, blue = tables[0]
+    if not isinstance(rescale, str):  # given
+        max_value = rescale
+    elif rescale == "max":  # a first pass over all pixels
+        max_value = max((red[r] + green[g] + blue[b] for r, g, b in zip(*rgb)), default=0)
+    else:  # a bound from the largest value of each channel, or of the type
+        r, g, b = [max(values, default=0) for values in rgb] if rescale == "channels" else [limit] * 3
+        max_value = red[r] + green[g] + blue[b]
+
+    # Check for overflow (>255 for uint8), then scale all values down with the max value
+    scale = limit / max_value if max_value > limit else 1
+
+    # The scaled sepia values, blended with the image by the strength k
+    sepia = [
+        array(view.format, [
+            int(k * ((red[r] + green[g] + blue[b]) * scale) + (1 - k) * value)
+            for r, g, b, value in zip(*rgb, original)
+        ])
+        for (red, green, blue), original in zip(tables, rgb)
+    ]
+
+    # all channels are computed before writing, so out may be the pixels
+    for c in range(3):
+        out_view[c::channels] = sepia[c]
+    # the alpha channel is kept
+    for c in range(3, channels):
+        out_view[c::channels] = view[c::channels]
+    return out
+
+
+def _filter_image(buffer_filter, image: np.array, filtered_image: np.array, **options) -> np.array:
+    """Run a buffer filter from the pixels of a numpy image into a numpy output"""
+    import numpy as np
+
+    if filtered_image.size == 0:  # no pixels
+        return filtered_image
+    pixels = np.ascontiguousarray(image, dtype=filtered_image.dtype)
+    # the buffers are written through flat views, so a strided output is filled from a contiguous copy
+    target = filtered_image if filtered_image.flags.c_contiguous else np.empty_like(filtered_image)
+    buffer_filter(pixels, channels=image.shape[2], out=target, **options)
+    if target is not filtered_image:
+        np.copyto(filtered_image, target)
+    return filtered_image
+
+
+def memoryview_color2gray(
+        image: np.array, single_channel: bool = False, out: np.array = None, inplace: bool = False
+) -> np.array:
+    """Convert rgb pixel array to grayscale, through flat memoryviews
+
+    Args:
+        image (np.array): uint8 or uint16 rgb or rgba image, the alpha channel is kept
+        single_channel (bool): return a single (H, W) gray channel, instead of equal rgb-channels (optional)
+        out (np.array): array of the output shape and image dtype to write the result into (optional)
+        inplace (bool): write the result into the image itself (optional)
+    Returns:
+        np.array: gray_image
+    """
+    from .numpy_filters import output_array
+
+    shape = image.shape[:2] if single_channel else image.shape
+    gray_image = output_array(image, shape, out, inplace)
+    return _filter_image(color2gray_buffer, image, gray_image, single_channel=single_channel)
+
+
+def memoryview_color2sepia(
+        image: np.array, k: float = 1, out: np.array = None, inplace: bool = False, rescale: str | float = "max"
+) -> np.array:
+    """Convert rgb pixel array to sepia, through flat memoryviews
+
+    Args:
+        image (np.array): uint8 or uint16 rgb or rgba image, the alpha channel is kept
+        k (float): amount of sepia, in [0-1] (optional)
+        out (np.array): array of the image shape and dtype to write the result into (optional)
+        inplace (bool): write the result into the image itself (optional)
+        rescale (str | float): how sepia values above the output range are scaled down,
+            'max', 'channels', 'range' or the largest sepia value, see numpy_filters.sepia_max (optional)
+    Returns:
+        np.array: sepia_image
+    """
+    if not 0 <= k <= 1:
+        raise ValueError(f"k must be in [0-1], got {k=}")
+
+    from .numpy_filters import output_array
+
+    sepia_image = output_array(image, image.shape, out, inplace)
+    return _filter_image(color2sepia_buffer, image, sepia_image, k=k, rescale=rescale)
@@ -2,41 +2,139 @@
 from __future__ import annotations
 
 import numpy as np
-from numba import jit
+from numba import jit, types
 
+from .numpy_filters import (
+    GRAY_SHIFT,
+    GRAY_WEIGHTS_FIXED,
+    SEPIA_FRACTION,
+    SEPIA_MATRIX,
+    SEPIA_MATRIX_FIXED,
+    SEPIA_RESCALE_DROP,
+    SEPIA_SHIFT,
+    STRENGTH_SHIFT,
+    check_blur_size,
+    check_fixed_point,
+    output_array,
+    sepia_max,
+)
 
-@jit(nopython=True)
-def numba_color2gray(image: np.array) -> np.array:
-    """Convert rgb pixel array to grayscale
+# The common image layouts: C-contiguous uint8 HxWx3 or HxWx4 arrays, writable or
+# read-only (as returned by np.asarray(PIL.Image)), and non-contiguous views
+IMAGE_TYPES = [
+    types.Array(types.uint8, 3, "C"),
+    types.Array(types.uint8, 3, "C", readonly=True),
+    types.Array(types.uint8, 3, "A"),
+]
 
-    Args:
-        image (np.array)
-    Returns:
-        np.array: gray_image
-    """
-    gray_image = np.empty_like(image)
+# 16-bit images (e.g. scans), filtered into uint16 arrays
+UINT16_IMAGE_TYPES = [
+    types.Array(types.uint16, 3, "C"),
+    types.Array(types.uint16, 3, "C", readonly=True),
+]
+
+
+@jit(nopython=True, nogil=True, cache=True)
+def _color2gray(image: np.array, gray_image: np.array) -> None:
+    """Write the grayscale of image into gray_image, and copy an alpha channel"""
 
     # iterate through the pixels, and apply the grayscale transform
     for h in range(gray_image.shape[0]):  # height-values
         for w in range(gray_image.shape[1]):  # width-values
             # Weighted sum with weights (r,g,b) = (0.21, 0.72, 0.07)
-            gray_image[h, w, :] = 0.21 * image[h, w, 0] + 0.72 * image[h, w, 1] + 0.07 * image[h, w, 2]
+            gray = 0.21 * image[h, w, 0] + 0.72 * image[h, w, 1] + 0.07 * image[h, w, 2]
+            for c in range(gray_image.shape[2]):
+                # the rgb-channels are gray, the alpha channel is kept
+                gray_image[h, w, c] = gray if c < 3 else image[h, w, c]
 
-    gray_image = gray_image.astype("uint8")  # convert back into unsigned 8 bit ints
-    return gray_image
+
+@jit(nopython=True, nogil=True, cache=True)
+def _color2gray_fixed(image: np.array, gray_image: np.array) -> None:
+    """Write the fixed-point grayscale of uint8 image into gray_image, and copy an alpha channel"""
+    for h in range(gray_image.shape[0]):  # height-values
+        for w in range(gray_image.shape[1]):  # width-values
+            gray = (GRAY_WEIGHTS_FIXED[0] * np.uint64(image[h, w, 0])
+                    + GRAY_WEIGHTS_FIXED[1] * np.uint64(image[h, w, 1])
+                    + GRAY_WEIGHTS_FIXED[2] * np.uint64(image[h, w, 2])) >> GRAY_SHIFT
+            for c in range(gray_image.shape[2]):
+                gray_image[h, w, c] = gray if c < 3 else np.uint64(image[h, w, c])
 
 
-@jit(nopython=True)
-def numba_color2sepia(image: np.array) -> np.array:
-    """Convert rgb pixel array to sepia
+@jit(nopython=True, nogil=True, cache=True)
+def _blur_rows(image: np.array, blurred_image: np.array, radius: int, row_start: int, row_stop: int) -> None:
+    """Write the rounded box blur of the rows row_start:row_stop of image into blurred_image
+
+    A running sum of each column over the 2 * radius + 1 rows around the current row is
+    kept, and slid down one row at a time, and each row is a running sum along these
+    column sums. Pixels outside the image are taken from the closest edge.
+    """
+    height, width, channels = image.shape
+    size = 2 * radius + 1
+    area = size * size
+
+    # the column sums of the window of rows around row_start
+    column_sums = np.zeros((width, channels), dtype=np.int64)
+    for y in range(row_start - radius, row_start + radius + 1):
+        y = min(max(y, 0), height - 1)
+        for w in range(width):
+            for c in range(channels):
+                column_sums[w, c] += image[y, w, c]
+
+    for h in range(row_start, row_stop):  # height-values
+        for c in range(channels):
+            # the sum of the window around the first column
+            total = 0
+            for x in range(-radius, radius + 1):
+                total += column_sums[min(max(x, 0), width - 1), c]
+            for w in range(width):  # width-values
+                blurred_image[h, w, c] = (total + area // 2) // area
+                # slide the window one column right
+                total += column_sums[min(w + radius + 1, width - 1), c] - column_sums[max(w - radius, 0), c]
+
+        # slide the window one row down
+        enter, leave = min(h + radius + 1, height - 1), max(h - radius, 0)
+        for w in range(width):
+            for c in range(channels):
+                column_sums[w, c] += np.int64(image[enter, w, c]) - np.int64(image[leave, w, c])
+
+
+def numba_color2gray(
+        image: np.array,
+        fixed_point: bool = False,
+        single_channel: bool = False,
+        out: np.array = None,
+        inplace: bool = False,
+) -> np.array:
+    """Convert rgb pixel array to grayscale
 
     Args:
-        image (np.array)
+        image (np.array): uint8 or uint16 rgb or rgba image, the alpha channel is kept
+        fixed_point (bool): compute with integer fixed-point weights, uint8 images only (optional)
+        single_channel (bool): return a single (H, W) gray channel, instead of equal rgb-channels (optional)
+        out (np.array): array of the output shape and image dtype to write the result into, e.g. a np.memmap (optional)
+        inplace (bool): write the result into the image itself (optional)
     Returns:
-        np.array: sepia_image
+        np.array: gray_image
     """
+    if fixed_point:
+        check_fixed_point(image)
+
+    # one gray channel, or the same number of channels as the image
+    shape = image.shape[:2] if single_channel else image.shape
+    gray_image = output_array(image, shape, out, inplace)
 
-    sepia_image = np.empty_like(image).astype(np.float32)
+    # the kernels write (H, W, C) arrays, a single channel is written through a (H, W, 1) view
+    channels_view = gray_image[:, :, None] if single_channel else gray_image
+    if fixed_point:
+        _color2gray_fixed(image, channels_view)
+    else:
+        _color2gray(image, channels_view)
+    return gray_image
+
+
+@jit(nopython=True, nogil=True, cache=True)
+def _sepia_max(image: np.array) -> float:
+    """Return the maximum sepia value of image, without storing the sepia values"""
 
     sepia_matrix = [
         [0.393, 0.769, 0.189],
@@ -44,33 +142,190 @@ def numba_color2sepia(image: np.array) -> np.array:
         [0.272, 0.534, 0.131],
     ]
 
-    # Iterate through the pixels, applying the sepia matrix conversion
-    current_max = 0
-    for h in range(sepia_image.shape[0]):  # height-values
-        for w in range(sepia_image.shape[1]):  # width-values
-            r, g, b = image[h, w]
+    current_max = 0.0
+    for h in range(image.shape[0]):  # height-values
+        for w in range(image.shape[1]):  # width-values
+            r, g, b = image[h, w, 0], image[h, w, 1], image[h, w, 2]
 
             # Take average of all rbg-values and multiply with weights in sepia_matrix
             sepia_r = r * sepia_matrix[0][0] + g * sepia_matrix[0][1] + b * sepia_matrix[0][2]
             sepia_g = r * sepia_matrix[1][0] + g * sepia_matrix[1][1] + b * sepia_matrix[1][2]
             sepia_b = r * sepia_matrix[2][0] + g * sepia_matrix[2][1] + b * sepia_matrix[2][2]
 
-            # Create new sepia image values
-            sepia_image[h, w] = np.asarray([sepia_r, sepia_g, sepia_b])
-
             # Save maximum found value for later scaling
             new_max = max(sepia_r, sepia_g, sepia_b)
             if new_max > current_max:
                 current_max = new_max
+    return current_max
+
+
+@jit(nopython=True, nogil=True, cache=True)
+def _color2sepia(image: np.array, sepia_image: np.array, k: float, scale: float) -> None:
+    """Write the sepia of image, scaled by scale and blended with strength k, into sepia_image,
+    and copy an alpha channel"""
+
+    sepia_matrix = [
+        [0.393, 0.769, 0.189],
+        [0.349, 0.686, 0.168],
+        [0.272, 0.534, 0.131],
+    ]
+
+    # Compute the sepia values, scale and blend them, and write them into the output
+    for h in range(sepia_image.shape[0]):  # height-values
+        for w in range(sepia_image.shape[1]):  # width-values
+            r, g, b = image[h, w, 0], image[h, w, 1], image[h, w, 2]
+            for c in range(3):  # rbg-channels
+                sepia_value = (r * sepia_matrix[c][0] + g * sepia_matrix[c][1] + b * sepia_matrix[c][2]) * scale
+                sepia_image[h, w, c] = k * sepia_value + (1 - k) * image[h, w, c]
+            for c in range(3, sepia_image.shape[2]):  # the alpha channel is kept
+                sepia_image[h, w, c] = image[h, w, c]
+
+
+@jit(nopython=True, nogil=True, cache=True)
+def _sepia_max_fixed(image: np.array) -> int:
+    """Return the maximum fixed-point weighted sum of uint8 image"""
+
+    # All integers are uint64, as numba turns mixed signed and unsigned integer math into floats
+    current_max = np.uint64(0)
+    for h in range(image.shape[0]):  # height-values
+        for w in range(image.shape[1]):  # width-values
+            r, g, b = np.uint64(image[h, w, 0]), np.uint64(image[h, w, 1]), np.uint64(image[h, w, 2])
+            for c in range(3):  # rbg-channels
+                value = r * SEPIA_MATRIX_FIXED[c, 0] + g * SEPIA_MATRIX_FIXED[c, 1] + b * SEPIA_MATRIX_FIXED[c, 2]
+                if value > current_max:
+                    current_max = value
+    return current_max
+
+
+@jit(nopython=True, nogil=True, cache=True)
+def _color2sepia_fixed(image: np.array, sepia_image: np.array, k_fixed: int, current_max: int) -> None:
+    """Write the fixed-point sepia of uint8 image, blended with strength k_fixed / 2**16, into sepia_image
+
+    current_max is the largest weighted sum, which is scaled down to 255.
+    Uses the same integer steps as numpy_filters, so the two give identical results.
+    """
+
+    # All integers are uint64, as numba turns mixed signed and unsigned integer math into floats
+    k_fixed = np.uint64(k_fixed)
+    k_rest = np.uint64(1 << STRENGTH_SHIFT) - k_fixed
+    rescale_factor = np.uint64(255 << SEPIA_FRACTION)
+    current_max = np.uint64(current_max)
+
+    # Check for uint8 overflow, then scale all values down with the max value
+    rescale = current_max > 255 << SEPIA_SHIFT
+    divisor = current_max >> SEPIA_RESCALE_DROP
+
+    # Recompute, rescale and blend with SEPIA_FRACTION fractional bits, then truncate
+    for h in range(sepia_image.shape[0]):  # height-values
+        for w in range(sepia_image.shape[1]):  # width-values
+            r, g, b = np.uint64(image[h, w, 0]), np.uint64(image[h, w, 1]), np.uint64(image[h, w, 2])
+            for c in range(3):  # rbg-channels
+                value = r * SEPIA_MATRIX_FIXED[c, 0] + g * SEPIA_MATRIX_FIXED[c, 1] + b * SEPIA_MATRIX_FIXED[c, 2]
+                if rescale:
+                    value = (value >> SEPIA_RESCALE_DROP) * rescale_factor // divisor
+                else:
+                    value = value >> (SEPIA_SHIFT - SEPIA_FRACTION)
+                original = np.uint64(image[h, w, c]) << SEPIA_FRACTION
+                value = (value * k_fixed + original * k_rest) >> STRENGTH_SHIFT
+                sepia_image[h, w, c] = value >> SEPIA_FRACTION
+            for c in range(3, sepia_image.shape[2]):  # the alpha channel is kept
+                sepia_image[h, w, c] = image[h, w, c]
+
+
+def numba_color2sepia(
+        image: np.array,
+        k: float = 1,
+        fixed_point: bool = False,
+        out: np.array = None,
+        inplace: bool = False,
+        rescale: str | float = "max",
+) -> np.array:
+    """Convert rgb pixel array to sepia
+
+    Args:
+        image (np.array): uint8 or uint16 rgb or rgba image, the alpha channel is kept
+        k (float): amount of sepia (optional)
+        fixed_point (bool): compute with integer fixed-point weights, uint8 images only (optional)
+        out (np.array): array of the image shape and dtype to write the result into, e.g. a np.memmap (optional)
+        inplace (bool): write the result into the image itself (optional)
+        rescale (str | float): how sepia values above the output range are scaled down,
+            'max', 'channels', 'range' or the largest sepia value, see numpy_filters.sepia_max (optional)
+
+    The amount of sepia is given as a fraction, k=0 yields no sepia while
+    k=1 yields full sepia. The blend is done in the same pass as the
+    sepia transform, and with rescale='max' the maximum sepia value is found
+    in a first pass. Every pixel is read before it is written, so the
+    output can be the image itself.
+
+    Returns:
+        np.array: sepia_image
+    """
+    if not 0 <= k <= 1:
+        raise ValueError(f"k must be in [0-1], got {k=}")
+    if fixed_point:
+        check_fixed_point(image)
+
+    # The output is written directly in the image type, no float copy of the image is kept
+    sepia_image = output_array(image, image.shape, out, inplace)
+    if fixed_point:
+        current_max = sepia_max(image, SEPIA_MATRIX_FIXED, rescale)
+        if current_max is None:
+            current_max = _sepia_max_fixed(image)
+        _color2sepia_fixed(image, sepia_image, round(k * (1 << STRENGTH_SHIFT)), int(current_max))
+        return sepia_image
+
+    current_max = sepia_max(image, SEPIA_MATRIX, rescale)
+    if current_max is None:
+        current_max = _sepia_max(image)
+    # Check for overflow (>255 for uint8), then scale all values down with the max value
+    limit = np.iinfo(sepia_image.dtype).max
+    scale = limit / current_max if current_max > limit else 1.0
+    _color2sepia(image, sepia_image, float(k), scale)
+    return sepia_image
+
+
+def numba_blur(image: np.array, size: int = 3, out: np.array = None, inplace: bool = False) -> np.array:
+    """Blur pixel array with the mean of the size x size neighbourhood of each pixel
+
+    The neighbourhood sums are running sums, so the time does not grow with the kernel size.
+
+    Args:
+        image (np.array)
+        size (int): the width and height of the kernel, a positive odd integer (optional)
+        out (np.array): array of the image shape and dtype to write the result into (optional)
+        inplace (bool): write the result into the image itself (optional)
+    Returns:
+        np.array: blurred_image
+    """
+    radius = check_blur_size(size)
+    blurred_image = output_array(image, image.shape, out, inplace)
+    if np.may_share_memory(image, blurred_image):
+        # the rows above and below are read after a row is written
+        image = image.copy()
+    _blur_rows(image, blurred_image, radius, 0, image.shape[0])
+    return blurred_image
+
+
+def precompile() -> None:
+    """Compile the filters for the common image layouts
+
+    The compiled machine code is cached on disk (``cache=True``), so only the
+    first process ever compiles, and later processes load the cached code
+    here instead of compiling on the first filtered image.
+    """
+    out_type = types.Array(types.uint8, 3, "C")
+    for image_type in IMAGE_TYPES:
+        _color2gray.compile((image_type, out_type))
+        _color2gray_fixed.compile((image_type, out_type))
+        _sepia_max.compile((image_type,))
+        _color2sepia.compile((image_type, out_type, types.float64, types.float64))
+        _sepia_max_fixed.compile((image_type,))
+        _color2sepia_fixed.compile((image_type, out_type, types.int64, types.int64))
+        _blur_rows.compile((image_type, out_type, types.int64, types.int64, types.int64))
 
-    # Then check for uint8 overflow (>255)
-    if current_max > 255:
-        # Then scale all values for uint8 overflow (over 255) with the max value with new loop
-        scale = 255 / current_max
-        for h in range(sepia_image.shape[0]):  # height-values
-            for w in range(sepia_image.shape[1]):  # width-values
-                for c in range(3):  # rbg-channels
-                    sepia_image[h, w, c] = sepia_image[h, w, c] * scale
-
-    # Convert back to unsigned 8 bit ints
-    return sepia_image.astype("uint8")
+    out_type = types.Array(types.uint16, 3, "C")
+    for image_type in UINT16_IMAGE_TYPES:
+        _color2gray.compile((image_type, out_type))
+        _sepia_max.compile((image_type,))
+        _color2sepia.compile((image_type, out_type, types.float64, types.float64))
+        _blur_rows.compile((image_type, out_type, types.int64, types.int64, types.int64))
@@ -3,33 +3,202 @@ from __future__ import annotations
 
 import numpy as np
 
+# Fixed-point gray weights (0.21, 0.72, 0.07) * 2**8, the sum fits in uint16
+GRAY_WEIGHTS_FIXED = np.asarray([54, 184, 18], dtype=np.uint16)
+GRAY_SHIFT = 8
 
-def numpy_color2gray(image: np.array) -> np.array:
+SEPIA_MATRIX = np.asarray([
+    [0.393, 0.769, 0.189],
+    [0.349, 0.686, 0.168],
+    [0.272, 0.534, 0.131],
+])
+
+# Fixed-point sepia matrix * 2**12, the weighted sums fit in uint32
+SEPIA_MATRIX_FIXED = np.asarray([
+    [1610, 3150, 774],
+    [1430, 2810, 688],
+    [1114, 2187, 537],
+], dtype=np.uint32)
+SEPIA_SHIFT = 12
+
+# Fractional bits kept in the rescaled sepia values, and in the sepia strength k,
+# so the strength blend is done before truncating to uint8
+SEPIA_FRACTION = 5
+STRENGTH_SHIFT = 16
+
+# Low bits dropped from the weighted sums before the rescale, so sum * 255 * 2**5 fits in uint32
+SEPIA_RESCALE_DROP = 3
+
+# Pixels per strip when filtering into a given output without chunk_pixels
+OUT_CHUNK_PIXELS = 1 << 20
+
+# Pixels per strip of the single pass with a known max value, small enough
+# for the float buffers to stay in the CPU cache
+SINGLE_PASS_CHUNK_PIXELS = 1 << 14
+
+# How sepia values above the output range are scaled down, see sepia_max
+SEPIA_RESCALES = ("max", "channels", "range")
+
+
+def image_dtype(image: np.array) -> np.dtype:
+    """The dtype of a filtered image: uint16 for uint16 images, and uint8 for all others"""
+    return np.dtype(np.uint16) if image.dtype == np.uint16 else np.dtype(np.uint8)
+
+
+def check_out(out: np.array, shape: tuple, dtype: np.dtype = np.uint8) -> np.array:
+    """Check that a given output array has the dtype and shape of the filtered image"""
+    if out.shape != shape or out.dtype != dtype:
+        raise ValueError(f"out must be a {np.dtype(dtype)} array of shape {shape}, got {out.dtype} {out.shape}")
+    return out
+
+
+def output_array(image: np.array, shape: tuple, out: np.array = None, inplace: bool = False) -> np.array:
+    """The array a filter writes its result into
+
+    Args:
+        image (np.array): the image to filter
+        shape (tuple): the shape of the filtered image
+        out (np.array): a given output array, of the dtype from image_dtype (optional)
+        inplace (bool): write into the image itself (optional)
+    Returns:
+        np.array: out, the image for inplace, or a new empty array
+    """
+    dtype = image_dtype(image)
+    if inplace:
+        if out is not None:
+            raise ValueError("give either out or inplace, not both")
+        if image.dtype != dtype or not image.flags.writeable:
+            raise ValueError("inplace needs a writable uint8 or uint16 image")
+        if image.shape != shape:
+            raise ValueError(f"inplace is not possible for an output of shape {shape}")
+        return image
+    if out is not None:
+        return check_out(out, shape, dtype)
+    return np.empty(shape, dtype=dtype)
+
+
+def copy_alpha(image: np.array, filtered_image: np.array) -> None:
+    """Copy the alpha channel (the channels after rgb) of image into the filtered image, if it has one"""
+    if image.shape[2] > 3 and not np.may_share_memory(image, filtered_image):  # in place, alpha is already there
+        filtered_image[:, :, 3:] = image[:, :, 3:]
+
+
+def check_fixed_point(image: np.array) -> None:
+    """The fixed-point kernels are sized for uint8 images"""
+    if image.dtype != np.uint8:
+        raise ValueError(f"fixed_point is only supported for uint8 images, got {image.dtype}")
+
+
+def sepia_max(image: np.array, sepia_matrix, rescale: str | float = "max"):
+    """Return the sepia value that is scaled down to the largest value of the output type
+
+    The red row of the sepia matrix has the largest weights, so the largest sepia
+    value is a red value, and a bound on it only needs the largest input values:
+
+    - 'max': the largest sepia value of the image, which needs a first pass of all
+      weighted sums, and is left to the filter (None is returned)
+    - 'channels': the sepia value of the largest value of each channel, from a pre-scan
+      of the image without float math. Equal to 'max' when one pixel holds all three
+      (e.g. a white pixel), otherwise a little larger, so the sepia is a little darker
+    - 'range': the sepia value of white, without reading the image at all
+    - a number: the largest sepia value itself, e.g. of a whole image filtered in bands.
+      It is a value of the float matrix, and is converted to the units of a fixed-point matrix
+
+    With 'channels', 'range' or a number the filters write the sepia in a single pass.
+
+    Args:
+        image (np.array): the image
+        sepia_matrix: the float or fixed-point sepia matrix
+        rescale (str | float): one of SEPIA_RESCALES, or a sepia value of the float matrix
+    Returns:
+        the largest sepia value, a float or an int for a fixed-point matrix, or None for 'max'
+    """
+    if not isinstance(rescale, str):
+        if np.issubdtype(np.asarray(sepia_matrix).dtype, np.integer):
+            # the fixed-point weights are the float weights times 2**SEPIA_SHIFT
+            return round(rescale * (1 << SEPIA_SHIFT))
+        return rescale
+    if rescale not in SEPIA_RESCALES:
+        raise ValueError(f"rescale must be one of {SEPIA_RESCALES}, got {rescale=}")
+    if rescale == "max":
+        return None
+    if rescale == "range":
+        channel_max = [np.iinfo(image_dtype(image)).max] * 3
+    elif image.shape[0] == 0 or image.shape[1] == 0:
+        channel_max = [0] * 3
+    else:
+        # over the rows first, which numpy vectorizes along the rows, then over the columns
+        channel_max = image.max(axis=0).max(axis=0)[:3].tolist()
+    # summed in python, in the same order as the filters sum the weighted channels
+    return sum(value * weight for value, weight in zip(channel_max, np.asarray(sepia_matrix)[0].tolist()))
+
+
+def check_blur_size(size: int) -> int:
+    """Check that a blur kernel size is a positive odd integer, and return its radius"""
+    if size < 1 or size % 2 == 0:
+        raise ValueError(f"size must be a positive odd integer, got {size=}")
+    return int(size) // 2
+
+
+def numpy_color2gray(
+        image: np.array,
+        fixed_point: bool = False,
+        single_channel: bool = False,
+        out: np.array = None,
+        inplace: bool = False,
+) -> np.array:
     """Convert rgb pixel array to grayscale
 
     Args:
-        image (np.array)
+        image (np.array): uint8 or uint16 rgb or rgba image, the alpha channel is kept
+        fixed_point (bool): compute with integer fixed-point weights on uint16, uint8 images only (optional)
+        single_channel (bool): return a single (H, W) gray channel, instead of three equal rgb-channels (optional)
+        out (np.array): array of the image dtype to write the result into (optional)
+        inplace (bool): write the result into the image itself (optional)
     Returns:
         np.array: gray_image
     """
+    shape = image.shape[:2] if single_channel else image.shape
+    gray_image = output_array(image, shape, out, inplace)
 
-    # Weighted sum with weights (r,g,b) = (0.21, 0.72, 0.07)
-    weights = np.asarray([0.21, 0.72, 0.07])
-    gray_image = np.dot(image[:, :, :3], weights)
+    if fixed_point:
+        check_fixed_point(image)
+        gray = _color2gray_fixed(image)
+    else:
+        # Weighted sum with weights (r,g,b) = (0.21, 0.72, 0.07)
+        weights = np.asarray([0.21, 0.72, 0.07])
+        gray = np.dot(image[:, :, :3], weights)
 
-    # Duplicate the weighted sum to three uniform rgb-channel values
-    gray_image = np.stack((gray_image,) * 3, axis=-1)
+    if single_channel:
+        np.copyto(gray_image, gray, casting="unsafe")  # truncating, like astype
+        return gray_image
 
-    gray_image = gray_image.astype("uint8")  # Convert to unsigned 8 bit ints
+    # Duplicate the weighted sum to three uniform rgb-channel values
+    np.copyto(gray_image[:, :, :3], gray[:, :, None], casting="unsafe")
+    copy_alpha(image, gray_image)
     return gray_image
 
 
-def numpy_color2sepia(image: np.array, k: float = 1) -> np.array:
+def numpy_color2sepia(
+        image: np.array,
+        k: float = 1,
+        chunk_pixels: int = None,
+        fixed_point: bool = False,
+        out: np.array = None,
+        inplace: bool = False,
+        rescale: str | float = "max",
+) -> np.array:
     """Convert rgb pixel array to sepia
 
     Args:
         image (np.array)
         k (float): amount of sepia (optional)
+        chunk_pixels (int): if given, process the image in strips of about this many pixels (optional)
+        fixed_point (bool): compute with integer fixed-point weights on uint32, uint8 images only (optional)
+        out (np.array): array of the image shape and dtype to write the result into, e.g. a np.memmap (optional)
+        inplace (bool): write the result into the image itself (optional)
+        rescale (str | float): how sepia values above the output range are scaled down,
+            'max', 'channels', 'range' or the largest sepia value, see sepia_max (optional)
 
     The amount of sepia is given as a fraction, k=0 yields no sepia while
     k=1 yields full sepia.
@@ -37,6 +206,21 @@ def numpy_color2sepia(image: np.array, k: float = 1) -> np.array:
     (note: implementing 'k' is a bonus task,
         you may ignore it)
 
+    Without `chunk_pixels` the whole image is transformed at once, which needs
+    several float64 copies of the image. With `chunk_pixels` the image is streamed
+    strip by strip through a small fixed buffer into the preallocated output,
+    giving the same result. With `out` or `inplace` the image is always streamed,
+    by default in strips of OUT_CHUNK_PIXELS pixels, so memory-mapped images larger
+    than RAM can be filtered. With a rescale other than 'max' the max value is
+    known up front, and the final values are written in a single pass over strips
+    of SINGLE_PASS_CHUNK_PIXELS pixels.
+
+    With `fixed_point` the sepia matrix, the rescale and the strength are
+    computed with integers, which is within +-1 of the float result.
+
+    uint16 images are rescaled to the uint16 range, and give uint16 sepia images.
+    The alpha channel of rgba images is kept.
+
     Returns:
         np.array: sepia_image
     """
@@ -44,24 +228,199 @@ def numpy_color2sepia(image: np.array, k: float = 1) -> np.array:
     if not 0 <= k <= 1:
         raise ValueError(f"k must be in [0-1], got {k=}")
 
-    # Create sepia weights
-    sepia_matrix = np.asarray([
-        [0.393, 0.769, 0.189],
-        [0.349, 0.686, 0.168],
-        [0.272, 0.534, 0.131],
-    ])
+    # The sepia weights
+    sepia_matrix = SEPIA_MATRIX
+
+    streamed = out is not None or inplace
+    sepia_image = output_array(image, image.shape, out, inplace)
+
+    if fixed_point:
+        check_fixed_point(image)
+        if chunk_pixels is not None:
+            raise ValueError("chunk_pixels is not supported with fixed_point")
+    if sepia_image.size == 0:  # no pixels, and no max value
+        return sepia_image
+
+    if fixed_point:
+        return _color2sepia_fixed(image, k, sepia_image, sepia_max(image, SEPIA_MATRIX_FIXED, rescale))
+
+    # the largest sepia value, None if it is found from the sepia values below
+    max_value = sepia_max(image, sepia_matrix, rescale)
+
+    if streamed or chunk_pixels is not None:
+        return _color2sepia_chunked(
+            image, k, sepia_matrix, chunk_pixels or OUT_CHUNK_PIXELS, sepia_image, max_value
+        )
+
+    if max_value is not None:
+        # the final values are written in a single pass over small strips
+        return _color2sepia_chunked(image, k, sepia_matrix, SINGLE_PASS_CHUNK_PIXELS, sepia_image, max_value)
 
     # Apply the sepia filter
-    sepia_image = np.dot(image[:, :, :3], sepia_matrix.T)  # 3 first channels (rgb) if more than 3
+    sepia = np.dot(image[:, :, :3], sepia_matrix.T)  # 3 first channels (rgb) if more than 3
 
-    # Check for overflow with uint8
-    max_value = np.max(sepia_image)
-    if max_value > 255:  # overflow with uint8, scale all down from max value
-        scale = 255 / max_value
-        sepia_image *= scale
+    # Check for overflow of the output type (255 for uint8)
+    limit = np.iinfo(sepia_image.dtype).max
+    max_value = np.max(sepia)
+    if max_value > limit:  # overflow, scale all down from max value
+        scale = limit / max_value
+        sepia *= scale
 
     # Implement sepia scaling variable k:
-    sepia_image = k * sepia_image + (1 - k) * image[:, :, :3]
+    sepia = k * sepia + (1 - k) * image[:, :, :3]
+
+    # Convert back into the image type (truncating, like astype)
+    np.copyto(sepia_image[:, :, :3], sepia, casting="unsafe")
+    copy_alpha(image, sepia_image)
+    return sepia_image
+
+
+def _color2sepia_chunked(
+        image: np.array,
+        k: float,
+        sepia_matrix: np.array,
+        chunk_pixels: int,
+        sepia_image: np.array,
+        max_value: float = None,
+) -> np.array:
+    """Two-pass sepia over strips of rows, see numpy_color2sepia
+
+    The first pass only finds the maximum sepia value, and is skipped when
+    max_value is given. The second pass recomputes each strip, scales and
+    blends it, and writes it into sepia_image.
+    """
+    if chunk_pixels < 1:
+        raise ValueError(f"chunk_pixels must be positive, got {chunk_pixels=}")
+
+    height, width = image.shape[:2]
+    rows = max(1, chunk_pixels // max(width, 1))  # rows per strip, at least one
+
+    # Fixed size buffers, reused for every strip
+    sepia_buffer = np.empty((rows, width, 3))
+    blend_buffer = np.empty((rows, width, 3)) if k != 1 else None
+
+    # First pass: find the maximum sepia value
+    if max_value is None:
+        max_value = 0
+        for start in range(0, height, rows):
+            strip = image[start:start + rows, :, :3]
+            sepia_strip = sepia_buffer[:strip.shape[0]]
+            np.matmul(strip, sepia_matrix.T, out=sepia_strip)
+            max_value = max(max_value, sepia_strip.max())
+
+    # Second pass: scale, blend and write each strip into the output
+    limit = np.iinfo(sepia_image.dtype).max
+    for start in range(0, height, rows):
+        strip = image[start:start + rows, :, :3]
+        sepia_strip = sepia_buffer[:strip.shape[0]]
+        np.matmul(strip, sepia_matrix.T, out=sepia_strip)
+
+        if max_value > limit:  # overflow, scale all down from max value
+            sepia_strip *= limit / max_value
+
+        # Same operations as the whole-image version, so the result is identical
+        if blend_buffer is not None:
+            blend_strip = blend_buffer[:strip.shape[0]]
+            sepia_strip *= k
+            np.multiply(strip, 1 - k, out=blend_strip)
+            sepia_strip += blend_strip
+
+        # Convert into the image type (truncating, like astype)
+        np.copyto(sepia_image[start:start + rows, :, :3], sepia_strip, casting="unsafe")
+        copy_alpha(image[start:start + rows], sepia_image[start:start + rows])
+
+    return sepia_image
+
+
+def _color2gray_fixed(image: np.array) -> np.array:
+    """Fixed-point grayscale, see numpy_color2gray"""
+    r, g, b = image[:, :, 0], image[:, :, 1], image[:, :, 2]
+
+    # Weighted sum on uint16, at most 255 * 2**8
+    gray_image = np.multiply(r, GRAY_WEIGHTS_FIXED[0], dtype=np.uint16)
+    gray_image += g * GRAY_WEIGHTS_FIXED[1]
+    gray_image += b * GRAY_WEIGHTS_FIXED[2]
+    gray_image >>= GRAY_SHIFT
+    return gray_image
+
+
+def _color2sepia_fixed(image: np.array, k: float, out: np.array, max_value: int = None) -> np.array:
+    """Fixed-point sepia, see numpy_color2sepia, written as uint8 into out
+
+    max_value is the largest weighted sum to rescale by, found from the sums if not given.
+    """
+    r, g, b = image[:, :, 0], image[:, :, 1], image[:, :, 2]
+
+    # Weighted sums on uint32, at most 255 * 5534
+    sepia_image = np.empty(image.shape[:2] + (3,), dtype=np.uint32)
+    for c in range(3):
+        channel = sepia_image[:, :, c]
+        np.multiply(r, SEPIA_MATRIX_FIXED[c, 0], out=channel, dtype=np.uint32)
+        channel += g * SEPIA_MATRIX_FIXED[c, 1]
+        channel += b * SEPIA_MATRIX_FIXED[c, 2]
+
+    # Check for overflow with uint8, scale all down from max value.
+    # The result keeps SEPIA_FRACTION fractional bits
+    if max_value is None:
+        max_value = sepia_image.max()
+    if max_value > 255 << SEPIA_SHIFT:
+        sepia_image >>= SEPIA_RESCALE_DROP
+        sepia_image *= np.uint32(255 << SEPIA_FRACTION)
+        sepia_image //= max_value >> SEPIA_RESCALE_DROP
+    else:
+        sepia_image >>= SEPIA_SHIFT - SEPIA_FRACTION
+
+    # Implement sepia scaling variable k, as a fraction of 2**16
+    if k != 1:
+        k_fixed = np.uint32(round(k * (1 << STRENGTH_SHIFT)))
+        sepia_image *= k_fixed
+        sepia_image += (image[:, :, :3] << np.uint32(SEPIA_FRACTION)) * ((1 << STRENGTH_SHIFT) - k_fixed)
+        sepia_image >>= STRENGTH_SHIFT
+
+    sepia_image >>= SEPIA_FRACTION
+    np.copyto(out[:, :, :3], sepia_image, casting="unsafe")
+    copy_alpha(image, out)
+    return out
+
+
+def numpy_blur(image: np.array, size: int = 3, out: np.array = None, inplace: bool = False) -> np.array:
+    """Blur pixel array with the mean of the size x size neighbourhood of each pixel
+
+    The neighbourhood sums are read from a summed-area table, four lookups per
+    pixel for any kernel size. The table is kept as uint32 (uint64 for uint16 images)
+    which may overflow, but the differences wrap around to the exact sums, which are
+    at most 65535 * size**2. Pixels outside the image are taken from the closest edge,
+    and every channel is blurred.
+
+    Args:
+        image (np.array)
+        size (int): the width and height of the kernel, a positive odd integer (optional)
+        out (np.array): array of the image shape and dtype to write the result into (optional)
+        inplace (bool): write the result into the image itself (optional)
+    Returns:
+        np.array: blurred_image
+    """
+    radius = check_blur_size(size)
+    if image.size == 0:  # no pixels, and no edge to pad with
+        return output_array(image, image.shape, out, inplace)
+    area = size * size
+    height, width = image.shape[:2]
+    table_dtype = np.uint64 if image.dtype == np.uint16 else np.uint32
+
+    padded = np.pad(image, ((radius, radius), (radius, radius), (0, 0)), mode="edge")
+    # table[i, j] is the sum of padded[:i, :j], with a zero first row and column
+    table = np.zeros((padded.shape[0] + 1, padded.shape[1] + 1, image.shape[2]), dtype=table_dtype)
+    np.cumsum(padded, axis=0, dtype=table_dtype, out=table[1:, 1:])
+    np.cumsum(table[1:, 1:], axis=1, dtype=table_dtype, out=table[1:, 1:])
+
+    sums = table[size:size + height, size:size + width] - table[:height, size:size + width]
+    sums -= table[size:size + height, :width]
+    sums += table[:height, :width]
+    # the rounded mean
+    sums += area // 2
+    sums //= area
 
-    # Convert back into uint8
-    return sepia_image.astype("uint8")
+    # the table holds a copy of the image, so the image itself can be written
+    blurred_image = output_array(image, image.shape, out, inplace)
+    np.copyto(blurred_image, sums, casting="unsafe")
+    return blurred_image
@@ -0,0 +1,230 @@
+"""multi-core (numba parallel) filters
+
+The image is split into horizontal tiles of ``tile_rows`` rows,
+and the tiles are distributed over all available threads with ``numba.prange``.
+"""
+from __future__ import annotations
+
+from contextlib import contextmanager
+
+import numba
+import numpy as np
+from numba import jit, prange, types
+
+from .numba_filters import IMAGE_TYPES, UINT16_IMAGE_TYPES, _blur_rows
+from .numpy_filters import check_blur_size, output_array, sepia_max
+
+# Number of image rows in one tile, small enough for a tile to stay in cache
+TILE_ROWS = 64
+
+
+@jit(nopython=True, nogil=True, parallel=True, cache=True)
+def _color2gray_tiles(image: np.array, gray_image: np.array, tile_rows: int) -> None:
+    """Write the grayscale of image into gray_image, one row tile per thread"""
+    height, width = image.shape[0], image.shape[1]
+    n_tiles = (height + tile_rows - 1) // tile_rows
+
+    for tile in prange(n_tiles):  # tiles are spread over the threads
+        for h in range(tile * tile_rows, min(height, (tile + 1) * tile_rows)):  # height-values in this tile
+            for w in range(width):  # width-values
+                # Weighted sum with weights (r,g,b) = (0.21, 0.72, 0.07)
+                gray = 0.21 * image[h, w, 0] + 0.72 * image[h, w, 1] + 0.07 * image[h, w, 2]
+                for c in range(gray_image.shape[2]):
+                    # the rgb-channels are gray, the alpha channel is kept
+                    gray_image[h, w, c] = gray if c < 3 else image[h, w, c]
+
+
+@jit(nopython=True, nogil=True, parallel=True, cache=True)
+def _sepia_max_tiles(image: np.array, sepia_matrix: np.array, tile_rows: int) -> float:
+    """Return the largest sepia value of the image, found tile by tile"""
+    height, width = image.shape[0], image.shape[1]
+    n_tiles = (height + tile_rows - 1) // tile_rows
+    tile_max = np.zeros(n_tiles)
+
+    for tile in prange(n_tiles):
+        current_max = 0.0
+        for h in range(tile * tile_rows, min(height, (tile + 1) * tile_rows)):
+            for w in range(width):
+                r, g, b = image[h, w, 0], image[h, w, 1], image[h, w, 2]
+                for c in range(3):
+                    value = r * sepia_matrix[c, 0] + g * sepia_matrix[c, 1] + b * sepia_matrix[c, 2]
+                    if value > current_max:
+                        current_max = value
+        tile_max[tile] = current_max
+
+    return tile_max.max()
+
+
+@jit(nopython=True, nogil=True, parallel=True, cache=True)
+def _color2sepia_tiles(
+        image: np.array, sepia_image: np.array, sepia_matrix: np.array, scale: float, k: float, tile_rows: int
+) -> None:
+    """Write the scaled sepia of image, blended with strength k, into sepia_image, one row tile per thread"""
+    height, width = image.shape[0], image.shape[1]
+    n_tiles = (height + tile_rows - 1) // tile_rows
+
+    for tile in prange(n_tiles):
+        for h in range(tile * tile_rows, min(height, (tile + 1) * tile_rows)):
+            for w in range(width):
+                r, g, b = image[h, w, 0], image[h, w, 1], image[h, w, 2]
+                for c in range(3):
+                    value = (r * sepia_matrix[c, 0] + g * sepia_matrix[c, 1] + b * sepia_matrix[c, 2]) * scale
+                    sepia_image[h, w, c] = k * value + (1 - k) * image[h, w, c]
+                for c in range(3, sepia_image.shape[2]):  # the alpha channel is kept
+                    sepia_image[h, w, c] = image[h, w, c]
+
+
+@jit(nopython=True, nogil=True, parallel=True, cache=True)
+def _blur_tiles(image: np.array, blurred_image: np.array, radius: int, tile_rows: int) -> None:
+    """Write the box blur of image into blurred_image, one row tile per thread"""
+    height = image.shape[0]
+    n_tiles = (height + tile_rows - 1) // tile_rows
+
+    for tile in prange(n_tiles):
+        # each tile starts its own running column sums
+        _blur_rows(image, blurred_image, radius, tile * tile_rows, min(height, (tile + 1) * tile_rows))
+
+
+@contextmanager
+def _threads(n_threads: int | None):
+    """Run the block with n_threads numba threads, defaults to all cores, and restore the previous number after"""
+    previous = numba.get_num_threads()
+    numba.set_num_threads(numba.config.NUMBA_NUM_THREADS if n_threads is None else n_threads)
+    try:
+        yield
+    finally:
+        numba.set_num_threads(previous)
+
+
+def parallel_color2gray(
+        image: np.array,
+        tile_rows: int = TILE_ROWS,
+        n_threads: int = None,
+        single_channel: bool = False,
+        out: np.array = None,
+        inplace: bool = False,
+) -> np.array:
+    """Convert rgb pixel array to grayscale, using all cores
+
+    Args:
+        image (np.array): uint8 or uint16 rgb or rgba image, the alpha channel is kept
+        tile_rows (int): number of rows in each tile (optional)
+        n_threads (int): number of threads to use, defaults to all cores (optional)
+        single_channel (bool): return a single (H, W) gray channel, instead of equal rgb-channels (optional)
+        out (np.array): array of the output shape and image dtype to write the result into (optional)
+        inplace (bool): write the result into the image itself (optional)
+    Returns:
+        np.array: gray_image
+    """
+    if tile_rows < 1:
+        raise ValueError(f"tile_rows must be positive, got {tile_rows=}")
+
+    shape = image.shape[:2] if single_channel else image.shape
+    gray_image = output_array(image, shape, out, inplace)
+    with _threads(n_threads):
+        _color2gray_tiles(image, gray_image[:, :, None] if single_channel else gray_image, tile_rows)
+    return gray_image
+
+
+def parallel_color2sepia(
+        image: np.array,
+        k: float = 1,
+        tile_rows: int = TILE_ROWS,
+        n_threads: int = None,
+        out: np.array = None,
+        inplace: bool = False,
+        rescale: str | float = "max",
+) -> np.array:
+    """Convert rgb pixel array to sepia, using all cores
+
+    The maximum sepia value is found in a first parallel pass over the tiles (with rescale='max'),
+    and the scaled and blended values are written directly in the image type in a second pass.
+
+    Args:
+        image (np.array): uint8 or uint16 rgb or rgba image, the alpha channel is kept
+        k (float): amount of sepia, in [0-1] (optional)
+        tile_rows (int): number of rows in each tile (optional)
+        n_threads (int): number of threads to use, defaults to all cores (optional)
+        out (np.array): array of the image shape and dtype to write the result into (optional)
+        inplace (bool): write the result into the image itself (optional)
+        rescale (str | float): how sepia values above the output range are scaled down,
+            'max', 'channels', 'range' or the largest sepia value, see numpy_filters.sepia_max (optional)
+    Returns:
+        np.array: sepia_image
+    """
+    if not 0 <= k <= 1:
+        raise ValueError(f"k must be in [0-1], got {k=}")
+    if tile_rows < 1:
+        raise ValueError(f"tile_rows must be positive, got {tile_rows=}")
+
+    sepia_matrix = np.asarray([
+        [0.393, 0.769, 0.189],
+        [0.349, 0.686, 0.168],
+        [0.272, 0.534, 0.131],
+    ])
+
+    sepia_image = output_array(image, image.shape, out, inplace)
+    current_max = sepia_max(image, sepia_matrix, rescale)
+    if sepia_image.size == 0:  # no pixels, and no max value
+        return sepia_image
+
+    with _threads(n_threads):
+        # Check for overflow (>255 for uint8), scale all values down with the max value
+        limit = np.iinfo(sepia_image.dtype).max
+        if current_max is None:
+            current_max = _sepia_max_tiles(image, sepia_matrix, tile_rows)
+        scale = limit / current_max if current_max > limit else 1.0
+        _color2sepia_tiles(image, sepia_image, sepia_matrix, scale, float(k), tile_rows)
+    return sepia_image
+
+
+def parallel_blur(
+        image: np.array,
+        size: int = 3,
+        tile_rows: int = TILE_ROWS,
+        n_threads: int = None,
+        out: np.array = None,
+        inplace: bool = False,
+) -> np.array:
+    """Blur pixel array with the mean of the size x size neighbourhood of each pixel, using all cores
+
+    Each tile keeps running sums of its own, see numba_filters.numba_blur, which costs
+    an extra size rows of reading per tile.
+
+    Args:
+        image (np.array)
+        size (int): the width and height of the kernel, a positive odd integer (optional)
+        tile_rows (int): number of rows in each tile (optional)
+        n_threads (int): number of threads to use, defaults to all cores (optional)
+        out (np.array): array of the image shape and dtype to write the result into (optional)
+        inplace (bool): write the result into the image itself (optional)
+    Returns:
+        np.array: blurred_image
+    """
+    radius = check_blur_size(size)
+    if tile_rows < 1:
+        raise ValueError(f"tile_rows must be positive, got {tile_rows=}")
+
+    blurred_image = output_array(image, image.shape, out, inplace)
+    if np.may_share_memory(image, blurred_image):
+        # the tiles read the rows around them, which other tiles write
+        image = image.copy()
+    with _threads(n_threads):
+        _blur_tiles(image, blurred_image, radius, tile_rows)
+    return blurred_image
+
+
+def precompile() -> None:
+    """Compile the tile kernels for the common image layouts, see numba_filters.precompile"""
+    matrix_type = types.Array(types.float64, 2, "C")
+    for image_types, out_type in [
+        (IMAGE_TYPES, types.Array(types.uint8, 3, "C")),
+        (UINT16_IMAGE_TYPES, types.Array(types.uint16, 3, "C")),
+    ]:
+        for image_type in image_types:
+            _color2gray_tiles.compile((image_type, out_type, types.int64))
+            _sepia_max_tiles.compile((image_type, matrix_type, types.int64))
+            _color2sepia_tiles.compile(
+                (image_type, out_type, matrix_type, types.float64, types.float64, types.int64)
+            )
+            _blur_tiles.compile((image_type, out_type, types.int64, types.int64))
@@ -0,0 +1,146 @@
+"""Filter pipeline: resize, colour filter, sepia strength and encoding in one chain"""
+from __future__ import annotations
+
+import inspect
+from io import BytesIO
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+import in3110_instapy
+
+from . import io
+
+
+class Pipeline:
+    """A chain of resize, colour filter, sepia strength blend and output encoding
+
+    The chain avoids the intermediate full-frame copies of doing each step on its own:
+
+    - JPEG images are scaled down by the decoder itself (``Image.draft``), so the full
+      size frame is never decoded, and PIL only resizes the rest of the way
+    - the filter reads the decoded frame once and writes the final uint8 frame,
+      with the sepia strength blended in the same pass (numba, parallel and cython)
+    - the uint8 frame goes straight to the encoder, without float or astype copies
+
+    Example:
+        >>> pipeline = Pipeline("color2sepia", "numba", scale=0.5, strength=0.7)
+        >>> pipeline("test.jpg", "test_filtered.jpg")
+    """
+
+    def __init__(
+            self,
+            filter: str = "color2gray",
+            implementation: str = "numba",
+            scale: float = 1,
+            strength: float = 1,
+            single_channel: bool = False,
+    ):
+        """
+        Args:
+            filter (str): the filter name ('color2gray' or 'color2sepia')
+            implementation (str): the filter implementation
+            scale (float): scale factor to resize the image
+            strength (float): the sepia strength k, in [0-1]
+            single_channel (bool): make single channel ('L' mode) gray images
+        """
+        if scale <= 0:
+            raise ValueError(f"scale must be positive, got {scale=}")
+        if filter == "color2sepia" and not 0 <= strength <= 1:
+            raise ValueError(f"strength must be in [0-1], got {strength=}")
+        if single_channel and filter != "color2gray":
+            raise ValueError(f"single_channel is only valid for the color2gray filter, got {filter=}")
+
+        self.filter = filter
+        self.implementation = implementation
+        self.scale = scale
+        self.strength = strength
+        self.single_channel = single_channel
+        self.filter_function = in3110_instapy.get_filter(filter, implementation)
+
+        # whether the filter can write into a given output array
+        try:
+            self.accepts_out = "out" in inspect.signature(self.filter_function).parameters
+        except (TypeError, ValueError):  # no signature, e.g. some compiled functions
+            self.accepts_out = False
+
+    def decode(self, file: str) -> tuple:
+        """Open and decode an image file
+
+        JPEG images are scaled down while decoding, when the pipeline scales them down.
+        `.npy` files are memory-mapped, without decoding.
+
+        Returns:
+            tuple: the decoded PIL image (or memory-mapped array), and the size to resize it to
+        """
+        if Path(file).suffix.lower() == ".npy":
+            image = io.read_image(file)
+            h, w = image.shape[:2]
+            return image, (int(self.scale * w), int(self.scale * h))
+
+        image = Image.open(file)
+        w, h = image.size
+        new_size = int(self.scale * w), int(self.scale * h)
+        if self.scale != 1:
+            # let the JPEG decoder scale down by up to 1/8 while decoding (does nothing for other formats)
+            image.draft(image.mode, new_size)
+        image.load()
+        return image, new_size
+
+    def resize(self, image: Image.Image | np.array, new_size: tuple) -> np.array:
+        """Resize a decoded image the rest of the way, to an rgb array"""
+        if isinstance(image, np.ndarray):
+            if image.shape[1::-1] == new_size:
+                return image
+            image = Image.fromarray(image)
+        if image.size != new_size:
+            image = image.resize(new_size)
+        return np.asarray(image)
+
+    def read(self, file: str) -> np.array:
+        """Decode and resize an image file to an rgb array"""
+        return self.resize(*self.decode(file))
+
+    def apply(self, image: np.array, out: np.array = None) -> np.array:
+        """Run the filter on an rgb array, blending in the sepia strength
+
+        Args:
+            image (np.array): the image to filter
+            out (np.array): array to write the result into, when the filter supports it (optional)
+        Returns:
+            np.array: the filtered image, out if it was written into
+        """
+        options = {}
+        if self.single_channel:
+            options["single_channel"] = True
+        if out is not None and self.accepts_out:
+            options["out"] = out
+
+        if self.filter == "color2sepia":
+            return self.filter_function(image, self.strength, **options)
+        return self.filter_function(image, **options)
+
+    def encode(self, image: np.array, format: str = "PNG") -> bytes:
+        """Encode a filtered rgb array to the bytes of an image file format"""
+        buffer = BytesIO()
+        Image.fromarray(image).save(buffer, format=format)
+        return buffer.getvalue()
+
+    def write(self, image: np.array, out_file: str) -> None:
+        """Encode and save a filtered rgb array, `.npy` and `.raw` files are saved without encoding"""
+        io.write_image(image, out_file)
+
+    def __call__(self, file: str, out_file: str = None) -> np.array:
+        """Run the whole chain on an image file
+
+        Args:
+            file (str): the image file to filter
+            out_file (str): the file to save the result to, if given (optional)
+        Returns:
+            np.array: the filtered image
+        """
+        filtered = self.apply(self.read(file))
+        if out_file:
+            self.write(filtered, out_file)
+        return filtered
@@ -0,0 +1,99 @@
+"""Filtering many image files in one process, reading and writing on threads
+
+Where the files are slow to read, e.g. on network storage, filtering the files
+one after the other leaves the CPU idle while each file is read. Here a pool
+of threads reads (and decodes) the next images while the main thread filters
+the current one, and writes (and encodes) the filtered images in the
+background. At most `in_flight` images are read ahead and `in_flight` are
+waiting to be written, which bounds the memory use.
+
+The file reads and writes, PIL decoding and encoding, and the numba and
+cython filters release the GIL, so the threads run at the same time.
+"""
+from __future__ import annotations
+
+import time
+from collections import deque
+from itertools import islice
+from typing import Callable, Iterable, Iterator
+
+from .batch import find_images, output_files
+
+
+def prefetched(function: Callable, items: Iterable, in_flight: int, executor) -> Iterator:
+    """Yield function(item) for every item in order, computed up to in_flight items ahead
+
+    Args:
+        function (Callable): the function of each item, e.g. reading an image file
+        items (Iterable): the items
+        in_flight (int): the number of items computed ahead of the one being used
+        executor (Executor): the executor to run the function on
+    Returns:
+        Iterator: the results, in the order of the items
+    """
+    if in_flight < 1:
+        raise ValueError(f"in_flight must be positive, got {in_flight=}")
+    items = iter(items)
+    pending = deque(executor.submit(function, item) for item in islice(items, in_flight))
+    while pending:
+        result = pending.popleft().result()
+        # start on the next item before handing this one over
+        pending.extend(executor.submit(function, item) for item in islice(items, 1))
+        yield result
+
+
+def run_prefetch(
+        source: str,
+        out_dir: str,
+        implementation: str = "numba",
+        filter: str = "color2gray",
+        scale: float = 1,
+        strength: float = 1,
+        single_channel: bool = False,
+        in_flight: int = 4,
+) -> float:
+    """Filter all images in a directory or glob pattern, reading and writing on threads
+
+    Args:
+        source (str): directory or glob pattern of images to filter
+        out_dir (str): directory to save the filtered images, with the same paths relative to the source directory
+        implementation (str): the filter implementation
+        filter (str): the filter name
+        scale (float): scale factor to resize the images
+        strength (float): the sepia strength
+        single_channel (bool): make single channel gray images
+        in_flight (int): the number of images read ahead, and the number waiting to be written
+    Returns:
+        float: images per second
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    from .pipeline import Pipeline
+
+    if in_flight < 1:
+        raise ValueError(f"in_flight must be positive, got {in_flight=}")
+    files = find_images(source)
+    if not files:
+        raise FileNotFoundError(f"No images found in '{source}'")
+
+    out_files = output_files(source, files, out_dir)
+    pipeline = Pipeline(filter, implementation, scale, strength, single_channel)
+
+    start_time = time.perf_counter()
+    # the reads and writes in flight never wait for a thread
+    with ThreadPoolExecutor(max_workers=2 * in_flight) as executor:
+        writes = deque()
+        for out_file, image in zip(out_files, prefetched(pipeline.read, files, in_flight, executor)):
+            filtered = pipeline.apply(image)
+            writes.append(executor.submit(pipeline.write, filtered, out_file))
+            if len(writes) >= in_flight:
+                # wait for the oldest write, and raise its exception
+                writes.popleft().result()
+        for write in writes:
+            write.result()
+    total_time = time.perf_counter() - start_time
+
+    images_per_second = len(files) / total_time
+    print(f"Filtered {len(files)} images in {total_time:.2f}s with {in_flight} images in flight "
+          f"({images_per_second:.1f} images/s)")
+    return images_per_second
@@ -1,19 +1,35 @@
 """
 Profiling (IN4110 only)
+
+Profiles every implementation and filter at a chosen image size, with cProfile
+or line_profiler, and separates the first call (jit compiling or cache loading)
+from the steady-state time. cProfile stats can also be written as collapsed
+stacks, the input format of flame graph tools (flamegraph.pl, speedscope, inferno).
+
+Run as:
+
+    python -m in3110_instapy.profiling --size 1920x1080 --collapsed profiles/
 """
 from __future__ import annotations
 
+import argparse
 import cProfile
+import inspect
+import os
 import pstats
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from pathlib import Path
 
 import in3110_instapy
-import line_profiler
 
-from . import io
+from . import benchmark, io
 
 
-def profile_with_cprofile(filter, image, ncalls=3):
-    """Profile filter(image) with line_profiler
+def profile_with_cprofile(filter, image, ncalls=3, collapsed_file=None):
+    """Profile filter(image) with cProfile
 
     Statistics will be printed to stdout.
 
@@ -22,14 +38,71 @@ def profile_with_cprofile(filter, image, ncalls=3):
         filter (callable): filter function
         image (ndarray): image to filter
         ncalls (int): number of repetitions to measure
+        collapsed_file (str): write the collapsed stacks for a flame graph to this file (optional)
+    Returns:
+        pstats.Stats: the statistics
     """
     profiler = cProfile.Profile()
     # run `filter(image)` in the profiler
-    ...
+    for _ in range(ncalls):
+        profiler.runcall(filter, image)
     stats = pstats.Stats(profiler)
     # print the top 10 results, sorted by cumulative time
-    # (check sort_stats and print_stats docstrings)
-    ...
+    stats.sort_stats("cumulative").print_stats(10)
+
+    if collapsed_file is not None:
+        with open(collapsed_file, "w") as outfile:
+            outfile.writelines(f"{line}\n" for line in collapsed_stacks(stats))
+    return stats
+
+
+def _label(func: tuple) -> str:
+    """The flame graph frame name of a pstats function key"""
+    filename, lineno, name = func
+    if filename == "~":  # built-in functions
+        return name.replace(";", ",")
+    return f"{name} ({Path(filename).name}:{lineno})".replace(";", ",")
+
+
+def collapsed_stacks(stats: pstats.Stats) -> list:
+    """Convert profile statistics to collapsed stacks for a flame graph
+
+    cProfile only records caller and callee pairs, not whole stacks, so the stacks
+    are rebuilt from the roots down, and the time of a function called from several
+    places is split over its callers in proportion to the time spent from each one.
+
+    Args:
+        stats (pstats.Stats): the profile statistics
+    Returns:
+        list: lines of 'frame;frame;frame microseconds', the self time of each stack
+    """
+    entries = stats.stats
+    children = defaultdict(list)
+    for func, (*_, callers) in entries.items():
+        for caller in callers:
+            children[caller].append(func)
+
+    self_times = defaultdict(float)
+
+    def walk(func, stack, fraction):
+        _, _, self_time, total_time, _ = entries[func]
+        stack = stack + [_label(func)]
+        self_times[";".join(stack)] += self_time * fraction
+
+        for child in children[func]:
+            if _label(child) in stack:  # skip recursion
+                continue
+            # the share of the child's time spent when called from func
+            child_total = entries[child][3]
+            from_func = entries[child][4][func][3]
+            if child_total > 0 and from_func > 0:
+                walk(child, stack, fraction * from_func / child_total)
+
+    for func, (*_, callers) in entries.items():
+        if not callers:  # the root frames
+            walk(func, [], 1.0)
+
+    return [f"{stack} {round(seconds * 1e6)}" for stack, seconds in self_times.items() if seconds * 1e6 >= 1]
 
 
 def profile_with_line_profiler(filter, image, ncalls=3):
@@ -37,55 +110,142 @@ def profile_with_line_profiler(filter, image, ncalls=3):
 
     Statistics will be printed to stdout.
 
+    The python functions of the filter's module are measured as well, to see into helper
+    functions. Compiled functions (numba and cython) can not be measured line by line.
+
     Args:
 
         filter (callable): filter function
         image (ndarray): image to filter
         ncalls (int): number of repetitions to measure
     """
+    import line_profiler  # only needed, and installed, for line profiling
+
     # create the LineProfiler
     profiler = line_profiler.LineProfiler()
-    # tell it to measure the function we are given
-    profiler.add_function(filter)
+    # tell it to measure the function we are given, and the python helpers next to it
+    module = sys.modules[filter.__module__]
+    for function in [filter] + [f for _, f in inspect.getmembers(module, inspect.isfunction)]:
+        if function.__module__ == module.__name__:
+            profiler.add_function(function)
     # Measure filter(image)
-    ...
+    for _ in range(ncalls):
+        profiler.runcall(filter, image)
     # print statistics
-    ...
+    profiler.print_stats(stripzeros=True)
+
 
+def time_first_call(filter, image, ncalls=3) -> tuple:
+    """Time the first call of a filter, and the steady-state calls after it
 
-def run_profiles(profiler: str = "cprofile"):
+    The first call includes the jit compiling, or loading the compiled code from
+    the cache, of the numba filters.
+
+    Args:
+        filter (callable): filter function
+        image (ndarray): image to filter
+        ncalls (int): number of steady-state calls, the median is returned
+    Returns:
+        tuple: (first call time, steady-state median time) in seconds
+    """
+    start_time = time.perf_counter()
+    filter(image)
+    first_time = time.perf_counter() - start_time
+
+    steady_time = benchmark.time_filter(filter, image, warmup=0, repeats=ncalls)["median"]
+    return first_time, steady_time
+
+
+def run_profiles(
+        profiler: str = "cprofile",
+        size: tuple = (640, 480),
+        filter_names: list = None,
+        implementations: list = None,
+        ncalls: int = 3,
+        collapsed_dir: str = None,
+):
     """Run profiles of every implementation
 
     Args:
 
         profiler (str): either 'line_profiler' or 'cprofile'
+        size (tuple): the (width, height) of the image to profile
+        filter_names (list): the filters to profile, defaults to all
+        implementations (list): the implementations to profile, defaults to all
+        ncalls (int): number of repetitions to measure
+        collapsed_dir (str): directory for the collapsed stacks of each profile, cProfile only (optional)
     """
     # Select which profile function to use
     if profiler == "line_profiler":
-        profile_func = ...
+        profile_func = profile_with_line_profiler
     elif profiler.lower() == "cprofile":
-        profile_func = ...
+        profile_func = profile_with_cprofile
     else:
         raise ValueError(f"{profiler=} must be 'line_profiler' or 'cprofile'")
 
-    # construct a random 640x480 image
-    image = ...
+    # construct a random image
+    image = io.random_image(*size)
+
+    if collapsed_dir is not None:
+        os.makedirs(collapsed_dir, exist_ok=True)
 
-    filter_names = ...
-    implementations = ...
+    filter_names = filter_names or benchmark.FILTERS
+    implementations = implementations or benchmark.IMPLEMENTATIONS
     for filter_name in filter_names:
         for implementation in implementations:
             print(f"Profiling {implementation} {filter_name} with {profiler}:")
-            filter = in3110_instapy.get_filter(filter_name, implementation)  #
-            # call it once
-            filter(image)
-            profile_func(filter, image)
+            try:
+                filter = in3110_instapy.get_filter(filter_name, implementation)
+            except ImportError:  # the cython module is only available when compiled
+                print("not available (not compiled)\n")
+                continue
+            except AttributeError:  # e.g. blur is not in every implementation
+                print("not implemented\n")
+                continue
+
+            # call it once, and separate the first call from the steady state
+            first_time, steady_time = time_first_call(filter, image, ncalls)
+            print(
+                f"First call: {first_time:.4f}s, steady state: {steady_time:.4f}s "
+                f"(first-call overhead {first_time - steady_time:.4f}s)"
+            )
+
+            if profile_func is profile_with_cprofile and collapsed_dir is not None:
+                collapsed_file = Path(collapsed_dir) / f"{implementation}_{filter_name}.collapsed"
+                profile_func(filter, image, ncalls, collapsed_file=collapsed_file)
+            else:
+                profile_func(filter, image, ncalls)
+
+
+def main(argv=None):
+    """Parse the command-line and run the profiles"""
+    parser = argparse.ArgumentParser(description="Profile the image filters.")
+    parser.add_argument(
+        "--profiler", choices=["cprofile", "line_profiler", "all"], default="all", help="The profiler, defaults to all"
+    )
+    parser.add_argument("--size", default="640x480", help="Image size as WIDTHxHEIGHT, defaults to 640x480")
+    parser.add_argument("--filters", nargs="+", choices=benchmark.FILTERS, help="Filters, defaults to all")
+    parser.add_argument(
+        "--implementations", nargs="+", choices=benchmark.IMPLEMENTATIONS, help="Implementations, defaults to all"
+    )
+    parser.add_argument("--calls", type=int, default=3, help="Number of calls to measure")
+    parser.add_argument("--collapsed", help="Directory to write collapsed stacks for flame graphs (cProfile)")
+    parser.add_argument(
+        "--cold", action="store_true", help="Use an empty numba cache, so the first call includes compiling"
+    )
+    args = parser.parse_args(argv)
+
+    width, height = (int(n) for n in args.size.lower().split("x"))
+    if args.cold:
+        # numba reads the cache directory when it is imported, by the first numba filter
+        os.environ["NUMBA_CACHE_DIR"] = tempfile.mkdtemp()
+
+    profilers = ["cprofile", "line_profiler"] if args.profiler == "all" else [args.profiler]
+    for profiler in profilers:
+        print(f"Begin {profiler}")
+        run_profiles(profiler, (width, height), args.filters, args.implementations, args.calls, args.collapsed)
+        print(f"End {profiler}")
 
 
 if __name__ == "__main__":
-    print("Begin cProfile")
-    run_profiles("cprofile")
-    print("End cProfile")
-    print("Begin line_profiler")
-    run_profiles("line_profiler")
-    print("End line_profiler")
+    main()
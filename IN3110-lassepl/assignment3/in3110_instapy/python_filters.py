@@ -3,38 +3,64 @@ from __future__ import annotations
 
 import numpy as np
 
+from .numpy_filters import check_blur_size, output_array, sepia_max
 
-def python_color2gray(image: np.array) -> np.array:
+
+def python_color2gray(
+        image: np.array, single_channel: bool = False, out: np.array = None, inplace: bool = False
+) -> np.array:
     """Convert rgb pixel array to grayscale.
 
     Args:
-        image (np.array)
+        image (np.array): uint8 or uint16 rgb or rgba image, the alpha channel is kept
+        single_channel (bool): return a single (H, W) gray channel, instead of equal rgb-channels (optional)
+        out (np.array): array of the output shape and image dtype to write the result into (optional)
+        inplace (bool): write the result into the image itself (optional)
     Returns:
         np.array: gray_image
     """
 
-    gray_image = np.empty_like(image)
+    # one gray channel, or the same number of channels as the image
+    shape = image.shape[:2] if single_channel else image.shape
+    gray_image = output_array(image, shape, out, inplace)
+    channels_view = gray_image[:, :, None] if single_channel else gray_image
 
     # iterate through the pixels, and apply the grayscale transform
     for h in range(gray_image.shape[0]):  # height-values
         for w in range(gray_image.shape[1]):  # width-values
             # Weighted sum with weights (r,g,b) = (0.21, 0.72, 0.07)
-            gray_image[h, w, :] = 0.21 * image[h, w, 0] + 0.72 * image[h, w, 1] + 0.07 * image[h, w, 2]
+            channels_view[h, w, :3] = 0.21 * image[h, w, 0] + 0.72 * image[h, w, 1] + 0.07 * image[h, w, 2]
+            # the alpha channel is kept
+            channels_view[h, w, 3:] = image[h, w, 3:]
 
-    gray_image = gray_image.astype("uint8")  # convert back into unsigned 8 bit ints
     return gray_image
 
 
-def python_color2sepia(image: np.array) -> np.array:
+def python_color2sepia(
+        image: np.array, k: float = 1, out: np.array = None, inplace: bool = False, rescale: str | float = "max"
+) -> np.array:
     """Convert rgb pixel array to sepia
 
     Args:
-        image (np.array)
+        image (np.array): uint8 or uint16 rgb or rgba image, the alpha channel is kept
+        k (float): amount of sepia (optional)
+        out (np.array): array of the image shape and dtype to write the result into (optional)
+        inplace (bool): write the result into the image itself (optional)
+        rescale (str | float): how sepia values above the output range are scaled down,
+            'max', 'channels', 'range' or the largest sepia value, see numpy_filters.sepia_max (optional)
+
+    The amount of sepia is given as a fraction, k=0 yields no sepia while
+    k=1 yields full sepia.
+
     Returns:
         np.array: sepia_image
     """
 
-    sepia_image = np.empty_like(image).astype(np.float32)
+    if not 0 <= k <= 1:
+        raise ValueError(f"k must be in [0-1], got {k=}")
+
+    # The output is written directly in the image type, no float copy of the image is kept
+    sepia_image = output_array(image, image.shape, out, inplace)
 
     sepia_matrix = [
         [0.393, 0.769, 0.189],
@@ -42,33 +68,74 @@ def python_color2sepia(image: np.array) -> np.array:
         [0.272, 0.534, 0.131],
     ]
 
-    # Iterate through the pixels, applying the sepia matrix conversion
-    current_max = 0
+    # First pass: find the maximum sepia value, without storing the sepia values
+    current_max = sepia_max(image, sepia_matrix, rescale)
+    if current_max is None:
+        current_max = 0
+        for h in range(sepia_image.shape[0]):  # height-values
+            for w in range(sepia_image.shape[1]):  # width-values
+                r, g, b = image[h, w, :3]
+
+                # Take average of all rbg-values and multiply with weights in sepia_matrix
+                sepia_r = r * sepia_matrix[0][0] + g * sepia_matrix[0][1] + b * sepia_matrix[0][2]
+                sepia_g = r * sepia_matrix[1][0] + g * sepia_matrix[1][1] + b * sepia_matrix[1][2]
+                sepia_b = r * sepia_matrix[2][0] + g * sepia_matrix[2][1] + b * sepia_matrix[2][2]
+
+                # Save maximum found value for later scaling
+                new_max = max(sepia_r, sepia_g, sepia_b)
+                if new_max > current_max:
+                    current_max = new_max
+
+    # Check for overflow (>255 for uint8), then scale all values down with the max value
+    limit = np.iinfo(sepia_image.dtype).max
+    scale = limit / current_max if current_max > limit else 1
+
+    # Second pass: recompute the sepia values, scale and blend them, and write them into the output
     for h in range(sepia_image.shape[0]):  # height-values
         for w in range(sepia_image.shape[1]):  # width-values
-            r, g, b = image[h, w]
+            r, g, b = image[h, w, :3]
+            for c in range(3):  # rbg-channels
+                sepia_value = (r * sepia_matrix[c][0] + g * sepia_matrix[c][1] + b * sepia_matrix[c][2]) * scale
+                sepia_image[h, w, c] = k * sepia_value + (1 - k) * image[h, w, c]
+            # the alpha channel is kept
+            sepia_image[h, w, 3:] = image[h, w, 3:]
 
-            # Take average of all rbg-values and multiply with weights in sepia_matrix
-            sepia_r = r * sepia_matrix[0][0] + g * sepia_matrix[0][1] + b * sepia_matrix[0][2]
-            sepia_g = r * sepia_matrix[1][0] + g * sepia_matrix[1][1] + b * sepia_matrix[1][2]
-            sepia_b = r * sepia_matrix[2][0] + g * sepia_matrix[2][1] + b * sepia_matrix[2][2]
+    return sepia_image
 
-            # Create new sepia image values
-            sepia_image[h, w] = np.asarray([sepia_r, sepia_g, sepia_b])
 
-            # Save maximum found value for later scaling
-            new_max = max(sepia_r, sepia_g, sepia_b)
-            if new_max > current_max:
-                current_max = new_max
+def python_blur(image: np.array, size: int = 3, out: np.array = None, inplace: bool = False) -> np.array:
+    """Blur pixel array with the mean of the size x size neighbourhood of each pixel
 
-    # Then check for uint8 overflow (>255)
-    if current_max > 255:
-        # Then scale all values for uint8 overflow (over 255) with the max value with new loop
-        scale = 255 / current_max
-        for h in range(sepia_image.shape[0]):  # height-values
-            for w in range(sepia_image.shape[1]):  # width-values
-                for c in range(3):  # rbg-channels
-                    sepia_image[h, w, c] = sepia_image[h, w, c] * scale
+    Pixels outside the image are taken from the closest edge, and every channel is blurred.
 
-    # Convert back to unsigned 8 bit ints
-    return sepia_image.astype("uint8")
+    Args:
+        image (np.array)
+        size (int): the width and height of the kernel, a positive odd integer (optional)
+        out (np.array): array of the image shape and dtype to write the result into (optional)
+        inplace (bool): write the result into the image itself (optional)
+    Returns:
+        np.array: blurred_image
+    """
+    radius = check_blur_size(size)
+    area = size * size
+    height, width, channels = image.shape
+
+    blurred_image = output_array(image, image.shape, out, inplace)
+    if np.may_share_memory(image, blurred_image):
+        # the neighbours are read after a pixel is written
+        image = image.copy()
+
+    for h in range(height):  # height-values
+        # the neighbouring rows and columns, clamped to the edges
+        rows = [min(max(y, 0), height - 1) for y in range(h - radius, h + radius + 1)]
+        for w in range(width):  # width-values
+            columns = [min(max(x, 0), width - 1) for x in range(w - radius, w + radius + 1)]
+            for c in range(channels):
+                total = 0
+                for y in rows:
+                    for x in columns:
+                        total += int(image[y, x, c])
+                # the rounded mean
+                blurred_image[h, w, c] = (total + area // 2) // area
+
+    return blurred_image
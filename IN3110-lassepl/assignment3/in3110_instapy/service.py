@@ -0,0 +1,489 @@
+"""HTTP service for the image filters, with request batching
+
+Uploaded images are decoded on a thread pool, and queued for filtering. A
+collector task takes the queued images, up to `max_batch` of them or whatever
+arrives within `max_wait` seconds of the first, and sends them to a pool of
+worker processes as one batch per filter and strength, so many small requests
+pay the pickling and worker round trip once. In the worker, gray images of the
+same width are stacked into one array and filtered with a single call, which
+gives the same result as the gray filter works pixel by pixel. With the 'auto'
+implementation, only images that get the same implementation for their size
+are stacked, as the implementations can round a few pixels differently. The sepia filters
+rescale by the maximum of the whole image, so they filter each image on its own.
+
+At most `max_pending` requests are in the service at once, any more are
+rejected with 503 Service Unavailable, instead of queueing without bound.
+Latency and throughput are served as JSON from /metrics.
+
+The HTTP layer needs the optional dependencies (FastAPI, uvicorn and python-multipart).
+Run as:
+
+    pip3 install '.[service]'  # in the assignment3 directory
+    python3 -m in3110_instapy.service --port 8000
+    curl -F file=@rain.jpg 'localhost:8000/filter/color2sepia?strength=0.7' -o rain_sepia.png
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import multiprocessing
+import os
+import time
+from collections import defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from io import BytesIO
+
+import numpy as np
+from PIL import Image, UnidentifiedImageError
+
+import in3110_instapy
+
+from .batch import _init_worker
+from .pipeline import Pipeline
+
+FILTERS = ["color2gray", "color2sepia"]
+
+# Images per batch, and seconds to wait for more images after the first one
+MAX_BATCH = 32
+MAX_WAIT = 0.005
+
+# Requests in the service at once, before new ones are rejected
+MAX_PENDING = 256
+
+# Requests kept for the latency and throughput metrics
+METRICS_WINDOW = 1000
+
+# The pipelines of a worker process, by filter, implementation, strength and single_channel
+_pipelines = {}
+
+
+class Overloaded(RuntimeError):
+    """Raised when a request arrives while the service has max_pending requests"""
+
+
+def decode_image(data: bytes) -> np.array:
+    """Decode the bytes of an uploaded image file to an rgb (or rgba) array"""
+    try:
+        image = Image.open(BytesIO(data))
+        image.load()
+    except (UnidentifiedImageError, OSError) as error:
+        raise ValueError(f"could not decode the image: {error}") from error
+    if image.mode not in ("RGB", "RGBA"):
+        image = image.convert("RGB")
+    return np.asarray(image)
+
+
+def filter_batch(images: list, filter: str, implementation: str, strength: float, single_channel: bool) -> list:
+    """Filter a batch of images in a worker process
+
+    Gray images with the same width, channels and implementation are stacked on top
+    of each other and filtered with one call, then split up again. Sepia images are filtered one
+    by one, as the sepia rescale depends on the maximum of the whole image.
+
+    Args:
+        images (list): the images to filter
+        filter (str): the filter name
+        implementation (str): the filter implementation
+        strength (float): the sepia strength
+        single_channel (bool): make single channel gray images
+    Returns:
+        list: the filtered images, in the same order
+    """
+    key = (filter, implementation, strength, single_channel)
+    if key not in _pipelines:
+        _pipelines[key] = Pipeline(filter, implementation, strength=strength, single_channel=single_channel)
+    pipeline = _pipelines[key]
+
+    if filter != "color2gray":
+        return [pipeline.apply(image) for image in images]
+
+    # the images that can be stacked, by width, channels and implementation
+    groups = defaultdict(list)
+    for index, image in enumerate(images):
+        name, options = _gray_implementation(implementation, image)
+        groups[image.shape[1:], image.dtype.str, name, tuple(sorted(options.items()))].append(index)
+
+    results = [None] * len(images)
+    for (_, _, name, options), indices in groups.items():
+        options = dict(options)
+        if single_channel:
+            options["single_channel"] = True
+        filter_function = in3110_instapy.get_filter("color2gray", name)
+        if len(indices) == 1:
+            results[indices[0]] = filter_function(images[indices[0]], **options)
+            continue
+        stacked = filter_function(np.concatenate([images[i] for i in indices]), **options)
+        # split at the cumulative heights
+        heights = np.cumsum([images[i].shape[0] for i in indices])[:-1]
+        for index, result in zip(indices, np.split(stacked, heights)):
+            results[index] = result
+    return results
+
+
+def _gray_implementation(implementation: str, image: np.array) -> tuple:
+    """The gray filter implementation and its options for an image, with 'auto' resolved for the image size
+
+    The implementations can round a few pixels differently, and 'auto' may choose
+    another one for a stack than for its images, so a stack is filtered with the
+    implementation each of its images gets on its own.
+    """
+    if implementation != "auto":
+        return implementation, {}
+    from . import auto_filters
+
+    return auto_filters.choose("color2gray", image.shape, image.dtype)
+
+
+class Metrics:
+    """Request counts, batch sizes, and the latency and throughput of the last requests"""
+
+    def __init__(self, window: int = METRICS_WINDOW):
+        self.start_time = time.perf_counter()
+        self.requests = 0
+        self.rejected = 0
+        self.errors = 0
+        self.batches = 0
+        self.batched_images = 0
+        # (finish time, latency) of the last requests
+        self.recent = deque(maxlen=window)
+
+    def record_request(self, start_time: float) -> None:
+        """Record a finished request, started at start_time (time.perf_counter)"""
+        finish_time = time.perf_counter()
+        self.requests += 1
+        self.recent.append((finish_time, finish_time - start_time))
+
+    def record_batch(self, size: int) -> None:
+        """Record a batch of images sent to the workers"""
+        self.batches += 1
+        self.batched_images += size
+
+    def summary(self, pending: int = 0) -> dict:
+        """Return the metrics as a dict
+
+        Args:
+            pending (int): the number of requests in the service
+        Returns:
+            dict: the counts, mean batch size, latency percentiles (ms) and requests per second
+        """
+        latencies = np.array([latency for _, latency in self.recent]) * 1000
+        # the throughput over the recent requests, not over idle time since the start
+        if len(self.recent) > 1:
+            span = self.recent[-1][0] - self.recent[0][0]
+            requests_per_s = (len(self.recent) - 1) / span if span > 0 else 0.0
+        else:
+            requests_per_s = 0.0
+        return {
+            "uptime_s": time.perf_counter() - self.start_time,
+            "requests": self.requests,
+            "rejected": self.rejected,
+            "errors": self.errors,
+            "pending": pending,
+            "batches": self.batches,
+            "mean_batch_size": self.batched_images / self.batches if self.batches else 0.0,
+            "latency_ms": {
+                f"p{q}": float(np.percentile(latencies, q)) if len(latencies) else 0.0 for q in (50, 95, 99)
+            },
+            "requests_per_s": requests_per_s,
+        }
+
+
+class FilterBatcher:
+    """Groups concurrent filter requests into batches for a pool of worker processes
+
+    Use as an async context manager, in the event loop that submits the requests:
+
+        >>> async with FilterBatcher("numba") as batcher:
+        ...     png = await batcher.filter_bytes(data, "color2sepia", strength=0.7)
+    """
+
+    def __init__(
+            self,
+            implementation: str = "auto",
+            workers: int = None,
+            max_batch: int = MAX_BATCH,
+            max_wait: float = MAX_WAIT,
+            max_pending: int = MAX_PENDING,
+    ):
+        """
+        Args:
+            implementation (str): the filter implementation
+            workers (int): number of worker processes, defaults to the number of cores
+            max_batch (int): the most images in a batch
+            max_wait (float): seconds to wait for more images after the first one of a batch
+            max_pending (int): the most requests in the service at once, more are rejected
+        """
+        if max_batch < 1 or max_pending < 1:
+            raise ValueError(f"max_batch and max_pending must be positive, got {max_batch=}, {max_pending=}")
+        self.implementation = implementation
+        self.workers = workers or os.cpu_count()
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.max_pending = max_pending
+        self.pending = 0
+        self.metrics = Metrics()
+
+        self._queue = None
+        self._collector = None
+        self._batches = set()
+        self._workers = None
+        self._io = None
+
+    async def start(self) -> None:
+        """Start the worker processes, the decode/encode threads and the collector task"""
+        if self.implementation == "auto":
+            # calibrate (or load the calibration) once here, instead of in every worker
+            from .auto_filters import load_calibration
+
+            load_calibration()
+
+        # spawn, like batch mode: forking after the numba thread pools have started can deadlock
+        self._workers = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=("color2gray", self.implementation),
+        )
+        # PIL releases the GIL while decoding and encoding
+        self._io = ThreadPoolExecutor(max_workers=self.workers)
+        self._queue = asyncio.Queue()
+        self._collector = asyncio.create_task(self._collect())
+
+    async def stop(self) -> None:
+        """Stop the collector task and shut down the pools"""
+        self._collector.cancel()
+        try:
+            await self._collector
+        except asyncio.CancelledError:
+            pass
+        if self._batches:
+            await asyncio.gather(*self._batches, return_exceptions=True)
+        self._workers.shutdown()
+        self._io.shutdown()
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.stop()
+
+    async def submit(self, image: np.array, filter: str, strength: float = 1, single_channel: bool = False) -> np.array:
+        """Queue an image for the next batch, and wait for the filtered image
+
+        Raises:
+            Overloaded: if the service already has max_pending requests
+            ValueError: for an unknown filter, or invalid options
+        """
+        self._admit()
+        start_time = time.perf_counter()
+        try:
+            self._check(filter, strength, single_channel)
+            return await self._submit(image, filter, strength, single_channel)
+        finally:
+            self.pending -= 1
+            self.metrics.record_request(start_time)
+
+    async def filter_bytes(
+            self,
+            data: bytes,
+            filter: str,
+            strength: float = 1,
+            single_channel: bool = False,
+            format: str = "PNG",
+    ) -> bytes:
+        """Decode, filter and encode an uploaded image file
+
+        Args:
+            data (bytes): the uploaded image file
+            filter (str): the filter name
+            strength (float): the sepia strength
+            single_channel (bool): make a single channel gray image
+            format (str): the image format to encode the result to
+        Returns:
+            bytes: the filtered image file
+        Raises:
+            Overloaded: if the service already has max_pending requests
+            ValueError: for an image that can not be decoded or encoded as format, an unknown filter,
+                or invalid options
+        """
+        # rejected before decoding, so an overloaded service does no work for the request
+        self._admit()
+        start_time = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        try:
+            pipeline = self._check(filter, strength, single_channel)
+            try:
+                image = await loop.run_in_executor(self._io, decode_image, data)
+            except ValueError:
+                self.metrics.errors += 1
+                raise
+            filtered = await self._submit(image, filter, strength, single_channel)
+            try:
+                return await loop.run_in_executor(self._io, pipeline.encode, filtered, format)
+            except (KeyError, OSError, ValueError) as error:  # e.g. an unknown format, or rgba as JPEG
+                self.metrics.errors += 1
+                raise ValueError(f"could not encode the image as {format}: {error}") from error
+        finally:
+            self.pending -= 1
+            self.metrics.record_request(start_time)
+
+    def _admit(self) -> None:
+        """Count a new request, or reject it when the service is full"""
+        if self.pending >= self.max_pending:
+            self.metrics.rejected += 1
+            raise Overloaded(f"the service has {self.pending} pending requests, try again later")
+        self.pending += 1
+
+    def _check(self, filter: str, strength: float, single_channel: bool) -> Pipeline:
+        """Check the filter and options here, instead of failing the whole batch in the worker"""
+        if filter not in FILTERS:
+            raise ValueError(f"unknown filter '{filter}', must be one of {FILTERS}")
+        return Pipeline(filter, self.implementation, strength=strength, single_channel=single_channel)
+
+    async def _submit(self, image: np.array, filter: str, strength: float, single_channel: bool) -> np.array:
+        """Queue an image for the next batch, and wait for the filtered image"""
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put(((filter, strength, single_channel), image, future))
+        return await future
+
+    async def _collect(self) -> None:
+        """Take the queued images in batches, and send each batch to the workers"""
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            # one worker call for each filter and its options
+            groups = defaultdict(list)
+            for key, image, future in batch:
+                groups[key].append((image, future))
+            for key, items in groups.items():
+                task = asyncio.create_task(self._run_batch(key, items))
+                self._batches.add(task)
+                task.add_done_callback(self._batches.discard)
+
+    async def _run_batch(self, key: tuple, items: list) -> None:
+        """Filter a batch in a worker process, and hand out the results"""
+        filter, strength, single_channel = key
+        images = [image for image, _ in items]
+        self.metrics.record_batch(len(images))
+        try:
+            results = await asyncio.get_running_loop().run_in_executor(
+                self._workers, filter_batch, images, filter, self.implementation, strength, single_channel
+            )
+        except Exception as error:
+            self.metrics.errors += len(items)
+            for _, future in items:
+                if not future.done():
+                    future.set_exception(error)
+            return
+        for (_, future), result in zip(items, results):
+            if not future.done():  # the request may have been cancelled
+                future.set_result(result)
+
+
+def create_app(batcher: FilterBatcher = None):
+    """Create the FastAPI app of the service
+
+    Args:
+        batcher (FilterBatcher): the batcher to filter with, started and stopped with the app,
+            defaults to the 'auto' implementation
+    Returns:
+        fastapi.FastAPI: the app
+    """
+    try:
+        from contextlib import asynccontextmanager
+
+        from fastapi import FastAPI, File, HTTPException, Query
+        from fastapi.responses import Response
+    except ImportError as error:
+        raise ImportError(
+            "the service needs the optional dependencies, install with `pip3 install 'in3110_instapy[service]'`, "
+            "or `pip3 install '.[service]'` in the package directory"
+        ) from error
+
+    if batcher is None:
+        batcher = FilterBatcher()
+
+    @asynccontextmanager
+    async def lifespan(app):
+        async with batcher:
+            yield
+
+    app = FastAPI(title="in3110_instapy", lifespan=lifespan)
+    app.state.batcher = batcher
+
+    @app.post("/filter/{filter}")
+    async def filter_image(
+            filter: str,
+            # builtin annotations only: they are resolved in the module, where fastapi is not imported
+            file: bytes = File(...),
+            strength: float = Query(1, ge=0, le=1),
+            single_channel: bool = False,
+            format: str = "PNG",
+    ):
+        """Filter an uploaded image, and return it encoded as `format`"""
+        try:
+            filtered = await batcher.filter_bytes(file, filter, strength, single_channel, format.upper())
+        except Overloaded as error:
+            raise HTTPException(status_code=503, detail=str(error), headers={"Retry-After": "1"})
+        except (ValueError, KeyError, OSError) as error:  # PIL raises KeyError for unknown formats
+            raise HTTPException(status_code=400, detail=str(error))
+        return Response(filtered, media_type=Image.MIME.get(format.upper(), "application/octet-stream"))
+
+    @app.get("/metrics")
+    def metrics() -> dict:
+        """The request counts, batch sizes, latency and throughput"""
+        return batcher.metrics.summary(batcher.pending)
+
+    return app
+
+
+def main(argv=None):
+    """Parse the command-line and serve the app with uvicorn"""
+    parser = argparse.ArgumentParser(description="Serve the image filters over HTTP.")
+    parser.add_argument("--host", default="127.0.0.1", help="The address to listen on, defaults to 127.0.0.1")
+    parser.add_argument("--port", default=8000, type=int, help="The port to listen on, defaults to 8000")
+    parser.add_argument(
+        "-i", "--implementation",
+        help="Select filter implementation, defaults to 'auto'",
+        choices=["auto", "python", "memoryview", "numpy", "numba", "parallel", "cython", "lut"],
+        default="auto",
+    )
+    parser.add_argument(
+        "-p", "--processes", type=int, help="Number of worker processes, defaults to the number of cores"
+    )
+    parser.add_argument("--max-batch", default=MAX_BATCH, type=int, help=f"Images per batch, defaults to {MAX_BATCH}")
+    parser.add_argument(
+        "--max-wait", default=MAX_WAIT * 1000, type=float,
+        help=f"Milliseconds to wait for more images for a batch, defaults to {MAX_WAIT * 1000:g}",
+    )
+    parser.add_argument(
+        "--max-pending", default=MAX_PENDING, type=int,
+        help=f"Requests in the service before new ones are rejected, defaults to {MAX_PENDING}",
+    )
+    args = parser.parse_args(argv)
+
+    import uvicorn
+
+    batcher = FilterBatcher(
+        args.implementation,
+        workers=args.processes,
+        max_batch=args.max_batch,
+        max_wait=args.max_wait / 1000,
+        max_pending=args.max_pending,
+    )
+    uvicorn.run(create_app(batcher), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
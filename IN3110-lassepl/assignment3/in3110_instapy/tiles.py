@@ -0,0 +1,226 @@
+"""Filtering of images larger than memory, in bands of rows
+
+The image is read, filtered and written one band of rows at a time, so the
+memory use depends on the band size instead of the image size:
+
+- `.npy` and `.raw` images are memory-mapped, and a band is a slice of their rows
+- images that PIL decodes strip by strip are decoded one band at a time: uncompressed
+  TIFF files in strips (as written by io.create_image), and other uncompressed formats
+  stored top to bottom, such as PPM. Other formats, e.g. compressed TIFF, PNG or JPEG,
+  can only be decoded whole
+- the output is a memory-mapped `.npy`, `.raw` or uncompressed `.tif` file from io.create_image
+
+The result is the same as of filtering the whole image at once: the largest
+sepia value to rescale by is found in a first pass over the bands, and the
+blur reads the rows around each band.
+"""
+from __future__ import annotations
+
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+import in3110_instapy
+
+from . import io
+from .numpy_filters import SEPIA_MATRIX, check_blur_size, sepia_max
+
+# Pixels per band, when the number of rows is not given
+TILE_PIXELS = 1 << 22
+
+
+def _moved_tile(tile: tuple, extents: tuple, offset: int, args) -> tuple:
+    """Return a PIL tile with new extents, offset and arguments, of the tile type of the installed PIL"""
+    if hasattr(tile, "_replace"):  # a named tuple since Pillow 11
+        return tile._replace(extents=extents, offset=offset, args=args)
+    return (tile[0], extents, offset, args)
+
+
+def _band_tiles(image: Image.Image, start: int, stop: int) -> tuple | None:
+    """Return the PIL tiles that decode rows [start, stop) of an image, moved up to the first of their rows
+
+    Args:
+        image (Image.Image): an opened, not yet loaded, image
+        start (int): the first row
+        stop (int): the row after the last row
+    Returns:
+        tuple: the first decoded row and the tiles, or None if the image can only be decoded whole
+    """
+    tiles = image.tile
+    if len(tiles) == 1 and tiles[0][0] == "raw":
+        # a single uncompressed block, the rows are found at their offset in the file
+        codec, extents, offset, args = tiles[0]
+        rawmode, stride, orientation = (args + (0, 1))[:3] if isinstance(args, tuple) else (args, 0, 1)
+        if rawmode != image.mode or orientation != 1 or tuple(extents) != (0, 0) + image.size:
+            return None
+        stride = stride or image.width * len(Image.new(image.mode, (1, 1)).tobytes())
+        extents = (0, 0, image.width, stop - start)
+        return start, [_moved_tile(tiles[0], extents, offset + start * stride, (rawmode, stride, 1))]
+
+    if len(tiles) > 1 and all(codec != "libtiff" for codec, *_ in tiles):
+        # strips or tiles, each decoded on its own
+        band = [tile for tile in tiles if tile[1][1] < stop and tile[1][3] > start]
+        top = min(extents[1] for _, extents, _, _ in band)
+        moved = []
+        for tile in band:
+            x0, y0, x1, y1 = tile[1]
+            moved.append(_moved_tile(tile, (x0, y0 - top, x1, y1 - top), tile[2], tile[3]))
+        return top, moved
+    return None
+
+
+class BandReader:
+    """Read an image band by band of rows, without decoding the whole image where possible"""
+
+    def __init__(self, filename: str, shape: tuple = None, dtype: np.dtype = np.uint8):
+        """Open the image
+
+        Args:
+            filename (str): the image file
+            shape (tuple): the (H, W, C) shape of a `.raw` file
+            dtype (np.dtype): the type of a `.raw` file
+        """
+        self.filename = filename
+        # the whole image, memory-mapped or decoded, when it is not decoded in bands
+        self._image = None
+
+        if Path(filename).suffix.lower() in io.MEMMAP_SUFFIXES:
+            self._image = io.read_image(filename, shape, dtype)
+        else:
+            with Image.open(filename) as image:
+                banded = _band_tiles(image, 0, 1) is not None
+                # the type and channels of the arrays of this image mode
+                pixel = np.asarray(Image.new(image.mode, (1, 1)))
+                self.shape = (image.height, image.width) + pixel.shape[2:]
+                self.dtype = pixel.dtype
+            if not banded:
+                self._image = io.read_image(filename)
+
+        if self._image is not None:
+            self.shape, self.dtype = self._image.shape, self._image.dtype
+
+    @property
+    def banded(self) -> bool:
+        """True if the image is read one band at a time"""
+        return self._image is None or isinstance(self._image, np.memmap)
+
+    def read(self, start: int, stop: int) -> np.array:
+        """Return rows [start, stop) of the image, clipped to the image"""
+        start, stop = max(start, 0), min(stop, self.shape[0])
+        if self._image is not None:
+            return self._image[start:stop]
+
+        with Image.open(self.filename) as image:
+            top, tiles = _band_tiles(image, start, stop)
+            # decode only the band, as an image of its rows
+            image.tile = tiles
+            image._size = (image.width, max(extents[3] for _, extents, _, _ in tiles))
+            band = np.asarray(image)
+        return band[start - top:stop - top]
+
+
+def _sepia_rescale(reader: BandReader, tile_rows: int, implementation: str, rescale: str):
+    """Return the rescale of the whole image for the sepia of every band, see numpy_filters.sepia_max
+
+    The largest sepia value ('max'), or the largest value of each channel ('channels'),
+    is found in a first pass over the bands. The largest sepia value is computed
+    like the filters do, so the result is the same as of filtering the whole image.
+    """
+    if rescale == "range":  # does not depend on the image
+        return rescale
+
+    band_max = []
+    for start in range(0, reader.shape[0], tile_rows):
+        band = reader.read(start, start + tile_rows)[:, :, :3]
+        if rescale == "channels":
+            band_max.append(band.max(axis=0).max(axis=0))
+        elif implementation == "numpy":
+            # the matrix product of numpy_color2sepia
+            band_max.append(np.dot(band, SEPIA_MATRIX.T).max())
+        else:
+            # the other filters add the weighted channels one by one, the red row has the largest weights
+            red, green, blue = SEPIA_MATRIX[0]
+            band_max.append((band[:, :, 0] * red + band[:, :, 1] * green + band[:, :, 2] * blue).max())
+
+    if rescale == "channels":
+        channel_max = np.max(band_max, axis=0) if band_max else np.zeros(3, dtype=reader.dtype)
+        return sepia_max(channel_max.reshape(1, 1, 3), SEPIA_MATRIX, "channels")
+    return max(band_max, default=0.0)
+
+
+def run_tiled(
+        source: str,
+        out: str,
+        implementation: str = "numba",
+        filter: str = "color2gray",
+        strength: float = 1,
+        single_channel: bool = False,
+        size: int = 3,
+        rescale: str | float = "max",
+        tile_rows: int = None,
+        shape: tuple = None,
+        dtype: np.dtype = np.uint8,
+) -> np.memmap:
+    """Filter an image band by band into a memory-mapped output file
+
+    Every filter writes each band directly into its rows of the output.
+    The peak memory is a few bands, and the result is the same as of filtering
+    the whole image with the same implementation.
+
+    Args:
+        source (str): the image file, see BandReader
+        out (str): the `.npy`, `.raw` or `.tif` file to write the filtered image to
+        implementation (str): the filter implementation, 'auto' picks the fastest for the band size
+        filter (str): the filter name
+        strength (float): the sepia strength
+        single_channel (bool): make a single channel gray image
+        size (int): the blur kernel size
+        rescale (str | float): the sepia rescale, 'max', 'channels', 'range' or the largest sepia value,
+            see numpy_filters.sepia_max
+        tile_rows (int): rows per band, defaults to about TILE_PIXELS pixels per band
+        shape (tuple): the (H, W, C) shape of a `.raw` source
+        dtype (np.dtype): the type of a `.raw` source
+    Returns:
+        np.memmap: the filtered image, flushed to the output file
+    """
+    reader = BandReader(source, shape, dtype)
+    height, width = reader.shape[:2]
+    if tile_rows is None:
+        tile_rows = max(1, TILE_PIXELS // max(width, 1))
+    if tile_rows < 1:
+        raise ValueError(f"tile_rows must be positive, got {tile_rows=}")
+
+    options = {}
+    if implementation == "auto" and filter != "blur":
+        from . import auto_filters
+
+        # the fastest implementation for the band size, the same for every band
+        implementation, options = auto_filters.choose(filter, (tile_rows, width) + reader.shape[2:], reader.dtype)
+    filter_function = in3110_instapy.get_filter(filter, implementation)
+
+    halo = 0  # rows read around each band
+    if filter == "color2gray":
+        options["single_channel"] = single_channel
+    elif filter == "color2sepia":
+        options["k"] = strength
+        options["rescale"] = _sepia_rescale(reader, tile_rows, implementation, rescale)
+    elif filter == "blur":
+        options["size"] = size
+        halo = check_blur_size(size)
+
+    out_shape = (height, width) if single_channel else reader.shape
+    output = io.create_image(out, out_shape, np.uint16 if reader.dtype == np.uint16 else np.uint8)
+
+    for start in range(0, height, tile_rows):
+        stop = min(start + tile_rows, height)
+        if halo:
+            # the blur of the band reads the rows around it, which are cut off again
+            top = max(start - halo, 0)
+            blurred = filter_function(reader.read(top, stop + halo), **options)
+            output[start:stop] = blurred[start - top:stop - top]
+        else:
+            filter_function(reader.read(start, stop), out=output[start:stop], **options)
+
+    output.flush()
+    return output
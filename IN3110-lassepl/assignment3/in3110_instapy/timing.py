@@ -1,11 +1,16 @@
 from __future__ import annotations
 
+import os
+import subprocess
+import sys
+import tempfile
+import time
 from timeit import timeit
 import numpy as np
 from PIL import Image
 from typing import Callable
 
-from . import get_filter, io
+from . import benchmark, get_filter, io
 
 
 def time_one(filter_function: Callable, *arguments, calls: int = 3) -> float:
@@ -35,11 +40,12 @@ def make_reports(filename: str = "test/rain.jpg", calls: int = 3) -> None:
     Make timing reports for all implementations and filters,
     run for a given image.
 
-    Prints and saves the result to "timing-report.txt" in the working dir.
+    Saves the result to "timing-report.txt" in the working dir.
+    For the full size matrix and JSON output, see `in3110_instapy.benchmark`.
 
     Args:
         filename (str): the image file to use
-        calls (int): amount of calls to
+        calls (int): amount of timed calls, the median is reported
 
     Returns:
         None
@@ -57,40 +63,146 @@ def make_reports(filename: str = "test/rain.jpg", calls: int = 3) -> None:
         # Get image array
         image = np.asarray(image)
 
-        # iterate through the filters
-        filter_names = [
-            "color2gray",
-            "color2sepia"
-        ]
+        # benchmark every filter and implementation, with no size limit for the python reference
+        results = benchmark.benchmark_image(image, filename, repeats=calls, max_pixels={})
 
-        for filter_name in filter_names:
-            # get the reference filter function
-            reference_filter = get_filter(filter_name, "python")
+        for filter_name in benchmark.FILTERS:
+            filter_results = {r["implementation"]: r for r in results if r["filter"] == filter_name}
 
-            # time the reference implementation
-            reference_time = time_one(reference_filter, image, calls=calls)
+            # the reference implementation
+            reference_time = filter_results["python"].get("median")
+            if reference_time is None:
+                outfile.write(f"Reference (pure Python) filter time {filter_name}: skipped (image too large)\n")
+            else:
+                outfile.write(
+                    f"Reference (pure Python) filter time {filter_name}: {reference_time:.3}s ({calls=})\n"
+                )
 
-            outfile.write(
-                f"Reference (pure Python) filter time {filter_name}: {reference_time:.3}s ({calls=})\n"
-            )
+            for implementation, result in filter_results.items():
+                if implementation == "python":
+                    continue
+                if "skipped" in result:
+                    outfile.write(f"Timing: {implementation} {filter_name}: {result['skipped']}\n")
+                    continue
 
-            # iterate through the implementations
-            implementations = [
-                "numpy",
-                "numba"
-            ]
+                # compare the reference time to the optimized time
+                filter_time = result["median"]
+                speedup = reference_time / filter_time if reference_time else float("nan")
 
-            for implementation in implementations:
-                filter = get_filter(filter_name, implementation)
+                outfile.write(
+                    f"Timing: {implementation} {filter_name}: {filter_time:.3}s ({speedup=:.2f}x, "
+                    f"{result['megapixels_per_s']:.1f} MP/s, peak {result['peak_memory_mb']:.1f} MB)\n"
+                )
+            outfile.write("\n")  # new line between filters
 
-                # time the filter
-                filter_time = time_one(filter, image, calls=calls)
 
-                # compare the reference time to the optimized time
-                speedup = reference_time / filter_time
+def make_scaling_report(filename: str = "test/rain.jpg", calls: int = 3, thread_counts: list = None) -> None:
+    """
+    Make a scaling report for the parallel implementation,
+    timing each filter with an increasing number of threads.
+
+    Saves the result to "scaling-report.txt" in the working dir.
+
+    Args:
+        filename (str): the image file to use
+        calls (int): amount of calls to average over
+        thread_counts (list): the thread counts to time, defaults to 1, 2, 4 and all cores
+
+    Returns:
+        None
+    """
+    import numba
+
+    max_threads = numba.config.NUMBA_NUM_THREADS
+    if thread_counts is None:
+        thread_counts = sorted({n for n in [1, 2, 4] if n <= max_threads} | {max_threads})
+
+    image = np.asarray(Image.open(filename))
+
+    with open("scaling-report.txt", "w") as outfile:
+        h, w = image.shape[:2]
+        outfile.write(f"Scaling performed using {filename}: {w}x{h}, {max_threads} cores available\n\n")
+
+        for filter_name in benchmark.FILTERS:
+            filter = get_filter(filter_name, "parallel")
+
+            # time with one thread first, as the reference for the speedup
+            single_time = time_one(lambda image: filter(image, n_threads=1), image, calls=calls)
+
+            for n_threads in thread_counts:
+                filter_time = time_one(lambda image: filter(image, n_threads=n_threads), image, calls=calls)
+                speedup = single_time / filter_time
+
+                outfile.write(
+                    f"Timing: parallel {filter_name} ({n_threads=}): {filter_time:.3}s ({speedup=:.2f}x)\n"
+                )
+            outfile.write("\n")  # new line between filters
+
+
+# Run in a new interpreter: import, load the image, filter it once
+_STARTUP_SCRIPT = """
+import numpy as np
+from PIL import Image
+import in3110_instapy
+image = np.asarray(Image.open({filename!r}))
+in3110_instapy.get_filter({filter_name!r}, {implementation!r})(image)
+"""
+
+
+def time_startup(filename: str, filter_name: str, implementation: str, cache_dir: str = None) -> float:
+    """Return the time for a new process to filter its first image
+
+    Measures everything a short-lived CLI or worker process pays:
+    interpreter start-up, imports, numba compilation (or cache loading) and the first call.
+
+    Args:
+        filename (str): the image file to filter
+        filter_name (str): the filter name
+        implementation (str): the filter implementation
+        cache_dir (str): the numba cache directory to use, defaults to numba's default
+    Returns:
+        time (float):
+            The wall time (in seconds) of the process
+    """
+    env = dict(os.environ)
+    if cache_dir is not None:
+        env["NUMBA_CACHE_DIR"] = cache_dir
+
+    script = _STARTUP_SCRIPT.format(filename=filename, filter_name=filter_name, implementation=implementation)
+    start_time = time.perf_counter()
+    subprocess.run([sys.executable, "-c", script], env=env, check=True)
+    return time.perf_counter() - start_time
+
+
+def make_startup_report(filename: str = "test/rain.jpg", calls: int = 3) -> None:
+    """
+    Make a report of the cold-process time to the first filtered image,
+    with an empty numba cache (compiling) and with a filled cache.
+
+    Saves the result to "startup-report.txt" in the working dir.
+
+    Args:
+        filename (str): the image file to use
+        calls (int): amount of processes to average the cached time over
+
+    Returns:
+        None
+    """
+    with open("startup-report.txt", "w") as outfile:
+        outfile.write(f"Start-up time to first filtered image using {filename}\n\n")
+
+        for filter_name in ["color2gray", "color2sepia"]:
+            for implementation in ["numpy", "numba", "parallel"]:
+                with tempfile.TemporaryDirectory() as cache_dir:
+                    # the first process fills the empty cache
+                    cold_time = time_startup(filename, filter_name, implementation, cache_dir)
+                    cached_time = sum(
+                        time_startup(filename, filter_name, implementation, cache_dir) for _ in range(calls)
+                    ) / calls
 
                 outfile.write(
-                    f"Timing: {implementation} {filter_name}: {filter_time:.3}s ({speedup=:.2f}x)\n"
+                    f"Start-up: {implementation} {filter_name}: {cold_time:.3}s empty cache, "
+                    f"{cached_time:.3}s cached ({calls=})\n"
                 )
             outfile.write("\n")  # new line between filters
 
@@ -98,3 +210,5 @@ def make_reports(filename: str = "test/rain.jpg", calls: int = 3) -> None:
 if __name__ == "__main__":
     # run as `python -m in3110_instapy.timing`
     make_reports()
+    make_scaling_report()
+    make_startup_report()
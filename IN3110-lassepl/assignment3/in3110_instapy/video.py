@@ -0,0 +1,283 @@
+"""Streaming filters for frame sequences and raw video
+
+Frames are read, filtered and written by three stages connected by bounded
+queues: a reader thread decodes the frames, the main thread filters them, and
+a writer thread encodes them. The frames live in fixed pools of buffers, which
+are handed back when a stage is done with them, so the memory use does not
+depend on the length of the clip.
+
+Sources and outputs are either
+
+- numbered image files: a directory or glob pattern of frames in, a directory of PNG frames out
+- raw video: a stream of packed rgb24 frames (as from ``ffmpeg -f rawvideo -pix_fmt rgb24``),
+  from a `.raw`/`.rgb` file or '-' for stdin/stdout. The frame size must be given for raw input.
+
+Run as:
+
+    ffmpeg -i clip.mp4 -f rawvideo -pix_fmt rgb24 - | \\
+        python -m in3110_instapy.video - --size 1280x720 -o - -se | \\
+        ffmpeg -f rawvideo -pix_fmt rgb24 -s 1280x720 -i - sepia.mp4
+"""
+from __future__ import annotations
+
+import argparse
+import queue
+import sys
+import threading
+import time
+from functools import partial
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+from .batch import find_images
+from .pipeline import Pipeline
+
+# Suffixes of raw rgb24 video streams
+RAW_SUFFIXES = (".raw", ".rgb")
+
+# Marks the end of a frame queue
+_END = None
+
+
+def is_raw(path: str) -> bool:
+    """Returns True if the path is a raw video stream ('-' for stdin/stdout) rather than image frames"""
+    return str(path) == "-" or Path(path).suffix.lower() in RAW_SUFFIXES
+
+
+def _read_exact(stream, buffer: np.array) -> bool:
+    """Fill the buffer from a binary stream, returns False at the end of the stream"""
+    view = memoryview(buffer).cast("B")
+    n_read = 0
+    while n_read < len(view):
+        n = stream.readinto(view[n_read:])
+        if not n:
+            if n_read:
+                raise ValueError(f"incomplete frame at the end of the stream ({n_read} of {len(view)} bytes)")
+            return False
+        n_read += n
+    return True
+
+
+def _read_raw(source: str, free_frames: queue.Queue, frames: queue.Queue) -> None:
+    """Read raw frames into free buffers, and queue them for filtering"""
+    stream = sys.stdin.buffer if source == "-" else open(source, "rb")
+    try:
+        while True:
+            buffer = free_frames.get()  # blocks while all buffers are in use
+            if not _read_exact(stream, buffer):
+                break
+            frames.put(buffer)
+    finally:
+        if stream is not sys.stdin.buffer:
+            stream.close()
+
+
+def _read_images(source: str, frames: queue.Queue) -> None:
+    """Decode numbered image files, and queue them for filtering"""
+    files = find_images(source)
+    if not files:
+        raise FileNotFoundError(f"No frames found in '{source}'")
+    for file in files:
+        # rgb, so every frame has the same shape as a raw frame
+        frames.put(np.asarray(Image.open(file).convert("RGB")))  # blocks while the queue is full
+
+
+def _write_raw(out: str, filtered: queue.Queue, free_outputs: queue.Queue | None) -> None:
+    """Write the filtered frames to a raw stream, and hand their buffers back"""
+    stream = sys.stdout.buffer if out == "-" else open(out, "wb")
+    try:
+        while (frame := filtered.get()) is not _END:
+            stream.write(memoryview(np.ascontiguousarray(frame)).cast("B"))
+            if free_outputs is not None:
+                free_outputs.put(frame)
+    finally:
+        if stream is sys.stdout.buffer:
+            stream.flush()
+        else:
+            stream.close()
+
+
+def _write_images(out: str, filtered: queue.Queue, free_outputs: queue.Queue | None) -> None:
+    """Encode the filtered frames as numbered PNG files, and hand their buffers back"""
+    out_dir = Path(out)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    index = 0
+    while (frame := filtered.get()) is not _END:
+        Image.fromarray(frame).save(out_dir / f"frame_{index:06d}.png")
+        if free_outputs is not None:
+            free_outputs.put(frame)
+        index += 1
+
+
+class _Stage(threading.Thread):
+    """A daemon thread that keeps the exception of its target, to raise it in the main thread
+
+    on_exit is called when the target returns or fails, on_error only when it fails.
+    """
+
+    def __init__(self, target, *args, on_exit=None, on_error=None):
+        super().__init__(daemon=True)
+        self.target = target
+        self.args = args
+        self.on_exit = on_exit
+        self.on_error = on_error
+        self.error = None
+
+    def run(self):
+        try:
+            self.target(*self.args)
+        except BaseException as error:  # re-raised in the main thread
+            self.error = error
+            if self.on_error is not None:
+                self.on_error()
+        finally:
+            if self.on_exit is not None:
+                self.on_exit()
+
+
+def _drain(frames: queue.Queue, free_frames: queue.Queue | None) -> None:
+    """Take the frames off a queue until its end, handing their buffers back, so no stage blocks on it"""
+    while (frame := frames.get()) is not _END:
+        if free_frames is not None:
+            free_frames.put(frame)
+
+
+def run_video(
+        source: str,
+        out: str,
+        implementation: str = "numba",
+        filter: str = "color2gray",
+        strength: float = 1,
+        single_channel: bool = False,
+        size: tuple = None,
+        queue_size: int = 8,
+) -> float:
+    """Filter a frame sequence or raw video stream, frame by frame
+
+    The frames go through bounded queues, so at most about 2 * queue_size
+    input frames and queue_size + 2 output frames are in memory at once.
+    The output buffers are reused for every frame, by filters that take an
+    `out` array, and so are the input buffers of raw streams.
+
+    Args:
+        source (str): directory or glob pattern of frames, or a raw rgb24 stream ('-' for stdin)
+        out (str): directory for PNG frames, or a raw stream ('-' for stdout)
+        implementation (str): the filter implementation
+        filter (str): the filter name
+        strength (float): the sepia strength
+        single_channel (bool): make single channel gray frames (gray8 for raw streams)
+        size (tuple): the (width, height) of the frames of a raw source
+        queue_size (int): the number of frames each queue can hold
+    Returns:
+        float: frames per second
+    """
+    if queue_size < 1:
+        raise ValueError(f"queue_size must be positive, got {queue_size=}")
+
+    pipeline = Pipeline(filter, implementation, strength=strength, single_channel=single_channel)
+
+    frames = queue.Queue(maxsize=queue_size)
+    filtered = queue.Queue(maxsize=queue_size)
+    # the reused output buffers, only for filters that can write into them
+    free_outputs = queue.Queue() if pipeline.accepts_out else None
+    # the end of the source is queued after the last frame, also when reading fails
+    on_end = partial(frames.put, _END)
+
+    if is_raw(source):
+        if size is None:
+            raise ValueError("the frame size must be given for a raw video source")
+        width, height = size
+        free_frames = queue.Queue()
+        # one frame being read, the queued frames, and one frame being filtered
+        for _ in range(queue_size + 2):
+            free_frames.put(np.empty((height, width, 3), dtype=np.uint8))
+        reader = _Stage(_read_raw, source, free_frames, frames, on_exit=on_end)
+    else:
+        free_frames = None
+        reader = _Stage(_read_images, source, frames, on_exit=on_end)
+
+    writer = _Stage(
+        _write_raw if is_raw(out) else _write_images,
+        out, filtered, free_outputs,
+        on_error=partial(_drain, filtered, free_outputs),  # a failed writer must not block the filtering
+    )
+
+    n_frames = 0
+    start_time = time.perf_counter()
+    reader.start()
+    writer.start()
+    try:
+        while (frame := frames.get()) is not _END:
+            if writer.error is not None:
+                break
+
+            if free_outputs is not None:
+                if n_frames == 0:
+                    # the output pool: one frame being filtered, the queued frames, and one frame being written
+                    out_shape = frame.shape[:2] if single_channel else frame.shape
+                    for _ in range(queue_size + 2):
+                        free_outputs.put(np.empty(out_shape, dtype=frame.dtype))
+                result = pipeline.apply(frame, out=free_outputs.get())
+            else:
+                result = pipeline.apply(frame)
+
+            if free_frames is not None:  # the raw input buffer can be read into again
+                free_frames.put(frame)
+            filtered.put(result)
+            n_frames += 1
+    finally:
+        filtered.put(_END)
+        writer.join()
+
+    for stage in (reader, writer):
+        if stage.error is not None:
+            raise stage.error
+    total_time = time.perf_counter() - start_time
+
+    frames_per_second = n_frames / total_time
+    print(f"Filtered {n_frames} frames in {total_time:.2f}s ({frames_per_second:.1f} frames/s)", file=sys.stderr)
+    return frames_per_second
+
+
+def main(argv=None):
+    """Parse the command-line and filter the frames"""
+    parser = argparse.ArgumentParser(description="Apply filters to frame sequences and raw rgb24 video.")
+    parser.add_argument("source", help="A directory or glob pattern of frames, or a raw stream ('-' for stdin)")
+    parser.add_argument(
+        "-o", "--out", required=True, help="A directory for PNG frames, or a raw stream ('-' for stdout)"
+    )
+    filter_group = parser.add_mutually_exclusive_group(required=True)
+    filter_group.add_argument("-g", "--gray", help="Select gray filter", action="store_true")
+    filter_group.add_argument("-se", "--sepia", help="Select sepia filter", action="store_true")
+    parser.add_argument(
+        "-i", "--implementation",
+        help="Select filter implementation, defaults to 'auto', the fastest for the image size on this machine",
+        choices=["auto", "python", "memoryview", "numpy", "numba", "parallel", "cython", "lut"],
+        default="auto",
+    )
+    parser.add_argument("-st", "--strength", help="Sepia filter strength in [0, 1]", default=1, type=float)
+    parser.add_argument("-l", "--single-channel", help="Make single channel gray frames", action="store_true")
+    parser.add_argument("--size", help="Frame size WIDTHxHEIGHT of a raw source")
+    parser.add_argument("-q", "--queue-size", help="Frames per queue, defaults to 8", default=8, type=int)
+    args = parser.parse_args(argv)
+
+    if args.single_channel and not args.gray:
+        parser.error("-l/--single-channel is only valid with -g/--gray")
+    size = tuple(int(n) for n in args.size.lower().split("x")) if args.size else None
+
+    run_video(
+        args.source,
+        args.out,
+        implementation=args.implementation,
+        filter="color2gray" if args.gray else "color2sepia",
+        strength=args.strength,
+        single_channel=args.single_channel,
+        size=size,
+        queue_size=args.queue_size,
+    )
+
+
+if __name__ == "__main__":
+    main()
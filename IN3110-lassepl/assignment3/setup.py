@@ -1,38 +1,65 @@
+import os
+import sys
+
 from setuptools import setup
 
 # IN4110: set to True when you are ready for the Cython implementation
-use_cython = False
+use_cython = True
+
+# Build with line tracing for the profilers, e.g. `INSTAPY_CYTHON_PROFILE=1 pip install .`
+# Tracing slows the compiled loops down a lot, so the default build is without it
+profile_cython = os.environ.get("INSTAPY_CYTHON_PROFILE", "0") == "1"
 
 
 if use_cython:
     from Cython.Build import cythonize
     from setuptools import Extension
 
+    # OpenMP for the parallel (prange) loops, not available with the default macOS compiler
+    if sys.platform == "win32":
+        openmp_args = ["/openmp"]
+    elif sys.platform == "darwin":
+        openmp_args = []
+    else:
+        openmp_args = ["-fopenmp"]
+
+    if profile_cython:
+        define_macros = [
+            ("CYTHON_TRACE", "1"),
+            ("CYTHON_TRACE_NOGIL", "1"),
+        ]
+        cython_directives = {
+            "language_level": 3,
+            # enable profiling
+            "binding": True,
+            "profile": True,
+            "linetrace": True,
+        }
+    else:
+        define_macros = []
+        cython_directives = {
+            "language_level": 3,
+            # the filters only index inside the image, with non-negative indices
+            "boundscheck": False,
+            "wraparound": False,
+            "initializedcheck": False,
+            "cdivision": True,
+        }
+
     extensions = [
         # A single module that is stand alone and has no special requisites
         Extension(
             "in3110_instapy.cython_filters",
             ["in3110_instapy/cython_filters.py"],
-            # enable profiling
-            define_macros=[
-                ("CYTHON_TRACE", "1"),
-                ("CYTHON_TRACE_NOGIL", "1"),
-            ],
+            define_macros=define_macros,
+            extra_compile_args=openmp_args,
+            extra_link_args=openmp_args,
         ),
     ]
-    cython_directives = {
-        "language_level": 3,
-        # enable profiling
-        "binding": True,
-        "profile": True,
-        "linetrace": True,
-        # you may want to add some compiler directives here
-        # to optimize compilation
-    }
     ext_modules = cythonize(
         extensions,
         compiler_directives=cython_directives,
-        annotate=True,
+        annotate=profile_cython,
     )
 else:
     ext_modules = []
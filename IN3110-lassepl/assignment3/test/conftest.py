@@ -1,12 +1,24 @@
 from functools import lru_cache
 from pathlib import Path
 
+import numpy as np
 import pytest
-from in3110_instapy import io
+from in3110_instapy import get_filter, io
 from in3110_instapy.python_filters import python_color2gray, python_color2sepia
 
 test_dir = Path(__file__).absolute().parent
 
+# Every filter implementation behind get_filter
+IMPLEMENTATIONS = ["python", "memoryview", "numpy", "numba", "parallel", "cython", "lut"]
+
+
+@pytest.fixture(scope="session", autouse=True)
+def cache_dir(tmp_path_factory):
+    """Keep the auto calibration and the result cache out of the user's cache directory"""
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        monkeypatch.setenv("INSTAPY_CACHE_DIR", str(tmp_path_factory.mktemp("cache")))
+        yield
+
 
 @lru_cache()
 def default_image():
@@ -27,6 +39,38 @@ def image():
     return random_image().copy()
 
 
+@pytest.fixture
+def small_image():
+    """Fixture to return a small random image, the pure python filters are slow"""
+    return np.random.randint(0, 255, size=(30, 40, 3), dtype=np.uint8)
+
+
+@pytest.fixture(params=IMPLEMENTATIONS)
+def implementation(request):
+    """Fixture to run a test with every filter implementation
+
+    Parametrize 'implementation' in the test to run it with other implementations.
+    """
+    return request.param
+
+
+@pytest.fixture
+def load_filter():
+    """Fixture to return get_filter, which skips the test for an implementation that is not
+    compiled (cython) or has no such filter
+    """
+
+    def load(filter_name, implementation):
+        if implementation == "cython":
+            pytest.importorskip("in3110_instapy.cython_filters", exc_type=ImportError)
+        try:
+            return get_filter(filter_name, implementation)
+        except AttributeError:
+            pytest.skip(f"{implementation} has no {filter_name} filter")
+
+    return load
+
+
 @pytest.fixture
 @lru_cache()
 def reference_gray():
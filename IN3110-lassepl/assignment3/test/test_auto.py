@@ -0,0 +1,89 @@
+import json
+import subprocess
+import sys
+
+import numpy as np
+import pytest
+from in3110_instapy import auto_filters, get_filter
+
+
+@pytest.fixture
+def calibration_dir(tmp_path, monkeypatch):
+    """Calibrate quickly into an empty cache directory"""
+    monkeypatch.setenv("INSTAPY_CACHE_DIR", str(tmp_path))
+    monkeypatch.setattr(auto_filters, "CALIBRATION_SIZES", [(16, 16), (200, 100)])
+    monkeypatch.setattr(auto_filters, "CALIBRATION_CALLS", 1)
+    monkeypatch.setattr(auto_filters, "_calibration", None)
+    return tmp_path
+
+
+def test_calibration_cached(calibration_dir, monkeypatch):
+    calibration = auto_filters.load_calibration()
+    assert auto_filters.cache_file().exists()
+    for filter_name in auto_filters.FILTERS:
+        results = calibration["results"][filter_name]
+        assert [result["pixels"] for result in results] == [256, 20000]
+        for result in results:
+            assert result["best"] in auto_filters.candidates()
+
+    # a new process loads the calibration from disk, without calibrating
+    monkeypatch.setattr(auto_filters, "_calibration", None)
+    monkeypatch.setattr(auto_filters, "calibrate", lambda: pytest.fail("calibrated again"))
+    assert auto_filters.load_calibration() == json.loads(json.dumps(calibration))
+
+
+def test_recalibrate_other_machine(calibration_dir, monkeypatch):
+    calibration = auto_filters.load_calibration()
+    calibration["machine"]["cpu_count"] = -1
+    auto_filters.cache_file().write_text(json.dumps(calibration))
+
+    monkeypatch.setattr(auto_filters, "_calibration", None)
+    assert auto_filters.load_calibration()["machine"] == auto_filters._machine()
+
+
+def test_choose(calibration_dir):
+    calibration = auto_filters.load_calibration()
+    small, large = calibration["results"]["color2sepia"]
+
+    # the closest calibrated size is used
+    assert auto_filters.choose("color2sepia", (10, 10, 3)) == auto_filters._resolve(small["best"])
+    assert auto_filters.choose("color2sepia", (3000, 4000, 3)) == auto_filters._resolve(large["best"])
+
+
+def test_auto_filters(calibration_dir, image, reference_gray, reference_sepia):
+    np.testing.assert_allclose(get_filter("color2gray", "auto")(image), reference_gray, atol=1)
+    np.testing.assert_allclose(get_filter("color2sepia", "auto")(image), reference_sepia, atol=1)
+
+    out = np.empty(image.shape[:2], dtype=np.uint8)
+    assert auto_filters.auto_color2gray(image, single_channel=True, out=out) is out
+
+
+def test_choose_uint16(calibration_dir):
+    # even where the lookup tables are the fastest, 16-bit images go to an implementation with uint16 kernels
+    for result in auto_filters.load_calibration()["results"]["color2sepia"]:
+        result["best"] = "lut"
+        result["times"]["lut"] = 0.0
+    assert auto_filters.choose("color2sepia", (10, 10, 3)) == ("lut", {})
+    assert auto_filters.choose("color2sepia", (10, 10, 3), np.uint16)[0] not in auto_filters.UINT8_ONLY
+
+    image = np.random.randint(0, 65535, size=(10, 10, 4), dtype=np.uint16)
+    sepia_image = auto_filters.auto_color2sepia(image)
+    assert sepia_image.dtype == np.uint16
+    np.testing.assert_allclose(sepia_image, get_filter("color2sepia", "numpy")(image), atol=1)
+
+
+def test_cached_numpy_choice_skips_numba(calibration_dir):
+    # a cached calibration that picks numpy is used without importing numba
+    results = [{"pixels": 256, "best": "numpy", "times": {"numpy": 0.0}}]
+    calibration = {"machine": auto_filters._machine(), "results": {name: results for name in auto_filters.FILTERS}}
+    auto_filters.cache_file().write_text(json.dumps(calibration))
+
+    code = """
+import sys
+import numpy as np
+from in3110_instapy import get_filter
+get_filter("color2sepia", "auto")(np.zeros((4, 4, 3), dtype=np.uint8))
+print("numba" in sys.modules)
+"""
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == "False"
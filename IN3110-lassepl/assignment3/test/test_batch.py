@@ -0,0 +1,81 @@
+import numpy as np
+import pytest
+from in3110_instapy import batch, io
+from in3110_instapy.cli import main, run_filter
+from in3110_instapy.numpy_filters import numpy_color2gray
+
+
+@pytest.fixture
+def image_dir(tmp_path):
+    """Directory with a few small images"""
+    in_dir = tmp_path / "in"
+    in_dir.mkdir()
+    for i in range(5):
+        io.write_image(io.random_image(40, 30), in_dir / f"image{i}.png")
+    (in_dir / "notes.txt").write_text("not an image")
+    return in_dir
+
+
+def test_find_images(image_dir):
+    files = batch.find_images(image_dir)
+    assert [file.name for file in files] == [f"image{i}.png" for i in range(5)]
+
+    # glob patterns
+    assert batch.find_images(image_dir / "image[0-1].png") == files[:2]
+    assert batch.is_batch(str(image_dir))
+    assert batch.is_batch(str(image_dir / "*.png"))
+    assert not batch.is_batch(str(files[0]))
+
+
+def test_file_with_glob_characters(image_dir, tmp_path):
+    # an existing file is filtered on its own, even with glob characters in its name
+    file = image_dir / "photo[1].png"
+    (image_dir / "image0.png").rename(file)
+    assert not batch.is_batch(str(file))
+
+    out_file = tmp_path / "gray.png"
+    main([str(file), "-o", str(out_file), "-g", "-i", "numpy"])
+    np.testing.assert_array_equal(io.read_image(out_file), numpy_color2gray(io.read_image(file)))
+
+
+def test_run_batch(image_dir, tmp_path):
+    out_dir = tmp_path / "out"
+    images_per_second = batch.run_batch(image_dir, out_dir, "numpy", "color2sepia", processes=2)
+    assert images_per_second > 0
+
+    # every image is the same as filtering the file on its own
+    for file in batch.find_images(image_dir):
+        single_file = tmp_path / file.name
+        run_filter(str(file), str(single_file), "numpy", "color2sepia")
+        np.testing.assert_array_equal(io.read_image(out_dir / file.name), io.read_image(single_file))
+
+
+def test_cli_batch(image_dir, tmp_path):
+    out_dir = tmp_path / "out"
+    main([str(image_dir / "*.png"), "-o", str(out_dir), "-g", "-i", "numpy", "-p", "1"])
+    assert len(list(out_dir.iterdir())) == 5
+
+    # an output directory is required
+    with pytest.raises(SystemExit):
+        main([str(image_dir), "-g"])
+
+
+def test_output_files(tmp_path):
+    # the same filename in two directories
+    for album in ["a", "b"]:
+        (tmp_path / "in" / album).mkdir(parents=True)
+        io.write_image(io.random_image(40, 30), tmp_path / "in" / album / "image.png")
+    source = str(tmp_path / "in" / "*" / "*.png")
+    files = batch.find_images(source)
+    out_files = batch.output_files(source, files, tmp_path / "out")
+    assert out_files == [tmp_path / "out" / "a" / "image.png", tmp_path / "out" / "b" / "image.png"]
+    assert (tmp_path / "out" / "b").is_dir()
+
+    batch.run_batch(source, tmp_path / "out", "numpy", "color2gray", processes=1)
+    for file, out_file in zip(files, out_files):
+        np.testing.assert_array_equal(io.read_image(out_file), numpy_color2gray(io.read_image(file)))
+
+    # outside of the directory before the wildcard
+    source = str(tmp_path / "in" / "*" / ".." / "a" / "*.png")
+    with pytest.raises(ValueError):
+        batch.output_files(source, batch.find_images(source), tmp_path / "out")
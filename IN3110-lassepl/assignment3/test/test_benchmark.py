@@ -0,0 +1,61 @@
+import json
+
+import pytest
+from in3110_instapy import benchmark
+
+
+@pytest.fixture
+def report():
+    return benchmark.run_benchmarks(
+        sizes=["thumbnail"], implementations=["numpy", "lut"], warmup=1, repeats=3
+    )
+
+
+def test_run_benchmarks(report):
+    # one result per filter and implementation
+    assert len(report["results"]) == 6
+    for result in report["results"]:
+        if result["filter"] == "blur" and result["implementation"] == "lut":
+            assert result["skipped"] == "not implemented"
+            continue
+        assert result["size"] == "thumbnail"
+        assert len(result["times"]) == 3
+        assert result["median"] <= result["p95"]
+        assert result["megapixels_per_s"] > 0
+        assert result["peak_memory_mb"] > 0
+
+    # the results can be written as JSON
+    json.dumps(report)
+
+
+def test_skip_large_python():
+    image = benchmark.io.random_image(1000, 1000)
+    (result,) = benchmark.benchmark_image(image, filters=["color2gray"], implementations=["python"])
+    assert "skipped" in result
+    assert "median" not in result
+
+
+def test_compare(report):
+    assert benchmark.compare(report, report) == []
+
+    # twice as slow is a regression
+    slower = json.loads(json.dumps(report))
+    slower["results"][0]["median"] *= 2
+    (regression,) = benchmark.compare(report, slower, threshold=0.1)
+    assert regression["filter"] == slower["results"][0]["filter"]
+    assert regression["change"] == pytest.approx(1)
+
+
+def test_main(tmp_path):
+    out_file = tmp_path / "benchmark.json"
+    benchmark.main(["run", "-o", str(out_file), "--sizes", "thumbnail", "--implementations", "numba", "--repeats", "2"])
+    benchmark.main(["compare", str(out_file), str(out_file)])
+
+    # a regression exits with an error
+    report = json.loads(out_file.read_text())
+    for result in report["results"]:
+        result["median"] *= 2
+    slower_file = tmp_path / "slower.json"
+    slower_file.write_text(json.dumps(report))
+    with pytest.raises(SystemExit):
+        benchmark.main(["compare", str(out_file), str(slower_file)])
@@ -0,0 +1,146 @@
+import os
+from pathlib import Path
+
+import numpy as np
+import pytest
+from in3110_instapy import batch, io
+from in3110_instapy.cache import ResultCache, cache_dir
+from in3110_instapy.cli import main, run_filter
+
+
+@pytest.fixture
+def image_file(tmp_path):
+    filename = tmp_path / "image.png"
+    io.write_image(io.random_image(40, 30), filename)
+    return filename
+
+
+def test_key(image_file, tmp_path):
+    cache = ResultCache(tmp_path / "cache")
+    key = cache.key(image_file, filter="color2sepia", strength=0.5)
+
+    # the content of the file, not its name
+    copy = tmp_path / "copy.png"
+    copy.write_bytes(image_file.read_bytes())
+    assert cache.key(copy, filter="color2sepia", strength=0.5) == key
+
+    # other parameters, or another image
+    assert cache.key(image_file, filter="color2sepia", strength=0.6) != key
+    io.write_image(io.random_image(40, 30), copy)
+    assert cache.key(copy, filter="color2sepia", strength=0.5) != key
+
+
+def test_run_filter_hit(image_file, tmp_path, monkeypatch):
+    cache = ResultCache(tmp_path / "cache")
+    options = dict(implementation="numpy", filter="color2sepia", strength=0.5, cache=cache)
+
+    run_filter(str(image_file), str(tmp_path / "first.png"), **options)
+    assert (cache.hits, cache.misses) == (0, 1)
+
+    # a hit does not decode or filter the image
+    from in3110_instapy import pipeline
+
+    monkeypatch.setattr(pipeline.Pipeline, "read", lambda *args: pytest.fail("decoded on a cache hit"))
+    run_filter(str(image_file), str(tmp_path / "second.png"), **options)
+    assert (cache.hits, cache.misses) == (1, 1)
+    assert (tmp_path / "second.png").read_bytes() == (tmp_path / "first.png").read_bytes()
+
+    # another output format is another entry
+    with pytest.raises(pytest.fail.Exception):
+        run_filter(str(image_file), str(tmp_path / "third.npy"), **options)
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["hit_rate"], stats["entries"]) == (1, 2, 1 / 3, 1)
+    assert stats["bytes"] == (tmp_path / "first.png").stat().st_size
+
+
+def test_lru_eviction(tmp_path):
+    cache = ResultCache(tmp_path / "cache", max_bytes=10_000)
+    image = np.zeros((40, 50, 3), dtype=np.uint8)  # 6 kB as .raw
+    cache.put("a", ".raw", image)
+    os.utime(cache.path("a", ".raw"), ns=(0, 0))  # older than the next entries
+    cache.put("b", ".raw", image)
+    assert cache.stats()["entries"] == 1
+    assert cache.get("a", ".raw") is None
+    assert cache.get("b", ".raw") == cache.path("b", ".raw")
+
+    # a used entry is kept over a newer, unused, one
+    cache.max_bytes = 15_000
+    os.utime(cache.path("b", ".raw"), ns=(0, 0))
+    cache.put("c", ".raw", image)
+    os.utime(cache.path("c", ".raw"), ns=(1, 1))
+    cache.get("b", ".raw")
+    cache.put("d", ".raw", image)
+    assert cache.get("b", ".raw") and cache.get("d", ".raw") and cache.get("c", ".raw") is None
+
+    cache.clear()
+    assert cache.stats()["entries"] == 0
+    with pytest.raises(ValueError):
+        ResultCache(tmp_path, max_bytes=-1)
+
+
+def test_batch(tmp_path):
+    in_dir = tmp_path / "in"
+    in_dir.mkdir()
+    for i in range(3):
+        io.write_image(io.random_image(40, 30), in_dir / f"image{i}.png")
+    cache = ResultCache(tmp_path / "cache")
+
+    batch.run_batch(in_dir, tmp_path / "out1", "numpy", "color2gray", processes=1, cache=cache)
+    assert (cache.hits, cache.misses) == (0, 3)
+    batch.run_batch(in_dir, tmp_path / "out2", "numpy", "color2gray", processes=1, cache=cache)
+    assert (cache.hits, cache.misses) == (3, 3)
+    for i in range(3):
+        np.testing.assert_array_equal(
+            io.read_image(tmp_path / "out2" / f"image{i}.png"), io.read_image(tmp_path / "out1" / f"image{i}.png")
+        )
+
+
+def test_cli(image_file, tmp_path, monkeypatch, capsys):
+    monkeypatch.setenv("INSTAPY_CACHE_DIR", str(tmp_path / "cache"))
+    assert cache_dir() == tmp_path / "cache" / "results"
+
+    argv = [str(image_file), "-se", "-i", "numpy", "-c"]
+    main(argv + ["-o", str(tmp_path / "first.png")])
+    main(argv + ["-o", str(tmp_path / "second.png")])
+    assert capsys.readouterr().out.split("\n")[:2] == ["Result cache: miss", "Result cache: hit"]
+    assert (tmp_path / "second.png").read_bytes() == (tmp_path / "first.png").read_bytes()
+
+    with pytest.raises(SystemExit):
+        main(argv + ["-r"])
+
+
+def test_evicted_entry(image_file, tmp_path, monkeypatch):
+    cache = ResultCache(tmp_path / "cache")
+    options = dict(implementation="numpy", filter="color2gray", cache=cache)
+    run_filter(str(image_file), str(tmp_path / "first.png"), **options)
+
+    # another process evicts the entry after it was found, before it is copied
+    import shutil
+
+    copyfile = shutil.copyfile
+
+    def evicted_copyfile(source, target):
+        if Path(source).parent == cache.directory:
+            Path(source).unlink()
+        return copyfile(source, target)
+
+    monkeypatch.setattr(shutil, "copyfile", evicted_copyfile)
+    run_filter(str(image_file), str(tmp_path / "second.png"), **options)
+    assert (cache.hits, cache.misses) == (0, 2)
+    assert (tmp_path / "second.png").read_bytes() == (tmp_path / "first.png").read_bytes()
+
+
+def test_scans_above_limit(tmp_path, monkeypatch):
+    cache = ResultCache(tmp_path / "cache", max_bytes=20_000)
+    image = np.zeros((40, 50, 3), dtype=np.uint8)  # 6 kB as .raw
+    scans = []
+    entries = ResultCache._entries
+    monkeypatch.setattr(ResultCache, "_entries", lambda self: scans.append(1) or entries(self))
+
+    # the first put scans, the next only when the running total is above the limit
+    for key in "abc":
+        cache.put(key, ".raw", image)
+    assert len(scans) == 1
+    cache.put("d", ".raw", image)
+    assert len(scans) == 2
+    assert len(entries(cache)) == 3
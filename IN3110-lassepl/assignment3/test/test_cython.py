@@ -1,10 +1,38 @@
 import numpy.testing as nt
+import pytest
 from in3110_instapy.cython_filters import cython_color2gray, cython_color2sepia
 
 
-def test_color2gray(image, reference_gray):
-    ...
+@pytest.mark.parametrize("parallel", [False, True])
+def test_color2gray(image, reference_gray, parallel):
+    filter_image = cython_color2gray(image, parallel=parallel)
 
+    # check that the result has the right shape, type
+    assert filter_image.shape == image.shape
+    assert filter_image.dtype == "uint8"
 
-def test_color2sepia(image, reference_sepia):
-    ...
+    nt.assert_allclose(filter_image, reference_gray, atol=1)
+
+
+@pytest.mark.parametrize("parallel", [False, True])
+def test_color2sepia(image, reference_sepia, parallel):
+    filter_image = cython_color2sepia(image, parallel=parallel)
+
+    # check that the result has the right shape, type
+    assert filter_image.shape == image.shape
+    assert filter_image.dtype == "uint8"
+
+    nt.assert_allclose(filter_image, reference_sepia, atol=1)
+
+
+def test_read_only(image):
+    # arrays from np.asarray(PIL.Image) are read-only
+    expected = cython_color2sepia(image)
+    image.setflags(write=False)
+    nt.assert_array_equal(cython_color2sepia(image), expected)
+
+
+def test_color2gray_single_channel(image):
+    filter_image = cython_color2gray(image, single_channel=True)
+    assert filter_image.shape == image.shape[:2]
+    nt.assert_array_equal(filter_image, cython_color2gray(image)[:, :, 0])
@@ -0,0 +1,92 @@
+"""rgba and uint16 images"""
+import numpy as np
+import pytest
+from in3110_instapy import get_filter
+
+# the implementations with uint16 kernels
+uint16_implementations = ["python", "memoryview", "numpy", "numba", "parallel"]
+
+
+@pytest.fixture
+def rgba_image():
+    # the pure python filters are slow
+    return np.random.randint(0, 255, size=(30, 40, 4), dtype=np.uint8)
+
+
+@pytest.fixture
+def uint16_image():
+    return np.random.randint(0, 65535, size=(30, 40, 3), dtype=np.uint16)
+
+
+@pytest.mark.parametrize("filter_name", ["color2gray", "color2sepia"])
+def test_rgba(rgba_image, load_filter, filter_name, implementation):
+    filter_function = load_filter(filter_name, implementation)
+    filtered = filter_function(rgba_image)
+
+    # the rgb-channels are filtered like an rgb image, the alpha channel is kept
+    assert filtered.shape == rgba_image.shape
+    assert filtered.dtype == np.uint8
+    np.testing.assert_array_equal(filtered[:, :, 3], rgba_image[:, :, 3])
+    rgb = np.ascontiguousarray(rgba_image[:, :, :3])
+    np.testing.assert_array_equal(filtered[:, :, :3], filter_function(rgb))
+
+
+def test_rgba_single_channel(rgba_image, load_filter, implementation):
+    filter_function = load_filter("color2gray", implementation)
+    gray = filter_function(rgba_image, single_channel=True)
+    assert gray.shape == rgba_image.shape[:2]
+    np.testing.assert_array_equal(gray, filter_function(rgba_image)[:, :, 0])
+
+
+@pytest.mark.parametrize("filter_name", ["color2gray", "color2sepia", "blur"])
+@pytest.mark.parametrize("implementation", uint16_implementations)
+def test_uint16(uint16_image, load_filter, filter_name, implementation):
+    filter_function = load_filter(filter_name, implementation)
+    filtered = filter_function(uint16_image)
+    assert filtered.shape == uint16_image.shape
+    assert filtered.dtype == np.uint16
+
+    # the same result as numpy, in the full 16-bit range
+    expected = get_filter(filter_name, "numpy")(uint16_image)
+    np.testing.assert_allclose(filtered, expected, atol=1)
+    assert filtered.max() > 255
+
+    # out arrays have the image type
+    out = np.empty_like(uint16_image)
+    assert filter_function(uint16_image, out=out) is out
+    with pytest.raises(ValueError):
+        filter_function(uint16_image, out=np.empty(uint16_image.shape, dtype=np.uint8))
+
+
+def test_uint16_matches_uint8():
+    # a uint16 image of uint8 values times 257 is filtered like the uint8 image, up to rounding
+    image = np.random.randint(0, 255, size=(30, 40, 4), dtype=np.uint8)
+    for filter_name in ["color2gray", "color2sepia"]:
+        filter_function = get_filter(filter_name, "numba")
+        filtered = filter_function(image.astype(np.uint16) * 257)
+        np.testing.assert_allclose(filtered / 257, filter_function(image), atol=1)
+        # the alpha channel is kept exactly
+        np.testing.assert_array_equal(filtered[:, :, 3], image[:, :, 3].astype(np.uint16) * 257)
+
+
+@pytest.mark.parametrize("implementation", ["numpy", "numba", "parallel"])
+def test_uint16_rgba_inplace(implementation):
+    image = np.random.randint(0, 65535, size=(30, 40, 4), dtype=np.uint16)
+    filter_function = get_filter("color2sepia", implementation)
+    expected = filter_function(image)
+
+    assert filter_function(image, inplace=True) is image
+    np.testing.assert_array_equal(image, expected)
+
+
+@pytest.mark.parametrize("implementation", ["cython", "lut"])
+def test_uint8_only(uint16_image, load_filter, implementation):
+    filter_function = load_filter("color2sepia", implementation)
+    with pytest.raises(ValueError):
+        filter_function(uint16_image)
+
+
+def test_fixed_point_uint8_only(uint16_image):
+    for implementation in ["numpy", "numba"]:
+        with pytest.raises(ValueError):
+            get_filter("color2gray", implementation)(uint16_image, fixed_point=True)
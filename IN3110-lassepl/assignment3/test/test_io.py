@@ -0,0 +1,93 @@
+import numpy as np
+import pytest
+from in3110_instapy import io
+from in3110_instapy.numba_filters import numba_color2gray, numba_color2sepia
+from in3110_instapy.numpy_filters import numpy_color2gray, numpy_color2sepia
+from in3110_instapy.pipeline import Pipeline
+
+
+@pytest.mark.parametrize("suffix", [".npy", ".raw"])
+def test_memmap_roundtrip(tmp_path, image, suffix):
+    filename = tmp_path / f"image{suffix}"
+    io.write_image(image, filename)
+
+    read = io.read_image(filename, shape=image.shape)
+    assert isinstance(read, np.memmap)
+    assert not read.flags.writeable
+    np.testing.assert_array_equal(read, image)
+
+
+def test_raw_needs_shape(tmp_path, image):
+    filename = tmp_path / "image.raw"
+    io.write_image(image, filename)
+    with pytest.raises(ValueError):
+        io.read_image(filename)
+
+
+@pytest.mark.parametrize("suffix", [".npy", ".raw"])
+def test_filter_into_memmap(tmp_path, image, suffix):
+    io.write_image(image, tmp_path / "image.npy")
+    memmap_image = io.read_image(tmp_path / "image.npy")
+
+    # numba sepia and gray
+    out = io.create_image(tmp_path / f"sepia{suffix}", image.shape)
+    assert numba_color2sepia(memmap_image, 0.8, out=out) is out
+    np.testing.assert_array_equal(out, numba_color2sepia(image, 0.8))
+
+    out = io.create_image(tmp_path / f"gray{suffix}", image.shape[:2])
+    numba_color2gray(memmap_image, single_channel=True, out=out)
+    np.testing.assert_array_equal(out, numba_color2gray(image, single_channel=True))
+
+    # numpy sepia streams strips into the output
+    out = io.create_image(tmp_path / f"numpy_sepia{suffix}", image.shape)
+    numpy_color2sepia(memmap_image, 0.5, chunk_pixels=1000, out=out)
+    np.testing.assert_array_equal(out, numpy_color2sepia(image, 0.5))
+
+    # the output is on disk
+    out.flush()
+    np.testing.assert_array_equal(io.read_image(out.filename, shape=image.shape), out)
+
+
+def test_out_shape(image):
+    with pytest.raises(ValueError):
+        numba_color2sepia(image, out=np.empty(image.shape[:2], dtype=np.uint8))
+    with pytest.raises(ValueError):
+        numpy_color2sepia(image, out=np.empty(image.shape, dtype=np.float64))
+
+
+def test_pipeline_npy(tmp_path, image):
+    io.write_image(image, tmp_path / "image.npy")
+    pipeline = Pipeline("color2sepia", "numba", strength=0.5)
+    filtered = pipeline(tmp_path / "image.npy", tmp_path / "sepia.npy")
+    np.testing.assert_array_equal(np.load(tmp_path / "sepia.npy"), filtered)
+    np.testing.assert_array_equal(filtered, numba_color2sepia(image, 0.5))
+
+
+@pytest.mark.parametrize("suffix", [".npy", ".raw"])
+def test_uint16_roundtrip(tmp_path, image, suffix):
+    image = image.astype(np.uint16) * 257
+    filename = tmp_path / f"image{suffix}"
+    io.write_image(image, filename)
+    read = io.read_image(filename, shape=image.shape, dtype=np.uint16)
+    assert read.dtype == np.uint16
+    np.testing.assert_array_equal(read, image)
+
+    created = io.create_image(tmp_path / f"gray{suffix}", image.shape, dtype=np.uint16)
+    numpy_color2gray(image, out=created)
+    assert created.dtype == np.uint16
+    np.testing.assert_array_equal(created, numpy_color2gray(image))
+
+
+@pytest.mark.parametrize("shape", [(31, 45, 3), (31, 45, 4), (31, 45)])
+def test_tiff_roundtrip(tmp_path, shape):
+    image = np.random.randint(0, 255, size=shape, dtype=np.uint8)
+    created = io.create_image(tmp_path / "image.tif", shape)
+    assert isinstance(created, np.memmap)
+    created[:] = image
+    created.flush()
+
+    # an uncompressed TIFF that PIL reads back
+    np.testing.assert_array_equal(io.read_image(tmp_path / "image.tif"), image)
+
+    with pytest.raises(ValueError):
+        io.create_image(tmp_path / "image16.tif", shape, dtype=np.uint16)
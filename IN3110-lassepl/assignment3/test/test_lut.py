@@ -0,0 +1,43 @@
+import numpy as np
+import pytest
+from in3110_instapy.lut_filters import lut_color2gray, lut_color2sepia
+from in3110_instapy.numpy_filters import numpy_color2sepia
+
+
+def test_color2gray(image, reference_gray):
+    filter_image = lut_color2gray(image)
+
+    # check that the result has the right shape, type
+    assert filter_image.shape == image.shape
+    assert filter_image.dtype == "uint8"
+
+    # the table products are the same as the weighted sum, so the result is exact
+    np.testing.assert_array_equal(filter_image, reference_gray)
+
+
+def test_color2gray_single_channel(image, reference_gray):
+    filter_image = lut_color2gray(image, single_channel=True)
+    assert filter_image.shape == image.shape[:2]
+    np.testing.assert_array_equal(filter_image, reference_gray[:, :, 0])
+
+
+def test_color2sepia(image, reference_sepia):
+    filter_image = lut_color2sepia(image)
+
+    # check that the result has the right shape, type
+    assert filter_image.shape == image.shape
+    assert filter_image.dtype == "uint8"
+
+    # the rescale is folded into the tables, which may round differently
+    np.testing.assert_allclose(filter_image, reference_sepia, atol=1)
+
+
+@pytest.mark.parametrize("k", [0, 0.3, 1])
+def test_color2sepia_strength(image, k):
+    np.testing.assert_allclose(lut_color2sepia(image, k), numpy_color2sepia(image, k), atol=1)
+
+
+def test_color2sepia_no_rescale():
+    # a dark image has no sepia values above 255, so nothing is rescaled
+    dark = np.random.randint(0, 100, size=(20, 30, 3), dtype=np.uint8)
+    np.testing.assert_allclose(lut_color2sepia(dark), numpy_color2sepia(dark), atol=1)
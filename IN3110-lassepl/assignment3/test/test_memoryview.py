@@ -0,0 +1,123 @@
+import subprocess
+import sys
+from array import array
+
+import numpy as np
+import pytest
+from in3110_instapy import numpy_filters
+from in3110_instapy.memoryview_filters import (
+    SEPIA_RESCALES,
+    color2gray_buffer,
+    color2sepia_buffer,
+    memoryview_color2gray,
+    memoryview_color2sepia,
+)
+from in3110_instapy.python_filters import python_color2gray, python_color2sepia
+
+
+def test_color2gray(image, reference_gray):
+    filter_image = memoryview_color2gray(image)
+
+    # check that the result has the right shape, type
+    assert filter_image.shape == image.shape
+    assert filter_image.dtype == "uint8"
+
+    # the same arithmetic as the python reference
+    np.testing.assert_array_equal(filter_image, reference_gray)
+
+
+def test_color2sepia(image, reference_sepia):
+    filter_image = memoryview_color2sepia(image)
+
+    # check that the result has the right shape, type
+    assert filter_image.shape == image.shape
+    assert filter_image.dtype == "uint8"
+
+    np.testing.assert_array_equal(filter_image, reference_sepia)
+
+
+def test_color2sepia_strength():
+    image = np.random.randint(0, 255, size=(30, 40, 3), dtype=np.uint8)
+    for k in [0, 0.3, 1]:
+        np.testing.assert_array_equal(memoryview_color2sepia(image, k), python_color2sepia(image, k))
+    with pytest.raises(ValueError):
+        memoryview_color2sepia(image, 2)
+
+
+def test_color2gray_single_channel(image):
+    filter_image = memoryview_color2gray(image, single_channel=True)
+    assert filter_image.shape == image.shape[:2]
+    np.testing.assert_array_equal(filter_image, memoryview_color2gray(image)[:, :, 0])
+
+
+def test_strided_image():
+    # a view of every other column, and an output that is not contiguous either
+    image = np.random.randint(0, 255, size=(30, 80, 3), dtype=np.uint8)[:, ::2]
+    out = np.zeros((30, 80, 3), dtype=np.uint8)[:, ::2]
+    memoryview_color2sepia(image, 0.5, out=out)
+    np.testing.assert_array_equal(out, python_color2sepia(image, 0.5))
+
+
+def test_buffers():
+    image = np.random.randint(0, 255, size=(10, 20, 4), dtype=np.uint8)
+    expected_gray = python_color2gray(image)
+    expected_sepia = python_color2sepia(image, 0.8)
+
+    # bytes in, a new array('B') out
+    gray = color2gray_buffer(image.tobytes(), channels=4)
+    assert isinstance(gray, array) and gray.typecode == "B"
+    assert gray.tobytes() == expected_gray.tobytes()
+
+    # array('B') in, written into a bytearray
+    out = bytearray(image.size)
+    assert color2sepia_buffer(array("B", image.tobytes()), 0.8, channels=4, out=out) is out
+    assert bytes(out) == expected_sepia.tobytes()
+
+    # in place
+    pixels = bytearray(image.tobytes())
+    color2sepia_buffer(pixels, 0.8, channels=4, out=pixels)
+    assert bytes(pixels) == expected_sepia.tobytes()
+
+    # one gray value per pixel
+    gray = color2gray_buffer(image.tobytes(), channels=4, single_channel=True)
+    assert gray.tobytes() == expected_gray[:, :, 0].tobytes()
+
+
+def test_uint16_buffer():
+    image = np.random.randint(0, 65535, size=(10, 20, 3), dtype=np.uint16)
+    sepia = color2sepia_buffer(array("H", image.tobytes()))
+    assert sepia.typecode == "H"
+    np.testing.assert_array_equal(np.frombuffer(sepia, dtype=np.uint16).reshape(image.shape), python_color2sepia(image))
+
+
+def test_buffer_errors():
+    with pytest.raises(ValueError):
+        # float values
+        color2gray_buffer(array("d", [0.0] * 6))
+    with pytest.raises(ValueError):
+        # not whole pixels
+        color2gray_buffer(bytes(7))
+    with pytest.raises(ValueError):
+        # an output of the wrong length
+        color2sepia_buffer(bytes(6), out=bytearray(3))
+
+
+def test_without_numpy():
+    # the buffer filters only need the standard library
+    code = (
+        "import sys; sys.modules['numpy'] = None\n"
+        "from in3110_instapy.memoryview_filters import color2sepia_buffer\n"
+        "print(list(color2sepia_buffer(bytes([255, 128, 0]))))"
+    )
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    expected = python_color2sepia(np.array([[[255, 128, 0]]], dtype=np.uint8))[0, 0].tolist()
+    assert result.stdout.strip() == str(expected)
+    assert SEPIA_RESCALES == numpy_filters.SEPIA_RESCALES
+
+
+@pytest.mark.parametrize("shape", [(0, 5, 3), (5, 0, 4)])
+def test_empty(shape):
+    image = np.zeros(shape, dtype=np.uint8)
+    assert memoryview_color2sepia(image).shape == shape
+    assert memoryview_color2gray(image, single_channel=True).shape == shape[:2]
+    assert len(color2gray_buffer(image, channels=shape[2])) == 0
@@ -1,5 +1,6 @@
 import numpy as np
-from in3110_instapy.numba_filters import numba_color2gray, numba_color2sepia
+import pytest
+from in3110_instapy.numba_filters import numba_blur, numba_color2gray, numba_color2sepia
 
 
 def test_color2gray(image):
@@ -49,3 +50,45 @@ def test_color2sepia(image):
             rs * sepia_matrix[2][0] + gs * sepia_matrix[2][1] + bs * sepia_matrix[2][2]
         ]
         np.testing.assert_allclose(actual, expected, rtol=0.15)  # Within 15%
+
+
+def test_precompile(image):
+    from in3110_instapy.numba_filters import IMAGE_TYPES, _color2gray, precompile
+
+    precompile()
+    assert len(_color2gray.signatures) >= len(IMAGE_TYPES)
+
+    # read-only arrays, as from np.asarray(PIL.Image), use a precompiled signature
+    n_signatures = len(_color2gray.signatures)
+    image.setflags(write=False)
+    numba_color2gray(image)
+    assert len(_color2gray.signatures) == n_signatures
+
+
+def test_fixed_point(image):
+    from in3110_instapy.numpy_filters import numpy_color2gray, numpy_color2sepia
+
+    # the integer kernels are within +-1 of the float result, and identical to numpy's fixed-point kernels
+    expected = numpy_color2gray(image, fixed_point=True)
+    np.testing.assert_array_equal(numba_color2gray(image, fixed_point=True), expected)
+    np.testing.assert_allclose(expected, numba_color2gray(image).astype(int), atol=1)
+
+    for k in [0, 0.37, 1]:
+        expected = numpy_color2sepia(image, k, fixed_point=True)
+        np.testing.assert_array_equal(numba_color2sepia(image, k, fixed_point=True), expected)
+        np.testing.assert_allclose(expected, numba_color2sepia(image, k).astype(int), atol=1)
+
+
+def test_color2gray_single_channel(image):
+    filter_image = numba_color2gray(image, single_channel=True)
+    assert filter_image.shape == image.shape[:2]
+    assert filter_image.dtype == "uint8"
+    np.testing.assert_array_equal(filter_image, numba_color2gray(image)[:, :, 0])
+
+
+@pytest.mark.parametrize("size", [1, 3, 7, 25, 501])
+def test_blur(image, size):
+    from in3110_instapy.numpy_filters import numpy_blur
+
+    # the running sums are the same as the summed-area table, also for kernels larger than the image
+    np.testing.assert_array_equal(numba_blur(image, size), numpy_blur(image, size))
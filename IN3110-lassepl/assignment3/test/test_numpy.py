@@ -1,5 +1,6 @@
 import numpy as np
-from in3110_instapy.numpy_filters import numpy_color2gray, numpy_color2sepia
+import pytest
+from in3110_instapy.numpy_filters import numpy_blur, numpy_color2gray, numpy_color2sepia
 
 
 def test_color2gray(image):
@@ -42,3 +43,63 @@ def test_color2sepia(image):
             np.testing.assert_allclose(actual, expected,
                                        rtol=0.2,  # Because of the scaling down to avoid overflow I add an absolute
                                        atol=50)  # tolerance here
+
+
+def test_color2sepia_chunked(image):
+    for k in [0, 0.6, 1]:
+        expected = numpy_color2sepia(image, k)
+
+        # small strips, single rows and a single strip should all give the same image
+        for chunk_pixels in [1, 1000, image.shape[0] * image.shape[1]]:
+            filter_image = numpy_color2sepia(image, k, chunk_pixels=chunk_pixels)
+            np.testing.assert_array_equal(filter_image, expected)
+
+
+def test_fixed_point(image):
+    # the integer kernels are within +-1 of the float result
+    gray = numpy_color2gray(image).astype(int)
+    np.testing.assert_allclose(numpy_color2gray(image, fixed_point=True), gray, atol=1)
+
+    for k in [0, 0.37, 1]:
+        sepia = numpy_color2sepia(image, k).astype(int)
+        np.testing.assert_allclose(numpy_color2sepia(image, k, fixed_point=True), sepia, atol=1)
+
+    # also when the image is too dark to need the rescale
+    dark = image // 3
+    np.testing.assert_allclose(numpy_color2sepia(dark, fixed_point=True), numpy_color2sepia(dark), atol=1)
+
+
+def test_color2gray_single_channel(image):
+    filter_image = numpy_color2gray(image, single_channel=True)
+    assert filter_image.shape == image.shape[:2]
+    assert filter_image.dtype == "uint8"
+    np.testing.assert_array_equal(filter_image, numpy_color2gray(image)[:, :, 0])
+
+
+@pytest.mark.parametrize("size", [1, 3, 7, 25])
+def test_blur(image, size):
+    filter_image = numpy_blur(image, size)
+    assert filter_image.shape == image.shape
+    assert filter_image.dtype == "uint8"
+
+    # the rounded mean of every size x size window, with the edges repeated
+    radius = size // 2
+    padded = np.pad(image.astype(int), ((radius, radius), (radius, radius), (0, 0)), mode="edge")
+    h, w = image.shape[:2]
+    sums = sum(padded[y:y + h, x:x + w] for y in range(size) for x in range(size))
+    np.testing.assert_array_equal(filter_image, (sums + size * size // 2) // (size * size))
+
+    with pytest.raises(ValueError):  # even sizes have no center pixel
+        numpy_blur(image, size + 1)
+
+
+@pytest.mark.parametrize("shape", [(0, 5, 3), (5, 0, 3), (0, 0, 4)])
+def test_empty(shape):
+    image = np.zeros(shape, dtype=np.uint8)
+    assert numpy_color2gray(image).shape == shape
+    assert numpy_color2gray(image, fixed_point=True, single_channel=True).shape == shape[:2]
+    assert numpy_blur(image).shape == shape
+    for options in [{}, {"chunk_pixels": 16}, {"fixed_point": True}, {"rescale": "channels"}, {"rescale": 300.0}]:
+        assert numpy_color2sepia(image, **options).shape == shape
+    assert numpy_color2sepia(image, out=np.empty_like(image)).shape == shape
+    assert numpy_color2sepia(image, 0.5, inplace=True) is image
@@ -0,0 +1,58 @@
+"""out= and inplace= for every filter behind get_filter"""
+import numpy as np
+import pytest
+from in3110_instapy import get_filter
+
+
+@pytest.mark.parametrize("filter_name", ["color2gray", "color2sepia", "blur"])
+def test_out(small_image, load_filter, filter_name, implementation):
+    filter_function = load_filter(filter_name, implementation)
+    expected = filter_function(small_image)
+
+    out = np.zeros_like(expected)
+    assert filter_function(small_image, out=out) is out
+    np.testing.assert_array_equal(out, expected)
+
+    with pytest.raises(ValueError):  # wrong shape
+        filter_function(small_image, out=np.zeros(small_image.shape[:2], dtype=np.uint8))
+
+
+@pytest.mark.parametrize("filter_name", ["color2gray", "color2sepia", "blur"])
+def test_inplace(small_image, load_filter, filter_name, implementation):
+    filter_function = load_filter(filter_name, implementation)
+    expected = filter_function(small_image)
+
+    # every pixel is read before it is written
+    result = filter_function(small_image, inplace=True)
+    assert np.shares_memory(result, small_image)
+    np.testing.assert_array_equal(small_image, expected)
+
+
+def test_inplace_rgba_sepia(load_filter, implementation):
+    filter_function = load_filter("color2sepia", implementation)
+    image = np.random.randint(0, 255, size=(20, 30, 4), dtype=np.uint8)
+    expected = filter_function(image)
+    alpha = image[:, :, 3].copy()
+
+    # the rgb-channels are overwritten, the alpha channel is kept
+    filter_function(image, inplace=True)
+    np.testing.assert_array_equal(image, expected)
+    np.testing.assert_array_equal(image[:, :, 3], alpha)
+
+
+def test_single_channel_out(small_image, load_filter, implementation):
+    filter_function = load_filter("color2gray", implementation)
+    out = np.zeros(small_image.shape[:2], dtype=np.uint8)
+    filter_function(small_image, single_channel=True, out=out)
+    np.testing.assert_array_equal(out, filter_function(small_image, single_channel=True))
+
+
+def test_inplace_errors(small_image):
+    filter_function = get_filter("color2sepia", "numba")
+    with pytest.raises(ValueError):  # read-only
+        small_image.flags.writeable = False
+        filter_function(small_image, inplace=True)
+    with pytest.raises(ValueError):  # both
+        filter_function(small_image.copy(), out=small_image.copy(), inplace=True)
+    with pytest.raises(ValueError):  # a single channel can not be written into the image
+        get_filter("color2gray", "numba")(small_image.copy(), single_channel=True, inplace=True)
@@ -5,6 +5,9 @@ Tests that the package is installed and importable.
 These tests should pass after task 1,
 before you've done any implementation.
 """
+import subprocess
+import sys
+import time
 from pathlib import Path
 
 import numpy as np
@@ -12,6 +15,9 @@ import pytest
 
 test_dir = Path(__file__).absolute().parent
 
+# Modules that take most of the start-up time of a run, and are not needed to parse the arguments
+HEAVY_MODULES = ["numpy", "PIL", "numba", "Cython", "line_profiler", "in3110_instapy.pipeline"]
+
 
 def test_import():
     """Can we import our package at all"""
@@ -24,7 +30,7 @@ def test_import():
 )
 @pytest.mark.parametrize(
     "implementation",
-    ["python", "numpy", "numba"],
+    ["python", "memoryview", "numpy", "numba", "parallel", "lut", "auto"],
 )
 def test_get_filter(filter_name, implementation):
     """Can we load our filter functions"""
@@ -42,3 +48,62 @@ def test_io():
     assert len(image.shape) == 3
     assert image.dtype == np.uint8
     assert image.shape[2] == 3
+
+
+def _loaded_heavy_modules(code: str) -> list:
+    """Run code in a new interpreter, and return the heavy modules it imported"""
+    script = f"""
+import sys
+{code}
+print("modules:" + ",".join(name for name in {HEAVY_MODULES!r} if name in sys.modules))
+"""
+    result = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True, check=True)
+    modules = result.stdout.rpartition("modules:")[2].strip()
+    return [name for name in modules.split(",") if name]
+
+
+@pytest.mark.parametrize(
+    "argv",
+    [["--help"], ["rain.jpg"], ["rain.jpg", "-se", "-l"], ["rain.jpg", "-g", "-sc", "-1"]],
+)
+def test_cli_arguments_import_nothing_heavy(argv):
+    """--help and invalid arguments exit before importing numpy, PIL or a filter module"""
+    code = f"""
+from in3110_instapy.cli import main
+try:
+    main({argv!r})
+except SystemExit:
+    pass
+"""
+    assert _loaded_heavy_modules(code) == []
+
+
+def test_backend_imported_when_selected():
+    """Selecting a filter only imports its own backend"""
+    code = """
+import in3110_instapy
+in3110_instapy.get_filter("color2gray", "numpy")
+"""
+    assert _loaded_heavy_modules(code) == ["numpy"]
+
+
+def test_help_startup_time():
+    """`in3110_instapy --help` imports none of the heavy modules, and reports how long it takes
+
+    The time includes the -X importtime bookkeeping, and depends on the load of the machine,
+    so it is only printed (see with `pytest -s`).
+    """
+    start_time = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-m", "in3110_instapy", "--help"],
+        capture_output=True, text=True, check=True,
+    )
+    help_time = time.perf_counter() - start_time
+
+    # -X importtime writes a line per imported module: "import time: self | cumulative | module"
+    imported = {
+        line.rpartition("|")[2].strip() for line in result.stderr.splitlines() if line.startswith("import time:")
+    }
+    assert "in3110_instapy.cli" in imported
+    assert [name for name in HEAVY_MODULES if name in imported] == []
+    print(f"in3110_instapy --help took {help_time:.3f}s")
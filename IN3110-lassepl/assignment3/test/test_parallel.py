@@ -0,0 +1,75 @@
+import numba
+import numpy as np
+import pytest
+from in3110_instapy.parallel_filters import parallel_blur, parallel_color2gray, parallel_color2sepia
+
+
+@pytest.mark.parametrize("tile_rows", [1, 7, 64, 1000])
+def test_color2gray(image, reference_gray, tile_rows):
+    filter_image = parallel_color2gray(image, tile_rows=tile_rows)
+
+    # check that the result has the right shape, type
+    assert filter_image.shape == image.shape
+    assert filter_image.dtype == "uint8"
+
+    # the tiles must cover the whole image and match the reference
+    np.testing.assert_allclose(filter_image, reference_gray, atol=1)
+
+
+@pytest.mark.parametrize("tile_rows", [1, 7, 64, 1000])
+def test_color2sepia(image, reference_sepia, tile_rows):
+    filter_image = parallel_color2sepia(image, tile_rows=tile_rows)
+
+    # check that the result has the right shape, type
+    assert filter_image.shape == image.shape
+    assert filter_image.dtype == "uint8"
+
+    # the global max must be found across all tiles
+    np.testing.assert_allclose(filter_image, reference_sepia, atol=1)
+
+
+def test_n_threads(image):
+    single = parallel_color2sepia(image, n_threads=1)
+    all_cores = parallel_color2sepia(image)
+    np.testing.assert_array_equal(single, all_cores)
+
+
+def test_tile_rows_positive(image):
+    with pytest.raises(ValueError):
+        parallel_color2gray(image, tile_rows=0)
+
+
+def test_color2gray_single_channel(image):
+    filter_image = parallel_color2gray(image, single_channel=True)
+    assert filter_image.shape == image.shape[:2]
+    assert filter_image.dtype == "uint8"
+    np.testing.assert_array_equal(filter_image, parallel_color2gray(image)[:, :, 0])
+
+
+@pytest.mark.parametrize("tile_rows", [1, 7, 64, 1000])
+def test_blur(image, tile_rows):
+    from in3110_instapy.numba_filters import numba_blur
+
+    # every tile reads the rows around it
+    for size in [3, 9]:
+        np.testing.assert_array_equal(parallel_blur(image, size, tile_rows=tile_rows), numba_blur(image, size))
+
+
+def test_threads_restored(image):
+    # n_threads only applies to the call, the thread count of the caller is kept
+    numba.set_num_threads(1)
+    parallel_color2sepia(image)
+    assert numba.get_num_threads() == 1
+
+    all_threads = numba.config.NUMBA_NUM_THREADS
+    numba.set_num_threads(all_threads)
+    parallel_color2gray(image, n_threads=1)
+    parallel_blur(image, n_threads=1)
+    assert numba.get_num_threads() == all_threads
+
+
+@pytest.mark.parametrize("shape", [(0, 5, 3), (5, 0, 3), (0, 0, 4)])
+def test_empty(shape):
+    image = np.zeros(shape, dtype=np.uint8)
+    for filter_function in [parallel_color2gray, parallel_color2sepia, parallel_blur]:
+        assert filter_function(image).shape == shape
@@ -0,0 +1,63 @@
+from pathlib import Path
+
+import numpy as np
+import pytest
+from in3110_instapy import get_filter, io
+from in3110_instapy.pipeline import Pipeline
+from PIL import Image
+
+test_dir = Path(__file__).absolute().parent
+
+
+@pytest.mark.parametrize("implementation", ["python", "numpy", "numba", "parallel"])
+def test_sepia_strength(image, implementation):
+    # every implementation blends the strength the same way as numpy,
+    # up to the rounding of the different summation orders
+    for k in [0, 0.4, 1]:
+        expected = get_filter("color2sepia", "numpy")(image, k)
+        pipeline = Pipeline("color2sepia", implementation, strength=k)
+        np.testing.assert_allclose(pipeline.apply(image), expected, atol=1)
+
+
+def test_pipeline(tmp_path):
+    out_file = tmp_path / "rain_sepia.png"
+    pipeline = Pipeline("color2sepia", "numba", scale=0.5, strength=0.7)
+    filtered = pipeline(test_dir / "rain.jpg", out_file)
+
+    # scaled to half size, and saved
+    w, h = Image.open(test_dir / "rain.jpg").size
+    assert filtered.shape == (h // 2, w // 2, 3)
+    np.testing.assert_array_equal(io.read_image(out_file), filtered)
+
+
+def test_pipeline_validation():
+    with pytest.raises(ValueError):
+        Pipeline("color2sepia", "numpy", strength=2)
+    with pytest.raises(ValueError):
+        Pipeline("color2gray", "numpy", scale=0)
+
+
+def test_single_channel(tmp_path):
+    from in3110_instapy.cli import main
+
+    out_file = tmp_path / "rain_gray.png"
+    main([str(test_dir / "rain.jpg"), "-o", str(out_file), "-g", "-l", "-i", "numpy"])
+    assert Image.open(out_file).mode == "L"
+
+    with pytest.raises(ValueError):
+        Pipeline("color2sepia", "numpy", single_channel=True)
+
+
+def test_runtime(tmp_path, capsys):
+    from in3110_instapy.cli import main, time_stages
+
+    out_file = tmp_path / "rain_sepia.jpg"
+    times = time_stages(test_dir / "rain.jpg", out_file, "numba", "color2sepia", scale=0.5, n_runs=2, warmup=True)
+    assert sorted(times) == ["decode", "encode", "filter", "resize"]
+    assert all(t > 0 for t in times.values())
+    assert out_file.exists()
+
+    main([str(test_dir / "rain.jpg"), "-g", "-i", "numpy", "-r", "-n", "2", "-w"])
+    out = capsys.readouterr().out
+    assert "Timing over 2 runs (jit warm-up excluded)" in out
+    assert "filter:" in out
@@ -0,0 +1,99 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+from in3110_instapy import batch, io
+from in3110_instapy.cli import main, run_filter
+from in3110_instapy.pipeline import Pipeline
+from in3110_instapy.prefetch import prefetched, run_prefetch
+
+
+@pytest.fixture
+def image_dir(tmp_path):
+    """Directory with a few small images"""
+    in_dir = tmp_path / "in"
+    in_dir.mkdir()
+    for i in range(8):
+        io.write_image(io.random_image(40, 30), in_dir / f"image{i}.png")
+    return in_dir
+
+
+def test_prefetched():
+    running = []
+    most_ahead = 0
+    lock = threading.Lock()
+
+    def square(n):
+        nonlocal most_ahead
+        with lock:
+            running.append(n)
+            most_ahead = max(most_ahead, len(running))
+        time.sleep(0.01)
+        with lock:
+            running.remove(n)
+        return n * n
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        assert list(prefetched(square, range(20), 3, executor)) == [n * n for n in range(20)]
+        # never more than in_flight items at once
+        assert 1 < most_ahead <= 3
+        with pytest.raises(ValueError):
+            list(prefetched(square, range(3), 0, executor))
+
+
+def test_run_prefetch(image_dir, tmp_path):
+    out_dir = tmp_path / "out"
+    assert run_prefetch(image_dir, out_dir, "numpy", "color2sepia", strength=0.5, in_flight=3) > 0
+
+    # every image is the same as filtering the file on its own
+    for file in batch.find_images(image_dir):
+        single_file = tmp_path / file.name
+        run_filter(str(file), str(single_file), "numpy", "color2sepia", strength=0.5)
+        np.testing.assert_array_equal(io.read_image(out_dir / file.name), io.read_image(single_file))
+
+
+def test_reads_overlap(image_dir, tmp_path, monkeypatch):
+    # slow storage: every read waits 50 ms, 400 ms for the files one after the other
+    read = Pipeline.read
+    monkeypatch.setattr(Pipeline, "read", lambda self, file: time.sleep(0.05) or read(self, file))
+    start_time = time.perf_counter()
+    run_prefetch(image_dir, tmp_path / "out", "numpy", in_flight=4)
+    assert time.perf_counter() - start_time < 0.3
+    assert len(list((tmp_path / "out").iterdir())) == 8
+
+
+def test_errors(image_dir, tmp_path, monkeypatch):
+    with pytest.raises(FileNotFoundError):
+        run_prefetch(tmp_path / "*.jpg", tmp_path / "out", "numpy")
+    with pytest.raises(ValueError):
+        run_prefetch(image_dir, tmp_path / "out", "numpy", in_flight=0)
+
+    # a failed write is raised in the calling thread
+    def fail(self, image, out_file):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(Pipeline, "write", fail)
+    with pytest.raises(OSError):
+        run_prefetch(image_dir, tmp_path / "out", "numpy")
+
+
+def test_cli(image_dir, tmp_path):
+    out_dir = tmp_path / "out"
+    main([str(image_dir / "*.png"), "-o", str(out_dir), "-g", "-i", "numpy", "-f", "2"])
+    assert len(list(out_dir.iterdir())) == 8
+
+    for argv in [["-f", "0"], ["-f", "2", "-p", "2"], ["-f", "2", "-c"]]:
+        with pytest.raises(SystemExit):
+            main([str(image_dir), "-o", str(out_dir), "-g"] + argv)
+    with pytest.raises(SystemExit):  # a single file
+        main([str(image_dir / "image0.png"), "-o", str(tmp_path / "x.png"), "-g", "-f", "2"])
+
+
+def test_subdirectories(tmp_path):
+    for album in ["a", "b"]:
+        (tmp_path / "in" / album).mkdir(parents=True)
+        io.write_image(io.random_image(40, 30), tmp_path / "in" / album / "image.png")
+    run_prefetch(str(tmp_path / "in" / "*" / "*.png"), tmp_path / "out", "numpy", in_flight=2)
+    assert (tmp_path / "out" / "a" / "image.png").exists() and (tmp_path / "out" / "b" / "image.png").exists()
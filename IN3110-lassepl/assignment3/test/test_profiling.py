@@ -0,0 +1,39 @@
+from in3110_instapy import io, profiling
+from in3110_instapy.lut_filters import lut_color2gray
+
+
+def test_collapsed_stacks(tmp_path):
+    collapsed_file = tmp_path / "lut.collapsed"
+    profiling.profile_with_cprofile(lut_color2gray, io.random_image(), collapsed_file=collapsed_file)
+
+    lines = collapsed_file.read_text().splitlines()
+    assert lines
+    for line in lines:
+        stack, microseconds = line.rsplit(" ", 1)
+        assert int(microseconds) >= 1
+
+    # the helper is nested under the filter function
+    assert any(line.startswith("lut_color2gray (lut_filters.py") and "_weighted_sum" in line for line in lines)
+
+
+def test_time_first_call():
+    first_time, steady_time = profiling.time_first_call(lut_color2gray, io.random_image())
+    assert first_time > 0
+    assert steady_time > 0
+
+
+def test_main(tmp_path, capsys):
+    profiling.main(
+        ["--size", "64x48", "--implementations", "numpy", "numba", "--filters", "color2sepia",
+         "--calls", "2", "--collapsed", str(tmp_path)]
+    )
+    out = capsys.readouterr().out
+
+    # both profilers, the first call and the collapsed stacks of each implementation
+    assert "Profiling numba color2sepia with cprofile" in out
+    assert "Profiling numpy color2sepia with line_profiler" in out
+    assert "First call:" in out
+    assert sorted(p.name for p in tmp_path.iterdir()) == [
+        "numba_color2sepia.collapsed",
+        "numpy_color2sepia.collapsed",
+    ]
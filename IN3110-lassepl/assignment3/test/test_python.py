@@ -1,5 +1,5 @@
 import numpy as np
-from in3110_instapy.python_filters import python_color2gray, python_color2sepia
+from in3110_instapy.python_filters import python_blur, python_color2gray, python_color2sepia
 
 
 def test_color2gray(image):
@@ -49,3 +49,19 @@ def test_color2sepia(image):
             rs * sepia_matrix[2][0] + gs * sepia_matrix[2][1] + bs * sepia_matrix[2][2]
         ]
         np.testing.assert_allclose(actual, expected, rtol=0.15)  # Within 15%
+
+
+def test_color2gray_single_channel(image):
+    filter_image = python_color2gray(image, single_channel=True)
+    assert filter_image.shape == image.shape[:2]
+    assert filter_image.dtype == "uint8"
+    np.testing.assert_array_equal(filter_image, python_color2gray(image)[:, :, 0])
+
+
+def test_blur():
+    from in3110_instapy.numpy_filters import numpy_blur
+
+    # a small image, the pure python loops are slow
+    image = np.random.randint(0, 255, size=(20, 30, 3), dtype=np.uint8)
+    for size in [1, 3, 5]:
+        np.testing.assert_array_equal(python_blur(image, size), numpy_blur(image, size))
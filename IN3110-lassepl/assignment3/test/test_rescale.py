@@ -0,0 +1,95 @@
+"""the rescale modes of the sepia filters"""
+import tracemalloc
+
+import numpy as np
+import pytest
+from conftest import IMPLEMENTATIONS
+from in3110_instapy import get_filter
+from in3110_instapy.numpy_filters import SEPIA_MATRIX, SEPIA_MATRIX_FIXED, numpy_color2sepia, sepia_max
+
+
+def test_sepia_max(small_image):
+    assert sepia_max(small_image, SEPIA_MATRIX, "max") is None
+
+    # the bound from the largest value of each channel
+    channel_max = small_image.max(axis=(0, 1))
+    np.testing.assert_allclose(sepia_max(small_image, SEPIA_MATRIX, "channels"), SEPIA_MATRIX[0] @ channel_max)
+    assert sepia_max(small_image, SEPIA_MATRIX_FIXED, "channels") == SEPIA_MATRIX_FIXED[0] @ channel_max
+    # is at least the largest sepia value
+    assert sepia_max(small_image, SEPIA_MATRIX, "channels") >= (small_image @ SEPIA_MATRIX.T).max()
+
+    # the sepia value of white
+    np.testing.assert_allclose(sepia_max(small_image, SEPIA_MATRIX, "range"), 255 * SEPIA_MATRIX[0].sum())
+    np.testing.assert_allclose(
+        sepia_max(small_image.astype(np.uint16), SEPIA_MATRIX, "range"), 65535 * SEPIA_MATRIX[0].sum()
+    )
+
+    with pytest.raises(ValueError):
+        sepia_max(small_image, SEPIA_MATRIX, "mean")
+
+
+def test_rescale_modes(small_image):
+    # with a white pixel, the channel maxima are in one pixel, so the bound is exact
+    small_image[0, 0] = 255
+    np.testing.assert_array_equal(numpy_color2sepia(small_image, rescale="channels"), numpy_color2sepia(small_image))
+    np.testing.assert_array_equal(numpy_color2sepia(small_image, rescale="range"), numpy_color2sepia(small_image))
+
+    # without one, the bound only makes the sepia a little darker
+    small_image[0, 0] = 0
+    small_image[:, :, 0] = np.minimum(small_image[:, :, 0], 200)
+    exact = numpy_color2sepia(small_image)
+    channels = numpy_color2sepia(small_image, rescale="channels")
+    assert (channels <= exact).all()
+    assert (numpy_color2sepia(small_image, rescale="range") <= channels).all()
+
+    # the strips skip their first pass, with the same result
+    np.testing.assert_array_equal(numpy_color2sepia(small_image, chunk_pixels=100, rescale="channels"), channels)
+
+    # no overflow, no rescale
+    dark = small_image // 4
+    np.testing.assert_array_equal(numpy_color2sepia(dark, rescale="channels"), numpy_color2sepia(dark))
+
+    with pytest.raises(ValueError):
+        numpy_color2sepia(small_image, rescale="mean")
+
+
+def test_single_pass_memory():
+    # with a known max value, numpy writes the output strip by strip, without float copies of the image
+    image = np.random.randint(0, 255, size=(1500, 1000, 3), dtype=np.uint8)
+    tracemalloc.start()
+    numpy_color2sepia(image, 0.7, rescale="range")
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    assert peak < 2 * image.nbytes  # a float64 copy is 8 * image.nbytes
+
+
+@pytest.mark.parametrize("rescale", ["channels", "range"])
+@pytest.mark.parametrize("implementation", IMPLEMENTATIONS + ["auto"])
+def test_rescale(small_image, load_filter, implementation, rescale):
+    filter_function = load_filter("color2sepia", implementation)
+
+    expected = numpy_color2sepia(small_image, 0.8, rescale=rescale)
+    # the float sums of the implementations can differ in the last bit
+    np.testing.assert_allclose(filter_function(small_image, 0.8, rescale=rescale), expected, atol=1)
+
+
+@pytest.mark.parametrize("rescale", ["channels", "range"])
+@pytest.mark.parametrize("implementation", ["numpy", "numba"])
+def test_rescale_fixed_point(small_image, implementation, rescale):
+    filter_function = get_filter("color2sepia", implementation)
+    result = filter_function(small_image, 0.8, fixed_point=True, rescale=rescale)
+    # the fixed-point filters agree with each other, and with the float filter within +-1
+    np.testing.assert_array_equal(result, numpy_color2sepia(small_image, 0.8, fixed_point=True, rescale=rescale))
+    np.testing.assert_allclose(result, numpy_color2sepia(small_image, 0.8, rescale=rescale), atol=1)
+
+
+@pytest.mark.parametrize("implementation", ["numpy", "numba"])
+def test_fixed_point_number(small_image, implementation):
+    # a given largest sepia value is of the float weights, and converted for the fixed-point weights
+    assert sepia_max(small_image, SEPIA_MATRIX_FIXED, 100.0) == 100 * 4096
+    filter_function = get_filter("color2sepia", implementation)
+    current_max = (small_image @ SEPIA_MATRIX.T).max()
+    for k in [0.5, 1]:
+        filtered = filter_function(small_image, k, fixed_point=True, rescale=current_max)
+        np.testing.assert_allclose(filtered, filter_function(small_image, k, fixed_point=True), atol=1)
+        np.testing.assert_allclose(filtered, filter_function(small_image, k), atol=1)
@@ -0,0 +1,134 @@
+import asyncio
+from io import BytesIO
+
+import numpy as np
+import pytest
+from in3110_instapy import io, service
+from in3110_instapy.numba_filters import numba_color2gray, numba_color2sepia
+from in3110_instapy.pipeline import Pipeline
+from PIL import Image
+
+
+def test_filter_batch():
+    # two widths, so two stacked gray calls
+    images = [io.random_image(40, 30), io.random_image(40, 10), io.random_image(20, 30), io.random_image(40, 5)]
+    results = service.filter_batch(images, "color2gray", "numba", 1, True)
+    assert len(results) == len(images)
+    for image, result in zip(images, results):
+        np.testing.assert_array_equal(result, numba_color2gray(image, single_channel=True))
+
+    # sepia depends on the maximum of each image
+    results = service.filter_batch(images, "color2sepia", "numba", 0.7, False)
+    for image, result in zip(images, results):
+        np.testing.assert_array_equal(result, numba_color2sepia(image, 0.7))
+
+
+
+def test_filter_batch_auto(monkeypatch):
+    from in3110_instapy import auto_filters
+    from in3110_instapy.numpy_filters import numpy_color2gray
+
+    # numpy for the images, numba for a stack of them, which round some pixels differently
+    results = [
+        {"pixels": 32 * 32, "best": "numpy", "times": {"numpy": 1e-6}},
+        {"pixels": 1280 * 1024, "best": "numba", "times": {"numba": 1e-3}},
+    ]
+    calibration = {"results": {"color2gray": results, "color2sepia": results}}
+    monkeypatch.setattr(auto_filters, "_calibration", calibration)
+
+    images = [io.random_image(64, 64) for _ in range(32)]
+    results = service.filter_batch(images, "color2gray", "auto", 1, False)
+    for image, result in zip(images, results):
+        single = service.filter_batch([image], "color2gray", "auto", 1, False)[0]
+        np.testing.assert_array_equal(result, single)
+        np.testing.assert_array_equal(result, numpy_color2gray(image))
+
+def test_batcher():
+    images = [io.random_image(32, 24 + i) for i in range(12)]
+
+    async def run():
+        async with service.FilterBatcher("numba", workers=1, max_batch=8, max_wait=0.05) as batcher:
+            results = await asyncio.gather(*(batcher.submit(image, "color2gray") for image in images))
+            return results, batcher.metrics.summary(batcher.pending)
+
+    results, metrics = asyncio.run(run())
+    for image, result in zip(images, results):
+        np.testing.assert_array_equal(result, numba_color2gray(image))
+
+    # the concurrent requests are grouped into batches of at most 8
+    assert metrics["requests"] == len(images)
+    assert metrics["batches"] == 2
+    assert metrics["mean_batch_size"] == len(images) / 2
+    assert metrics["pending"] == 0
+    assert metrics["latency_ms"]["p50"] > 0
+    assert metrics["requests_per_s"] > 0
+
+
+def test_filter_bytes():
+    image = io.random_image(32, 24)
+    data = Pipeline().encode(image)
+
+    async def run():
+        async with service.FilterBatcher("numba", workers=1) as batcher:
+            filtered = await batcher.filter_bytes(data, "color2gray", single_channel=True)
+            with pytest.raises(ValueError):
+                await batcher.filter_bytes(b"not an image", "color2gray")
+            with pytest.raises(ValueError):
+                await batcher.filter_bytes(data, "color2blue")
+            with pytest.raises(ValueError):
+                await batcher.filter_bytes(data, "color2sepia", strength=2)
+            # JPEG has no alpha channel
+            rgba = Pipeline().encode(np.dstack([image, image[:, :, :1]]))
+            with pytest.raises(ValueError):
+                await batcher.filter_bytes(rgba, "color2sepia", format="JPEG")
+            with pytest.raises(ValueError):
+                await batcher.filter_bytes(data, "color2sepia", format="NOFORMAT")
+            # the decode and encode failures
+            assert batcher.metrics.errors == 3
+            return filtered
+
+    filtered = np.asarray(Image.open(BytesIO(asyncio.run(run()))))
+    np.testing.assert_array_equal(filtered, numba_color2gray(image, single_channel=True))
+
+
+def test_overloaded():
+    image = io.random_image(32, 24)
+
+    async def run():
+        async with service.FilterBatcher("numba", workers=1, max_pending=2) as batcher:
+            results = await asyncio.gather(
+                *(batcher.submit(image, "color2gray") for _ in range(5)), return_exceptions=True
+            )
+            return results, batcher.metrics.summary()
+
+    results, metrics = asyncio.run(run())
+    # the first two are admitted, the rest rejected without waiting
+    assert [isinstance(result, service.Overloaded) for result in results] == [False, False, True, True, True]
+    assert metrics["rejected"] == 3
+    assert metrics["requests"] == 2
+
+
+def test_app():
+    pytest.importorskip("fastapi")
+    from fastapi.testclient import TestClient
+
+    image = io.random_image(32, 24)
+    app = service.create_app(service.FilterBatcher("numba", workers=1))
+    with TestClient(app) as client:
+        response = client.post(
+            "/filter/color2sepia", params={"strength": 0.5}, files={"file": ("image.png", Pipeline().encode(image))}
+        )
+        assert response.status_code == 200
+        assert response.headers["content-type"] == "image/png"
+        np.testing.assert_array_equal(service.decode_image(response.content), numba_color2sepia(image, 0.5))
+
+        response = client.post("/filter/color2gray", files={"file": ("notes.txt", b"not an image")})
+        assert response.status_code == 400
+
+        rgba = Pipeline().encode(np.dstack([image, image[:, :, :1]]))
+        response = client.post("/filter/color2gray", params={"format": "jpeg"}, files={"file": ("image.png", rgba)})
+        assert response.status_code == 400
+
+        metrics = client.get("/metrics").json()
+        assert metrics["requests"] == 3
+        assert metrics["errors"] == 2
@@ -0,0 +1,109 @@
+import tracemalloc
+
+import numpy as np
+import pytest
+from in3110_instapy import get_filter, io
+from in3110_instapy.cli import main
+from in3110_instapy.tiles import BandReader, run_tiled
+from PIL import Image
+
+cases = [
+    ("color2gray", {}),
+    ("color2gray", {"single_channel": True}),
+    ("color2sepia", {"strength": 0.7}),
+    ("color2sepia", {"rescale": "channels"}),
+    ("blur", {"size": 5}),
+]
+
+
+@pytest.fixture(scope="module")
+def sources(tmp_path_factory):
+    """The same image as .npy, strip TIFF and PPM files"""
+    directory = tmp_path_factory.mktemp("sources")
+    # the pure python filters are slow
+    image = np.random.default_rng(0).integers(0, 255, size=(53, 41, 3), dtype=np.uint8)
+    io.write_image(image, directory / "image.npy")
+    tiff = io.create_image(directory / "image.tif", image.shape)
+    tiff[:] = image
+    tiff.flush()
+    Image.fromarray(image).save(directory / "image.ppm")
+    return image, directory
+
+
+@pytest.mark.parametrize("suffix", [".npy", ".tif", ".ppm"])
+@pytest.mark.parametrize("filter_name, options", cases)
+def test_same_as_whole_image(tmp_path, sources, load_filter, suffix, filter_name, options, implementation):
+    image, directory = sources
+    filter_function = load_filter(filter_name, implementation)
+    options = dict(options)
+    strength = options.pop("strength", 1)
+    expected = filter_function(image, k=strength, **options) if filter_name == "color2sepia" \
+        else filter_function(image, **options)
+
+    # bands that do not divide the image
+    filtered = run_tiled(directory / f"image{suffix}", tmp_path / "out.npy", implementation, filter_name,
+                         strength=strength, tile_rows=7, **options)
+    np.testing.assert_array_equal(filtered, expected)
+    np.testing.assert_array_equal(np.load(tmp_path / "out.npy"), expected)
+
+
+def test_band_reader(sources, tmp_path):
+    image, directory = sources
+    for suffix in [".npy", ".tif", ".ppm"]:
+        reader = BandReader(directory / f"image{suffix}")
+        assert reader.banded
+        assert reader.shape == image.shape and reader.dtype == np.uint8
+        np.testing.assert_array_equal(reader.read(10, 23), image[10:23])
+        # clipped to the image
+        np.testing.assert_array_equal(reader.read(-5, 100), image)
+
+    # compressed images are decoded whole
+    Image.fromarray(image).save(tmp_path / "image.png")
+    reader = BandReader(tmp_path / "image.png")
+    assert not reader.banded
+    np.testing.assert_array_equal(reader.read(10, 23), image[10:23])
+
+
+def test_tiff_output(sources, tmp_path):
+    image, directory = sources
+    run_tiled(directory / "image.tif", tmp_path / "sepia.tif", "numba", "color2sepia", tile_rows=10)
+    np.testing.assert_array_equal(io.read_image(tmp_path / "sepia.tif"), get_filter("color2sepia", "numba")(image))
+
+
+def test_uint16_rgba(tmp_path):
+    image = np.random.randint(0, 65535, size=(40, 30, 4), dtype=np.uint16)
+    io.write_image(image, tmp_path / "image.npy")
+    filtered = run_tiled(tmp_path / "image.npy", tmp_path / "out.npy", "numba", "color2sepia", tile_rows=9)
+    assert filtered.dtype == np.uint16
+    np.testing.assert_array_equal(filtered, get_filter("color2sepia", "numba")(image))
+
+
+def test_peak_memory(tmp_path):
+    # a 25 MB image, filtered in bands of 64 rows (400 kB, and a few float copies of a band)
+    height, width = 4096, 2048
+    io.create_image(tmp_path / "image.npy", (height, width, 3))[:] = 200
+    get_filter("color2sepia", "numba")(np.zeros((2, 2, 3), dtype=np.uint8))  # jit compile first
+
+    tracemalloc.start()
+    run_tiled(tmp_path / "image.npy", tmp_path / "out.npy", "numba", "color2sepia", tile_rows=64)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    assert peak < height * width * 3 / 4
+
+
+def test_errors(sources, tmp_path):
+    image, directory = sources
+    with pytest.raises(ValueError):
+        run_tiled(directory / "image.npy", tmp_path / "out.png", "numba")
+    with pytest.raises(ValueError):
+        run_tiled(directory / "image.npy", tmp_path / "out.npy", "numba", tile_rows=0)
+
+
+def test_cli(sources, tmp_path):
+    image, directory = sources
+    main([str(directory / "image.tif"), "-se", "-i", "numba", "-t", "8", "-o", str(tmp_path / "sepia.npy")])
+    np.testing.assert_array_equal(np.load(tmp_path / "sepia.npy"), get_filter("color2sepia", "numba")(image))
+
+    for argv in [["-t", "8"], ["-t", "0", "-o", "out.npy"], ["-t", "8", "-r", "-o", "out.npy"]]:
+        with pytest.raises(SystemExit):
+            main([str(directory / "image.tif"), "-g"] + argv)
@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+from in3110_instapy import io, video
+from in3110_instapy.numba_filters import numba_color2gray, numba_color2sepia
+from PIL import Image
+
+
+@pytest.fixture
+def frames():
+    return np.stack([io.random_image(48, 32) for _ in range(12)])
+
+
+def test_raw_stream(tmp_path, frames):
+    frames.tofile(tmp_path / "clip.raw")
+
+    fps = video.run_video(
+        tmp_path / "clip.raw", tmp_path / "sepia.raw", filter="color2sepia", strength=0.6, size=(48, 32), queue_size=2
+    )
+    assert fps > 0
+
+    # every frame is filtered, in order, through the reused buffers
+    out = np.fromfile(tmp_path / "sepia.raw", dtype=np.uint8).reshape(frames.shape)
+    for frame, filtered in zip(frames, out):
+        np.testing.assert_array_equal(filtered, numba_color2sepia(frame, 0.6))
+
+
+def test_image_frames(tmp_path, frames):
+    for i, frame in enumerate(frames):
+        io.write_image(frame, tmp_path / f"{i:03d}.png")
+
+    # a filter without an output buffer
+    video.run_video(tmp_path, tmp_path / "out", implementation="numpy", filter="color2gray", queue_size=1)
+
+    out_files = sorted((tmp_path / "out").iterdir())
+    assert len(out_files) == len(frames)
+    np.testing.assert_allclose(np.asarray(Image.open(out_files[-1])), numba_color2gray(frames[-1]), atol=1)
+
+
+def test_errors(tmp_path, frames):
+    with pytest.raises(ValueError):  # the size of a raw source is needed
+        video.run_video(tmp_path / "clip.raw", tmp_path / "out.raw")
+
+    # a truncated last frame
+    frames.tofile(tmp_path / "clip.raw")
+    with open(tmp_path / "clip.raw", "ab") as file:
+        file.write(b"123")
+    with pytest.raises(ValueError):
+        video.run_video(tmp_path / "clip.raw", tmp_path / "out.raw", size=(48, 32))
+
+    with pytest.raises(FileNotFoundError):
+        video.run_video(tmp_path / "missing", tmp_path / "out")
+
+
+def test_main(tmp_path, frames):
+    frames.tofile(tmp_path / "clip.rgb")
+    video.main([str(tmp_path / "clip.rgb"), "--size", "48x32", "-o", str(tmp_path / "gray.rgb"), "-g", "-l", "-i", "numba"])
+    out = np.fromfile(tmp_path / "gray.rgb", dtype=np.uint8).reshape(frames.shape[:3])
+    np.testing.assert_array_equal(out[3], numba_color2gray(frames[3], single_channel=True))